@@ -0,0 +1,180 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading admission limits from the environment
+import time  # For token buckets and queue wait times
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from metrics import CallbackMetric, register, admission_wait, admission_rejected  # For queue reporting
+
+# Step 1: Admission limits (per worker process)
+# Consultations beyond ADMISSION_MAX_CONCURRENT wait in a bounded queue. When the queue is
+# full, a client is over its rate limit, or a request would wait too long, it is rejected
+# immediately with a retry hint, so the requests that are admitted keep a predictable latency.
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "8"))  # Consultations running at once
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "16"))  # Consultations waiting for a slot
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", "15"))  # Longest wait before "busy"
+ADMISSION_CLIENT_RPM = float(os.environ.get("ADMISSION_CLIENT_RPM", "12"))  # Consultations per client per minute (0 = off)
+ADMISSION_CLIENT_BURST = int(os.environ.get("ADMISSION_CLIENT_BURST", "3"))  # Back-to-back submits allowed
+ADMISSION_TRUST_PROXY = os.environ.get("ADMISSION_TRUST_PROXY", "0") == "1"  # Use X-Forwarded-For as the client address
+
+MAX_TRACKED_CLIENTS = 10000  # Idle client buckets are dropped beyond this
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a consultation is not admitted.
+    Args:
+        reason (str): "queue_full", "rate_limited" or "timeout".
+        retry_after (float): Suggested seconds before retrying.
+    """
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = max(1, int(round(retry_after)))
+        super().__init__(f"Request rejected ({reason}); retry in {self.retry_after}s")
+
+
+def client_address(request):
+    """
+    Returns the address used for per-client rate limits: the first X-Forwarded-For hop when
+    ADMISSION_TRUST_PROXY=1 (behind serve.py or another proxy), else the socket peer.
+    """
+    if request is None:
+        return "-"
+    if ADMISSION_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = getattr(request, "client", None)
+    return getattr(client, "host", None) or "-"
+
+
+# Step 2: Admission controller
+class AdmissionController:
+    """
+    Bounded admission queue with per-client token buckets, for one event loop.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_MAX_QUEUE,
+                 max_wait=ADMISSION_MAX_WAIT_SECONDS, client_rpm=ADMISSION_CLIENT_RPM, client_burst=ADMISSION_CLIENT_BURST):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.client_rpm = client_rpm
+        self.client_burst = max(1, client_burst)
+        self._semaphore = None
+        self._loop = None
+        self._clients = {}  # client -> (tokens, last refill)
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.avg_service_seconds = 5.0  # EWMA of time in the pipeline, for retry hints
+
+    def _slots(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio primitives belong to one event loop; rebuild them for a new loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        return self._semaphore
+
+    def _take_client_token(self, client):
+        """
+        Takes one token from the client's bucket; returns 0, or the seconds until a token is available.
+        """
+        if not self.client_rpm:
+            return 0.0
+        now = time.monotonic()
+        rate = self.client_rpm / 60
+        tokens, last = self._clients.get(client, (self.client_burst, now))
+        tokens = min(self.client_burst, tokens + (now - last) * rate)
+        if tokens < 1:
+            self._clients[client] = (tokens, now)
+            return (1 - tokens) / rate
+        self._clients[client] = (tokens - 1, now)
+        if len(self._clients) > MAX_TRACKED_CLIENTS:
+            idle = self.client_burst / rate  # A bucket idle this long is full again
+            self._clients = {c: v for c, v in self._clients.items() if now - v[1] < idle}
+        return 0.0
+
+    def _reject(self, reason, retry_after, client):
+        admission_rejected.inc(reason=reason)
+        logging.warning(f"Rejected a consultation from {client}: {reason} (waiting {self.waiting}, in flight {self.in_flight}).")
+        raise AdmissionRejected(reason, retry_after)
+
+    def queue_full(self):
+        # Waiters that are about to take a free slot count too, so a burst cannot overshoot the queue
+        return self.waiting + self.in_flight >= self.max_concurrent + self.max_queue
+
+    @asynccontextmanager
+    async def admit(self, client="-"):
+        """
+        Waits for a consultation slot and holds it for the duration of the block.
+        Raises:
+            AdmissionRejected: Immediately if the client is over its rate limit or the queue is
+                full, or after max_wait seconds without a free slot.
+        """
+        semaphore = self._slots()
+        # Capacity first: a request turned away because the queue is full must not use up
+        # the client's allowance
+        if self.queue_full():
+            self._reject("queue_full", self.avg_service_seconds * (self.waiting + 1) / self.max_concurrent, client)
+        delay = self._take_client_token(client)
+        if delay:
+            self._reject("rate_limited", delay, client)
+
+        enqueued = time.monotonic()
+        self.waiting += 1
+        acquire = asyncio.ensure_future(semaphore.acquire())
+        try:
+            done, _ = await asyncio.wait({acquire}, timeout=self.max_wait)
+        except BaseException:  # Client disconnected while waiting
+            if not acquire.cancel():
+                semaphore.release()
+            raise
+        finally:
+            self.waiting -= 1
+        if not done:
+            if not acquire.cancel():
+                semaphore.release()  # Acquired at the last moment; give the slot back
+            self._reject("timeout", self.avg_service_seconds, client)
+
+        wait_seconds = time.monotonic() - enqueued
+        admission_wait.observe(wait_seconds)
+        self.in_flight += 1
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield wait_seconds
+        finally:
+            self.in_flight -= 1
+            self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * (time.monotonic() - started)
+            semaphore.release()
+
+    def snapshot(self):
+        return {
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "avg_service_seconds": round(self.avg_service_seconds, 2),
+            "saturated": self.queue_full(),
+        }
+
+
+# Shared controller for the web app's submit handler
+admission = AdmissionController()
+
+register(CallbackMetric(
+    "voicebot_admission_queue_depth", "Consultations waiting for an admission slot.",
+    lambda: [({}, admission.waiting)],
+))
+register(CallbackMetric(
+    "voicebot_admission_in_flight", "Consultations currently admitted.",
+    lambda: [({}, admission.in_flight)],
+))
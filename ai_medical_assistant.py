@@ -1,30 +1,28 @@
 # Import necessary libraries
 from dotenv import load_dotenv 
-import os  
-import base64  # For encoding images into base64 format
 
 # Load environment variables from a .env file (if present)
 load_dotenv()
 
 # Step 1: Setup GROQ API key
-# Retrieve API key
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    print("ERROR: GROQ_API_KEY is missing. Please check your .env file.")
-    exit(1)
-else:
-    print("GROQ API Key successfully loaded.")
+# The key is read from GROQ_API_KEY when the first client is created (see provider_clients.py),
+# so importing this module has no side effects; the app checks the key at startup.
 
 # Step 2: Convert image to required format
-# Function to encode an image file into base64 format.
-# This is necessary because the Groq API expects images in base64-encoded format.
+# Images are oriented, downscaled and re-encoded before upload (see image_preprocessing.py).
+# This keeps the base64 payload small and labels it with the correct MIME type.
+from image_preprocessing import prepare_image
+
 def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        # Read the file content, encode it in base64, and decode it to a UTF-8 string.
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    """
+    Preprocesses an image and returns its base64-encoded payload.
+    Use prepare_image() directly when the MIME type is also needed.
+    """
+    return prepare_image(image_path).data
 
 # Step 3: Setup Multimodal LLM
-from groq import Groq
+from provider_clients import get_groq_client, get_async_groq_client  # Shared, pooled Groq clients
+from scheduler import scheduler  # Per-provider concurrency and rate limits for async calls
 
 # Define a query for the AI model to analyze the image.
 # This query will guide the model on what to look for in the image.
@@ -33,15 +31,10 @@ query = "Is there something wrong with my face?"
 # Specify the model to use for the analysis.
 model = "llama-3.2-90b-vision-preview"
 
-# Function to analyze an image with a given query.
-# This function sends a request to the Groq API with the query and the encoded image.
-def analyze_image_with_query(query, model, encoded_image):
-    # Initialize the Groq client with the API key.
-    client = Groq(api_key=GROQ_API_KEY)  # Pass the API key here
-    
-    # Prepare the messages payload for the API request.
-    # The payload includes both text (query) and image data (base64-encoded image).
-    messages = [
+# Function to build the messages payload for the API request.
+# The payload includes both text (query) and image data (base64-encoded image).
+def build_image_messages(query, encoded_image, mime_type="image/jpeg"):
+    return [
         {
             "role": "user",  # Indicates that this message is from the user.
             "content": [
@@ -52,30 +45,61 @@ def analyze_image_with_query(query, model, encoded_image):
                 {
                     "type": "image_url",  # The second part of the message is the image data.
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{encoded_image}",  # Base64-encoded image URL.
+                        "url": f"data:{mime_type};base64,{encoded_image}",  # Base64-encoded image URL.
                     },
                 },
             ],
         }
     ]
+
+# Function to analyze an image with a given query.
+# This function sends a request to the Groq API with the query and the encoded image.
+def analyze_image_with_query(query, model, encoded_image, mime_type="image/jpeg"):
+    # Reuse the process-wide Groq client (keep-alive connection pool).
+    client = get_groq_client()
     
     # Send the chat completion request to the Groq API.
     chat_completion = client.chat.completions.create(
-        messages=messages,  # Pass the prepared messages payload.
+        messages=build_image_messages(query, encoded_image, mime_type),  # Pass the prepared messages payload.
         model=model  # Specify the model to use for processing.
     )
     
     # Extract and return the model's response.
     return chat_completion.choices[0].message.content
 
+# Function to analyze an image and stream the response as it is generated.
+# Yields text fragments (tokens) as soon as the Groq API sends them.
+def stream_image_analysis(query, model, encoded_image, mime_type="image/jpeg"):
+    client = get_groq_client()
+
+    stream = client.chat.completions.create(
+        messages=build_image_messages(query, encoded_image, mime_type),
+        model=model,
+        stream=True  # Receive the response token by token
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+# Async version of analyze_image_with_query using the shared AsyncGroq client.
+# Calls are queued through the per-provider scheduler.
+async def analyze_image_with_query_async(query, model, encoded_image, mime_type="image/jpeg"):
+    client = get_async_groq_client()
+
+    chat_completion = await scheduler.run("groq_vision", lambda: client.chat.completions.create(
+        messages=build_image_messages(query, encoded_image, mime_type),
+        model=model
+    ))
+    return chat_completion.choices[0].message.content
+
 # Main Execution Block
 if __name__ == "__main__":
     image_path = "acne.webp"  
     
-    # Encode the image into base64 format
+    # Preprocess and encode the image into base64 format
     try:
-        encoded_image = encode_image(image_path)
-        print("Image successfully encoded.")
+        prepared_image = prepare_image(image_path)
+        print(f"Image successfully encoded ({prepared_image.original_bytes} -> {prepared_image.encoded_bytes} bytes).")
     except FileNotFoundError:
         print(f"Error: The image file '{image_path}' was not found.")
         exit(1)
@@ -85,7 +109,7 @@ if __name__ == "__main__":
     
     # Analyze the image with the query
     try:
-        response = analyze_image_with_query(query, model, encoded_image)
+        response = analyze_image_with_query(query, model, prepared_image.data, prepared_image.mime_type)
         print("Response from the model:")
         print(response)
     except Exception as e:
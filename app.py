@@ -3,92 +3,42 @@ load_dotenv()  # Load environment variables
 
 # VoiceBot UI with Gradio
 import os  # For interacting with the operating system
+import uuid  # For session affinity cookies
+import asyncio  # For finishing live transcription off the event loop
+import threading  # For prewarming the TTS cache in the background
 import gradio as gr  # For creating the user interface
+from starlette.concurrency import iterate_in_threadpool  # For streaming a sync generator from an async handler
+from fastapi import FastAPI  # For serving /metrics next to the Gradio UI
+from fastapi.responses import PlainTextResponse, JSONResponse
 
 # Import custom modules
-from ai_medical_assistant import encode_image, analyze_image_with_query  # For image encoding and analysis
-from patient_query import record_audio, transcribe_with_groq  # For audio recording and transcription
-from doctor_voice_tts import text_to_speech_with_gtts, text_to_speech_with_elevenlabs  # For text-to-speech conversion
-
-
-# Step 1: Define System Prompt
-# This prompt guides the AI model to act like a professional doctor.
-system_prompt = """You have to act as a professional doctor. Keep in mind this is for learning purposes only. 
-                Do not add any numbers or special characters in your response. Your response should be in one long paragraph.
-                Always answer as if you are addressing a real person. Mimic an actual doctor's tone, not an AI bot.
-                If you make a differential diagnosis, suggest some remedies. Start your response immediately without preamble.
-                Example: "With what I see, I think you might have... Here are some remedies..." 
-                Keep your answer concise (maximum 2 sentences)."""
-
-# Step 2: Main Function to Process Inputs
-def process_inputs(audio_filepath, image_filepath):
-    """
-    Processes audio and image inputs, generates a doctor's response, and converts it to speech.
-    
-    Args:
-        audio_filepath (str): Path to the recorded audio file.
-        image_filepath (str): Path to the uploaded image file.
-    
-    Returns:
-        str: Transcribed text from the audio.
-        str: Doctor's response based on the analysis.
-        str: Path to the generated audio file (Doctor's voice).
-    """
-    # Initialize outputs
-    speech_to_text_output = "No audio provided."
-    doctor_response = "No analysis performed."
-    temp_audio_file = None
-
-    try:
-        # Step 2a: Convert Audio to Text (Speech-to-Text)
-        if audio_filepath:
-            print("Transcribing audio...")
-            speech_to_text_output = transcribe_with_groq(
-                GROQ_API_KEY=os.environ.get("GROQ_API_KEY"),  # Retrieve API key
-                audio_filepath=audio_filepath,
-                stt_model="whisper-large-v3"
-            )
-            print(f"Transcription complete: {speech_to_text_output}")
-        else:
-            speech_to_text_output = "No audio provided."
-    except Exception as e:
-        print(f"Error during transcription: {e}")
-        speech_to_text_output = "An error occurred while transcribing the audio."
-
-    try:
-        # Step 2b: Analyze Image (if provided)
-        if image_filepath:
-            print("Analyzing image...")
-            doctor_response = analyze_image_with_query(
-                query=system_prompt + speech_to_text_output,  # Combine system prompt with transcription
-                encoded_image=encode_image(image_filepath),  # Encode the image into base64
-                model="llama-3.2-11b-vision-preview"
-            )
-            print(f"Doctor's response: {doctor_response}")
-        else:
-            doctor_response = "No image provided for analysis."
-    except Exception as e:
-        print(f"Error during image analysis: {e}")
-        doctor_response = "An error occurred while analyzing the image."
-
-    try:
-        # Step 2c: Convert Doctor's Response to Speech (Text-to-Speech)
-        print("Generating doctor's voice...")
-        temp_audio_file = "temp_output.mp3"  # Temporary audio file
-        text_to_speech_with_elevenlabs(
-            input_text=doctor_response,
-            output_filepath=temp_audio_file
-        )
-        print("Voice generation complete.")
-    except Exception as e:
-        print(f"Error during voice generation: {e}")
-        temp_audio_file = None
-
-    return speech_to_text_output, doctor_response, temp_audio_file
-
-
-# Step 3: Create Gradio Interface with Enhanced UI
-with gr.Blocks(theme=gr.themes.Default(primary_hue="green", secondary_hue="gray")) as demo:
+# The consultation pipeline (speech-to-text, image analysis, text-to-speech). The pipeline used to
+# live in this module, so its functions are re-exported for callers that import them from app.
+from consultation import (  # noqa: F401
+    system_prompt, FALLBACK_MESSAGES, check_configuration,
+    run_consultation, process_inputs, run_consultation_async, process_inputs_async, process_inputs_streaming
+)
+from live_transcription import LiveTranscription  # For transcribing while the patient speaks
+from conversation import ConsultationSession, session_registry, SESSION_IDLE_SECONDS  # For follow-up questions
+from doctor_voice_tts import prewarm_tts_cache  # For synthesizing fallback messages at startup
+from local_models import load_local_models  # For loading optional on-CPU models at startup
+from metrics import render_metrics, configure_logging  # For the /metrics endpoint and trace-tagged logs
+from admission import admission, AdmissionRejected, client_address  # For backpressure under overload
+
+
+# Step 4: Create Gradio Interface with Enhanced UI
+# Requests keep their audio in memory and share no files, so they can safely run in parallel.
+CONCURRENCY_LIMIT = int(os.environ.get("GRADIO_CONCURRENCY_LIMIT", "8"))
+GRADIO_CACHE_SWEEP_SECONDS = int(os.environ.get("GRADIO_CACHE_SWEEP_SECONDS", "600"))
+GRADIO_CACHE_MAX_AGE_SECONDS = int(os.environ.get("GRADIO_CACHE_MAX_AGE_SECONDS", "3600"))
+LIVE_TRANSCRIPTION = os.environ.get("LIVE_TRANSCRIPTION", "1") == "1"  # Transcribe while the patient speaks
+LIVE_STREAM_EVERY = float(os.environ.get("LIVE_STREAM_EVERY", "0.5"))  # Seconds of audio per streamed window
+
+# Gradio copies returned audio into its own cache; delete_cache keeps that bounded as well.
+with gr.Blocks(
+    theme=gr.themes.Default(primary_hue="green", secondary_hue="gray"),
+    delete_cache=(GRADIO_CACHE_SWEEP_SECONDS, GRADIO_CACHE_MAX_AGE_SECONDS)
+) as demo:
     # Heading Section
     with gr.Row():
         gr.Markdown("""
@@ -108,27 +58,110 @@ with gr.Blocks(theme=gr.themes.Default(primary_hue="green", secondary_hue="gray"
             width=200,   # Width set to 200px
             scale=True   # Ensures the image fits within the container
         )
-        audio_input = gr.Audio(label="Record Your Voice", sources=["microphone"], type="filepath")
+        if LIVE_TRANSCRIPTION:
+            # Microphone audio is streamed in windows and transcribed while the patient speaks
+            audio_input = gr.Audio(label="Record Your Voice", sources=["microphone"], type="numpy", streaming=True)
+        else:
+            audio_input = gr.Audio(label="Record Your Voice", sources=["microphone"], type="filepath")
+    live_state = gr.State(None)  # The LiveTranscription of the current recording
+    # Conversation memory of this tab (image and earlier turns). Gradio deletes it when the tab
+    # closes or after SESSION_IDLE_SECONDS without a submit; the registry then forgets it too.
+    session_state = gr.State(None, time_to_live=SESSION_IDLE_SECONDS, delete_callback=session_registry.discard)
 
     with gr.Row():
+        stream_checkbox = gr.Checkbox(label="Stream the response (faster first audio)", value=True)
         submit_button = gr.Button("Submit", variant="primary")
+        new_consultation_button = gr.Button("New consultation")
 
     with gr.Column():
         speech_to_text_output = gr.Textbox(label="🎤 Speech to Text", lines=3)
         doctor_response_output = gr.Textbox(label="🩺 Doctor's Response", lines=5)
-        doctor_voice_output = gr.Audio(label="🎧 Doctor's Voice", autoplay=False)  # Autoplay disabled initially
-
-    def on_submit(audio_filepath, image_filepath):
-        # Process inputs
-        speech_to_text_output, doctor_response, temp_audio_file = process_inputs(audio_filepath, image_filepath)
+        doctor_voice_output = gr.Audio(
+            label="🎧 Doctor's Voice",
+            streaming=True,  # Audio chunks are appended as they are generated
+            autoplay=True    # Start playing the first sentence as soon as it arrives
+        )
 
-        # Return outputs
-        return speech_to_text_output, doctor_response, temp_audio_file
+    # Live transcription: every window goes to the LiveTranscription of the recording, and the
+    # partial transcript is shown while the patient is still speaking.
+    def on_start_recording():
+        return LiveTranscription(), ""
+
+    def on_audio_window(audio_window, live):
+        if audio_window is None:
+            return live, gr.skip()
+        live = live or LiveTranscription()
+        sample_rate, samples = audio_window
+        live.add_audio(samples, sample_rate)
+        return live, live.partial_transcript()
+
+    def on_stop_recording(live):
+        if live is None:
+            return gr.skip()
+        return live.finish()
+
+    def on_clear_recording():
+        return None, ""
+
+    if LIVE_TRANSCRIPTION:
+        audio_input.start_recording(on_start_recording, None, [live_state, speech_to_text_output], concurrency_limit=None)
+        audio_input.stream(
+            on_audio_window, [audio_input, live_state], [live_state, speech_to_text_output],
+            stream_every=LIVE_STREAM_EVERY, concurrency_limit=None
+        )
+        audio_input.stop_recording(on_stop_recording, [live_state], [speech_to_text_output], concurrency_limit=None)
+        audio_input.clear(on_clear_recording, None, [live_state, speech_to_text_output], concurrency_limit=None)
+
+    async def on_submit(audio_value, live, session, image_filepath, stream_response, request: gr.Request):
+        # Admission control: wait in a bounded queue for a consultation slot, or get a fast
+        # "busy" answer instead of piling up behind slow upstream calls.
+        try:
+            async with admission.admit(client_address(request)):
+                async for outputs in consult(audio_value, live, session, image_filepath, stream_response):
+                    yield outputs
+        except AdmissionRejected as e:
+            raise gr.Error(f"The doctor is busy right now. Please try again in {e.retry_after} seconds.",
+                           title="Busy", duration=e.retry_after + 5)
+
+    async def consult(audio_value, live, session, image_filepath, stream_response):
+        session = session or ConsultationSession()
+        transcript = None
+        audio_filepath = audio_value if isinstance(audio_value, str) else None
+        if live is not None:
+            # Usually already finished by stop_recording; otherwise waits for the last segment.
+            # The transcript replaces the recording, so nothing is written to disk.
+            transcript = await asyncio.to_thread(live.finish)
+
+        if not stream_response:
+            # Process inputs on the event loop and return all outputs at once
+            speech_to_text, doctor_response, doctor_voice = await process_inputs_async(
+                audio_filepath, image_filepath, transcript, session)
+            yield speech_to_text, doctor_response, doctor_voice if doctor_voice else gr.skip(), session, None
+            return
+
+        # Push text and audio to the UI progressively (the streaming pipeline runs in a worker thread)
+        async for speech_to_text, doctor_response, audio_chunk in iterate_in_threadpool(
+            process_inputs_streaming(audio_filepath, image_filepath, transcript, session)
+        ):
+            yield speech_to_text, doctor_response, audio_chunk if audio_chunk else gr.skip(), session, None
 
     submit_button.click(
         fn=on_submit,
-        inputs=[audio_input, image_input],  # Use Gradio components here
-        outputs=[speech_to_text_output, doctor_response_output, doctor_voice_output]
+        inputs=[audio_input, live_state, session_state, image_input, stream_checkbox],  # Use Gradio components here
+        # live_state is reset, so a follow-up without a new recording does not resend this question
+        outputs=[speech_to_text_output, doctor_response_output, doctor_voice_output, session_state, live_state],
+        concurrency_limit=None  # Bounded by the admission queue instead of Gradio's queue
+    )
+
+    def on_new_consultation(session):
+        # Forget the image and earlier turns; the next submit starts a fresh conversation
+        if session is not None:
+            session.clear()
+        return session, None, "", ""
+
+    new_consultation_button.click(
+        on_new_consultation, [session_state],
+        [session_state, image_input, speech_to_text_output, doctor_response_output], concurrency_limit=None
     )
 
     # Disclaimer Section at the End
@@ -141,9 +174,49 @@ with gr.Blocks(theme=gr.themes.Default(primary_hue="green", secondary_hue="gray"
         </div>
         """)
 
-# Step 4: Launch the Interface
+# Step 5: Launch the Interface
+# The Gradio UI is mounted on a FastAPI app so /metrics is served from the same server.
+AFFINITY_COOKIE = "voicebot_affinity"  # Keeps a browser on one worker (see serve.py)
+
+
+def create_app():
+    """
+    Builds the FastAPI app serving the Gradio UI at /, Prometheus metrics at /metrics
+    and a readiness check at /healthz.
+    """
+    fastapi_app = FastAPI()
+
+    @fastapi_app.middleware("http")
+    async def affinity_cookie(request, call_next):
+        # Gradio keeps queue and session state in the worker process, so every request of a
+        # browser must reach the same worker. A load balancer can hash this cookie.
+        response = await call_next(request)
+        if AFFINITY_COOKIE not in request.cookies:
+            response.set_cookie(AFFINITY_COOKIE, uuid.uuid4().hex, httponly=True, samesite="lax")
+        return response
+
+    @fastapi_app.get("/metrics")
+    def metrics_endpoint():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    @fastapi_app.get("/healthz")
+    def health_endpoint():
+        # 503 while the admission queue is full, so a load balancer can send new users elsewhere
+        state = admission.snapshot()
+        return JSONResponse(state, status_code=503 if state["saturated"] else 200)
+
+    demo.queue(default_concurrency_limit=CONCURRENCY_LIMIT)
+    return gr.mount_gradio_app(fastapi_app, demo, path="/")
+
 # if __name__ == "__main__":
 #     demo.launch(debug=True, share=True)
 
 if __name__ == "__main__":
-    demo.launch(server_name="0.0.0.0", server_port=7860)
\ No newline at end of file
+    import uvicorn  # For running the combined app
+
+    configure_logging()
+    check_configuration()  # Fail fast on missing API keys at startup, not at import
+    # Synthesize the fixed fallback messages in the background so they never cost a live TTS call
+    threading.Thread(target=prewarm_tts_cache, args=(FALLBACK_MESSAGES,), daemon=True).start()
+    threading.Thread(target=load_local_models, daemon=True, name="local-models").start()
+    uvicorn.run(create_app(), host="0.0.0.0", port=7860)
\ No newline at end of file
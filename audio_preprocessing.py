@@ -0,0 +1,222 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading preprocessing settings from the environment
+import io  # For encoding audio in memory
+import logging
+from collections import namedtuple
+
+import numpy as np  # For frame energies (voice activity detection) and gain
+
+from metrics import payload_bytes  # For before/after upload sizes
+
+# Step 1: Preprocessing settings
+# Whisper resamples everything to 16 kHz mono internally, so uploading a 44.1/48 kHz
+# stereo WAV only costs bandwidth. Leading/trailing silence costs upload time and
+# invites hallucinated words.
+AUDIO_PREPROCESSING_ENABLED = os.environ.get("AUDIO_PREPROCESSING_ENABLED", "1") == "1"
+AUDIO_SAMPLE_RATE = int(os.environ.get("AUDIO_SAMPLE_RATE", "16000"))
+AUDIO_FORMAT = os.environ.get("AUDIO_FORMAT", "flac").lower()  # flac or wav
+AUDIO_SILENCE_DBFS = float(os.environ.get("AUDIO_SILENCE_DBFS", "-45"))  # Frames quieter than this are silence
+AUDIO_VAD_FRAME_MS = int(os.environ.get("AUDIO_VAD_FRAME_MS", "30"))
+AUDIO_VAD_PADDING_MS = int(os.environ.get("AUDIO_VAD_PADDING_MS", "250"))  # Kept around detected speech
+AUDIO_TARGET_PEAK_DBFS = float(os.environ.get("AUDIO_TARGET_PEAK_DBFS", "-1"))
+AUDIO_MAX_GAIN_DB = float(os.environ.get("AUDIO_MAX_GAIN_DB", "20"))  # Avoid amplifying pure noise
+AUDIO_MAX_CHUNK_SECONDS = float(os.environ.get("AUDIO_MAX_CHUNK_SECONDS", "600"))  # Kept well under the upload limit
+AUDIO_SPLIT_SEARCH_SECONDS = 30.0  # Window before the chunk limit searched for the quietest cut point
+
+MIME_TYPES = {"flac": "audio/flac", "wav": "audio/wav"}
+
+# Result of preprocessing one recording. `chunks` is a list of (file name, bytes)
+# ready for upload; it is empty when the recording contains no speech.
+PreparedAudio = namedtuple(
+    "PreparedAudio",
+    ["chunks", "mime_type", "original_bytes", "encoded_bytes", "original_seconds", "speech_seconds"],
+)
+
+
+# Step 2: Signal helpers (also used by live_transcription.py)
+def frame_dbfs(samples, frame_length):
+    """
+    Returns the RMS level of each frame in dBFS for int16 mono samples.
+    """
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.full(1, -np.inf)
+    frames = samples[:frame_count * frame_length].astype(np.float64).reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1)) / 32768.0
+    with np.errstate(divide="ignore"):
+        return 20 * np.log10(rms)
+
+
+def speech_bounds(levels):
+    """
+    Energy-based voice activity detection: returns the first and last speech frame, or None.
+    The threshold adapts to the background noise so a noisy room is not mistaken for speech.
+    """
+    finite = levels[np.isfinite(levels)]
+    if finite.size == 0:
+        return None
+    noise_floor = np.percentile(finite, 10)
+    # Capped so a buffer with no pauses at all (continuous speech) is not mistaken for noise
+    threshold = max(AUDIO_SILENCE_DBFS, min(noise_floor + 10, -30))
+    speech = np.flatnonzero(levels > threshold)
+    if speech.size == 0:
+        return None
+    return speech[0], speech[-1]
+
+
+def _normalize(samples):
+    """
+    Scales the samples so the peak reaches AUDIO_TARGET_PEAK_DBFS, with bounded gain.
+    """
+    peak = np.max(np.abs(samples.astype(np.int32))) if samples.size else 0
+    if peak == 0:
+        return samples
+    gain_db = AUDIO_TARGET_PEAK_DBFS - 20 * np.log10(peak / 32768.0)
+    gain_db = min(gain_db, AUDIO_MAX_GAIN_DB)
+    if abs(gain_db) < 0.5:
+        return samples
+    scaled = samples.astype(np.float64) * (10 ** (gain_db / 20))
+    return np.clip(np.round(scaled), -32768, 32767).astype(np.int16)
+
+
+def _split_points(levels, frame_ms, max_frames):
+    """
+    Chooses chunk boundaries (in frames) at the quietest frame before each chunk limit.
+    """
+    search = max(1, int(AUDIO_SPLIT_SEARCH_SECONDS * 1000 / frame_ms))
+    points = [0]
+    while len(levels) - points[-1] > max_frames:
+        end = points[-1] + max_frames
+        window_start = max(points[-1] + 1, end - search)
+        points.append(window_start + int(np.argmin(levels[window_start:end])))
+    points.append(len(levels))
+    return points
+
+
+def encode_samples(samples, sample_rate, audio_format):
+    """
+    Encodes int16 mono samples. FLAC uses the encoder bundled with SpeechRecognition,
+    so no ffmpeg install is needed.
+    """
+    if audio_format == "flac":
+        import speech_recognition as sr
+
+        return sr.AudioData(samples.tobytes(), sample_rate, 2).get_flac_data()
+    import wave
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+# Step 3: Preprocessing pipeline
+# Container signatures, so in-memory recordings get a file name Whisper can use for the format
+AUDIO_SIGNATURES = ((b"RIFF", "wav"), (b"fLaC", "flac"), (b"OggS", "ogg"), (b"ID3", "mp3"), (b"\x1aE\xdf\xa3", "webm"))
+
+
+def read_audio(audio, name=None):
+    """
+    Reads a recording given as a file path, bytes or a binary file-like object.
+    Returns:
+        tuple: (file name, bytes). In-memory audio is named after its detected container.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        with open(audio, "rb") as audio_file:
+            return name or os.path.basename(audio), audio_file.read()
+    raw = bytes(audio) if isinstance(audio, (bytes, bytearray, memoryview)) else audio.read()
+    if name is None:
+        extension = next((ext for magic, ext in AUDIO_SIGNATURES if raw.startswith(magic)), None)
+        if extension is None:
+            extension = "mp3" if raw[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2") else "wav"
+        name = getattr(audio, "name", None) or f"recording.{extension}"
+    return os.path.basename(name), raw
+
+
+def prepare_audio(audio, audio_format=None, max_chunk_seconds=None):
+    """
+    Trims silence, downmixes to 16 kHz mono, normalizes loudness and encodes a recording
+    for Whisper. Long recordings are split at silence into chunks that can be
+    transcribed in parallel.
+    Args:
+        audio (str | bytes | file-like): The recording, as a path or in memory.
+        audio_format (str): Output format, "flac" or "wav".
+        max_chunk_seconds (float): Longest chunk sent in a single request.
+    Returns:
+        PreparedAudio: Upload chunks, MIME type, and before/after sizes and durations.
+    """
+    audio_format = (audio_format or AUDIO_FORMAT).lower()
+    max_chunk_seconds = max_chunk_seconds or AUDIO_MAX_CHUNK_SECONDS
+    if audio_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+
+    name, raw = read_audio(audio)
+    original = PreparedAudio(
+        chunks=[(name, raw)],
+        mime_type=None,
+        original_bytes=len(raw),
+        encoded_bytes=len(raw),
+        original_seconds=None,
+        speech_seconds=None,
+    )
+    if not AUDIO_PREPROCESSING_ENABLED:
+        return original
+
+    try:
+        from pydub import AudioSegment  # WAV is decoded natively; other formats need ffmpeg
+
+        is_wav = raw[:4] == b"RIFF" and raw[8:12] == b"WAVE"
+        segment = AudioSegment.from_file(io.BytesIO(raw), format="wav" if is_wav else None)
+    except Exception as e:
+        logging.warning(f"Could not decode {name} for preprocessing, uploading it unchanged: {e}")
+        return original
+
+    segment = segment.set_channels(1).set_frame_rate(AUDIO_SAMPLE_RATE).set_sample_width(2)
+    samples = np.frombuffer(segment.raw_data, dtype=np.int16)
+    original_seconds = len(samples) / AUDIO_SAMPLE_RATE
+
+    frame_length = AUDIO_SAMPLE_RATE * AUDIO_VAD_FRAME_MS // 1000
+    levels = frame_dbfs(samples, frame_length)
+    bounds = speech_bounds(levels)
+    if bounds is None:
+        logging.info("No speech detected in the recording.")
+        return original._replace(chunks=[], encoded_bytes=0, original_seconds=original_seconds, speech_seconds=0.0)
+
+    padding = AUDIO_VAD_PADDING_MS // AUDIO_VAD_FRAME_MS
+    first, last = max(0, bounds[0] - padding), min(len(levels), bounds[1] + 1 + padding)
+    samples = _normalize(samples[first * frame_length:last * frame_length])
+    levels = levels[first:last]
+
+    max_frames = max(1, int(max_chunk_seconds * 1000 / AUDIO_VAD_FRAME_MS))
+    points = _split_points(levels, AUDIO_VAD_FRAME_MS, max_frames)
+    stem = os.path.splitext(name)[0]
+    chunks = [
+        (f"{stem}_{index}.{audio_format}", encode_samples(samples[start * frame_length:end * frame_length], AUDIO_SAMPLE_RATE, audio_format))
+        for index, (start, end) in enumerate(zip(points, points[1:]))
+    ]
+    encoded_bytes = sum(len(data) for _, data in chunks)
+
+    if len(chunks) == 1 and encoded_bytes >= len(raw):
+        # Already compact (e.g. a short compressed upload); keep the original.
+        return original._replace(original_seconds=original_seconds, speech_seconds=len(samples) / AUDIO_SAMPLE_RATE)
+
+    payload_bytes.observe(encoded_bytes, kind="audio_encoded")
+    return PreparedAudio(
+        chunks=chunks,
+        mime_type=MIME_TYPES[audio_format],
+        original_bytes=len(raw),
+        encoded_bytes=encoded_bytes,
+        original_seconds=original_seconds,
+        speech_seconds=len(samples) / AUDIO_SAMPLE_RATE,
+    )
+
+
+# Example usage (uncomment to test)
+# prepared = prepare_audio("patient_voice_test_for_patient.mp3")
+# print(len(prepared.chunks), prepared.original_bytes, prepared.encoded_bytes, prepared.speech_seconds)
@@ -0,0 +1,430 @@
+"""
+Batch (offline) consultations over a JSONL manifest or a directory of recorded cases.
+
+Each case runs through the same stages as the web app (transcribe, encode, analyze,
+speak). Results are appended to a JSONL file as soon as each case finishes, and that
+file doubles as the checkpoint: re-running the same command skips finished cases.
+
+Manifest lines (paths are relative to the manifest):
+    {"id": "case-001", "audio": "cases/001.wav", "image": "cases/001.jpg"}
+    {"id": "case-002", "image": "cases/002.png", "transcript": "Is this rash contagious?"}
+A directory is read as cases grouped by file name (001.wav + 001.jpg -> case "001").
+
+Usage:
+    python batch_consultation.py cases.jsonl --output results.jsonl --workers 8
+    python batch_consultation.py cases/ --output results.jsonl --skip-tts
+    python batch_consultation.py cases.jsonl --output results.jsonl --groq-batch
+"""
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For resolving case paths
+import io  # For uploading the batch file from memory
+import json  # For manifests, results and batch files
+import time  # For polling the batch job
+import logging
+import argparse
+import threading  # For serializing result writes
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from consultation import (  # The same stages and settings as the web app
+    build_consultation_stages, record_run_metrics, system_prompt, VISION_MODEL, NO_IMAGE_MESSAGE,
+    ANALYSIS_ERROR_MESSAGE
+)
+from stage_graph import run_stages  # For running one case's stages concurrently
+from ai_medical_assistant import build_image_messages  # For batch request bodies
+from doctor_voice_tts import text_to_speech  # For speech after a Groq batch
+from provider_clients import get_groq_client  # For the files and batches endpoints
+from response_cache import response_cache, prompt_version  # For tagging results with the prompt they used
+from metrics import new_trace_id, configure_logging  # For per-case trace IDs
+from local_models import load_local_models  # For loading optional on-CPU models before the run
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".flac", ".ogg", ".m4a", ".webm"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+# Step 1: Reading cases
+def load_cases(source):
+    """
+    Reads cases from a JSONL manifest or a directory.
+    Returns:
+        list[dict]: Cases with "id", "audio", "image" and optional "transcript".
+    """
+    if os.path.isdir(source):
+        return _load_directory(source)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    cases = []
+    with open(source, "r", encoding="utf-8") as manifest:
+        for line_number, line in enumerate(manifest, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            case = {
+                "id": str(entry.get("id") or entry.get("case_id") or entry.get("request_id") or f"line-{line_number}"),
+                "audio": _resolve(base_dir, entry.get("audio")),
+                "image": _resolve(base_dir, entry.get("image")),
+                "transcript": entry.get("transcript"),
+            }
+            if not (case["audio"] or case["image"] or case["transcript"]):
+                logging.warning(f"Skipping manifest line {line_number}: no audio, image or transcript.")
+                continue
+            cases.append(case)
+    return cases
+
+
+def _resolve(base_dir, path):
+    if not path:
+        return None
+    return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+
+def _load_directory(directory):
+    cases = {}
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        kind = "audio" if extension.lower() in AUDIO_EXTENSIONS else "image" if extension.lower() in IMAGE_EXTENSIONS else None
+        if kind:
+            case = cases.setdefault(stem, {"id": stem, "audio": None, "image": None, "transcript": None})
+            case[kind] = os.path.join(directory, name)
+    return list(cases.values())
+
+
+# Step 2: Results file (also the checkpoint)
+class ResultWriter:
+    """
+    Appends one JSON line per finished case and flushes it to disk immediately, so an
+    interrupted run loses at most the cases that were still in flight.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.written += 1
+
+    def close(self):
+        self._file.close()
+
+
+def finished_case_ids(output_path, retry_failed=False):
+    """
+    Returns the ids already present in the results file. With retry_failed,
+    cases that ended with an error are run again.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as results:
+        for line in results:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short by a crash; that case runs again
+            if record.get("status") == "ok" or not retry_failed:
+                done.add(record["id"])
+    return done
+
+
+def make_record(case, mode, transcript, response, audio_output=None, errors=None, timings=None, wall_ms=None, trace_id=None):
+    return {
+        "id": case["id"],
+        "audio": case["audio"],
+        "image": case["image"],
+        "status": "error" if errors else "ok",
+        "transcript": transcript,
+        "response": response,
+        "audio_output": audio_output,
+        "errors": errors or {},
+        "timings_ms": timings or {},
+        "wall_ms": round(wall_ms, 1) if wall_ms is not None else None,
+        "model": VISION_MODEL,
+        "prompt_version": prompt_version(system_prompt),
+        "mode": mode,
+        "trace_id": trace_id,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def keep_audio(audio_bytes, audio_dir, case_id):
+    """
+    Writes generated speech (MP3 bytes) to audio_dir and returns its path.
+    """
+    if not audio_bytes or not audio_dir:
+        return None
+    os.makedirs(audio_dir, exist_ok=True)
+    destination = os.path.join(audio_dir, f"{case_id}.mp3")
+    with open(destination, "wb") as audio_file:
+        audio_file.write(audio_bytes)
+    return destination
+
+
+# Step 3: Worker pool mode
+def run_case(case, skip_tts=False, audio_dir=None):
+    """
+    Runs one case through the consultation stages and returns its result record.
+    """
+    trace_id = new_trace_id()
+    stages = build_consultation_stages(case["audio"], case["image"], case["transcript"])
+    if skip_tts:
+        stages = [stage for stage in stages if stage.name != "speak"]
+    run = run_stages(stages)
+    record_run_metrics(run, "batch", case["audio"])
+    return make_record(
+        case, "pool",
+        transcript=run.results.get("transcribe"),
+        response=run.results.get("analyze"),
+        audio_output=keep_audio(run.results.get("speak"), audio_dir, case["id"]),
+        errors={stage: str(error) for stage, error in run.errors.items()},
+        timings={stage: round(timing["duration_ms"], 1) for stage, timing in run.timings.items()},
+        wall_ms=run.wall_ms,
+        trace_id=trace_id,
+    )
+
+
+def run_pool(cases, writer, workers, skip_tts=False, audio_dir=None):
+    """
+    Runs cases on a bounded worker pool, writing each result as soon as it is ready.
+    At most `workers` cases are in flight, so memory stays flat for large manifests.
+    """
+    pending = iter(cases)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        try:
+            while True:
+                while len(in_flight) < workers:
+                    case = next(pending, None)
+                    if case is None:
+                        break
+                    in_flight[executor.submit(run_case, case, skip_tts, audio_dir)] = case
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    case = in_flight.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        record = make_record(case, "pool", None, None, errors={"case": str(e)})
+                    writer.write(record)
+                    logging.info(f"[{writer.written}] {case['id']}: {record['status']}")
+        except KeyboardInterrupt:
+            logging.warning(f"Interrupted; waiting for {len(in_flight)} case(s) in flight. Re-run to resume.")
+            for future in in_flight:
+                try:
+                    writer.write(future.result())
+                except Exception:
+                    pass
+            raise
+
+
+# Step 4: Groq batch mode
+# Transcription and image preprocessing run locally; all vision calls are submitted as
+# one Groq batch job (cheaper, higher throughput, results within the completion window).
+def _checkpoint_path(output_path):
+    return f"{output_path}.batch.json"
+
+
+def _prepare_cases(cases, workers):
+    """
+    Runs the transcribe and encode stages for every case.
+    Returns {id: (transcript, prepared image or None, stage errors)}.
+    """
+    def prepare(case):
+        new_trace_id()
+        stages = build_consultation_stages(case["audio"], case["image"], case["transcript"])
+        run = run_stages([stage for stage in stages if stage.name in ("transcribe", "encode")])
+        errors = {stage: str(error) for stage, error in run.errors.items()}
+        return case["id"], (run.results["transcribe"], run.results["encode"], errors)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-prep") as executor:
+        return dict(executor.map(prepare, cases))
+
+
+def submit_groq_batch(cases, workers):
+    """
+    Prepares the cases, uploads one chat-completions request per image and starts a batch job.
+    Returns:
+        dict: Checkpoint state with the batch id and each case's transcript.
+    """
+    prepared = _prepare_cases(cases, workers)
+    lines = []
+    for case_id, (transcript, prepared_image, _) in prepared.items():
+        if prepared_image is None:
+            continue  # No image (or it failed): answered locally without a model call
+        lines.append(json.dumps({
+            "custom_id": case_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": VISION_MODEL,
+                "messages": build_image_messages(system_prompt + transcript, prepared_image.data, prepared_image.mime_type),
+            },
+        }))
+
+    state = {
+        "batch_id": None,
+        "transcripts": {case_id: transcript for case_id, (transcript, _, _) in prepared.items()},
+        "has_image": [case_id for case_id, (_, image, _) in prepared.items() if image is not None],
+        "errors": {case_id: errors for case_id, (_, _, errors) in prepared.items() if errors},
+    }
+    if lines:
+        client = get_groq_client()
+        batch_file = client.files.create(
+            file=("consultations.jsonl", io.BytesIO(("\n".join(lines) + "\n").encode("utf-8"))), purpose="batch")
+        batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        state["batch_id"] = batch.id
+        logging.info(f"Submitted Groq batch {batch.id} with {len(lines)} request(s).")
+    return state
+
+
+def wait_for_groq_batch(batch_id, poll_interval):
+    """
+    Polls the batch job until it reaches a final status.
+    Returns:
+        dict: custom_id -> response text (or an Exception for failed requests).
+    """
+    client = get_groq_client()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in BATCH_FINAL_STATUSES:
+            break
+        logging.info(f"Groq batch {batch_id}: {batch.status} {batch.request_counts}")
+        time.sleep(poll_interval)
+
+    responses = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = client.files.content(file_id)
+        text = content if isinstance(content, str) else content.text()
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            body = response.get("body") or {}
+            if response.get("status_code") == 200 and body.get("choices"):
+                responses[result["custom_id"]] = body["choices"][0]["message"]["content"]
+            else:
+                responses[result["custom_id"]] = RuntimeError(str(result.get("error") or body.get("error") or "Batch request failed"))
+    if batch.status != "completed":
+        logging.warning(f"Groq batch {batch_id} ended as {batch.status}.")
+    return responses
+
+
+def run_groq_batch(cases, writer, output_path, workers, skip_tts=False, audio_dir=None, poll_interval=30):
+    """
+    Runs cases through a Groq batch job. The batch id is checkpointed next to the results,
+    so an interrupted run resumes polling the same job instead of submitting a new one.
+    """
+    checkpoint = _checkpoint_path(output_path)
+    if os.path.exists(checkpoint):
+        with open(checkpoint, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        logging.info(f"Resuming Groq batch {state['batch_id']} from {checkpoint}.")
+    else:
+        state = submit_groq_batch(cases, workers)
+        with open(checkpoint, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    responses = wait_for_groq_batch(state["batch_id"], poll_interval) if state["batch_id"] else {}
+
+    def finish(case):
+        transcript = state["transcripts"].get(case["id"])
+        errors = dict(state["errors"].get(case["id"], {}))
+        if case["id"] not in state["has_image"]:
+            response = NO_IMAGE_MESSAGE if not case["image"] else ANALYSIS_ERROR_MESSAGE
+        else:
+            response = responses.get(case["id"], RuntimeError("Missing from the batch output"))
+            if isinstance(response, Exception):
+                errors["analyze"] = str(response)
+                response = ANALYSIS_ERROR_MESSAGE
+        audio_output = None
+        if not skip_tts:
+            try:
+                audio_output = os.path.join(audio_dir, f"{case['id']}.mp3")
+                os.makedirs(audio_dir, exist_ok=True)
+                text_to_speech(input_text=response, output_filepath=audio_output)
+            except Exception as e:
+                errors["speak"] = str(e)
+                audio_output = None
+        return make_record(case, "groq_batch", transcript, response, audio_output, errors)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-tts") as executor:
+        for record in executor.map(finish, [case for case in cases if case["id"] in state["transcripts"]]):
+            writer.write(record)
+    os.remove(checkpoint)
+
+
+def groq_batch_available():
+    """
+    True if the Groq SDK in use exposes the files and batches endpoints.
+    """
+    try:
+        client = get_groq_client()
+    except ValueError:
+        return False
+    return hasattr(client, "batches") and hasattr(client, "files")
+
+
+# Step 5: Command-line interface
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="JSONL manifest or directory of cases")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Results file (appended to; also the checkpoint)")
+    parser.add_argument("--workers", type=int, default=4, help="Cases processed concurrently")
+    parser.add_argument("--skip-tts", action="store_true", help="Do not synthesize the doctor's voice")
+    parser.add_argument("--audio-dir", help="Where to keep generated speech (default: <output>_audio)")
+    parser.add_argument("--retry-failed", action="store_true", help="Also re-run cases that ended with an error")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="Reuse cached vision responses (off by default so re-runs measure the current model)")
+    parser.add_argument("--groq-batch", action="store_true", help="Submit vision calls as one Groq batch job")
+    parser.add_argument("--poll-interval", type=float, default=30, help="Seconds between batch status checks")
+    args = parser.parse_args()
+
+    configure_logging()
+    threading.Thread(target=load_local_models, daemon=True, name="local-models").start()
+    response_cache.enabled = args.response_cache
+    audio_dir = None if args.skip_tts else (args.audio_dir or f"{os.path.splitext(args.output)[0]}_audio")
+
+    cases = load_cases(args.source)
+    done = finished_case_ids(args.output, args.retry_failed)
+    remaining = [case for case in cases if case["id"] not in done]
+    logging.info(f"{len(cases)} case(s) in {args.source}; {len(done)} already finished, {len(remaining)} to run.")
+
+    writer = ResultWriter(args.output)
+    start = time.perf_counter()
+    try:
+        if args.groq_batch and remaining and groq_batch_available():
+            try:
+                run_groq_batch(remaining, writer, args.output, args.workers, args.skip_tts, audio_dir, args.poll_interval)
+            except Exception as e:
+                if writer.written or os.path.exists(_checkpoint_path(args.output)):
+                    raise  # The batch was submitted; resume it rather than paying twice
+                logging.warning(f"Groq batch endpoint unavailable ({e}); using the worker pool instead.")
+                run_pool(remaining, writer, args.workers, args.skip_tts, audio_dir)
+        else:
+            if args.groq_batch and remaining:
+                logging.warning("Groq batch endpoint unavailable; using the worker pool instead.")
+            run_pool(remaining, writer, args.workers, args.skip_tts, audio_dir)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    rate = f", {writer.written / elapsed:.2f} cases/s" if writer.written and elapsed else ""
+    logging.info(f"Wrote {writer.written} result(s) to {args.output} in {elapsed:.1f}s{rate}.")
+
+
+if __name__ == "__main__":
+    main()
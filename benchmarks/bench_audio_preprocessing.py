@@ -0,0 +1,103 @@
+"""
+Benchmark: raw recording upload vs. preprocessed (trimmed, 16 kHz mono, FLAC) audio.
+
+Reports upload bytes, duration before/after silence trimming, chunk count and
+preprocessing time. With --upload it also times real Whisper calls for both
+payloads (requires GROQ_API_KEY).
+
+Usage:
+    python benchmarks/bench_audio_preprocessing.py recording.wav
+    python benchmarks/bench_audio_preprocessing.py --synthetic --long
+    python benchmarks/bench_audio_preprocessing.py recording.wav --upload
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_preprocessing import prepare_audio  # noqa: E402
+
+
+def make_synthetic_recording(path, speech_seconds=20.0, lead_silence=2.0, tail_silence=3.0,
+                             sample_rate=48000, channels=2, seed=0):
+    """
+    Writes a WAV like the browser microphone produces: 48 kHz stereo 16-bit, a few
+    seconds of room noise around syllable-like bursts of voiced sound.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(speech_seconds * sample_rate)) / sample_rate
+    syllables = (np.sin(2 * np.pi * 3 * t) > 0).astype(float) * 0.8 + 0.05
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    voiced = (np.sin(2 * np.pi * np.cumsum(pitch) / sample_rate) * 0.3 + rng.normal(0, 0.04, t.size)) * syllables
+    signal = np.concatenate([
+        rng.normal(0, 0.002, int(lead_silence * sample_rate)),
+        voiced,
+        rng.normal(0, 0.002, int(tail_silence * sample_rate)),
+    ])
+    pcm = np.clip(signal * 32767, -32768, 32767).astype("<i2")
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.repeat(pcm, channels).tobytes())
+    return path
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def bench(audio_path, upload=False, model="whisper-large-v3"):
+    prepared, prep_ms = timed(prepare_audio, audio_path)
+
+    print(f"\n{audio_path}")
+    print(f"  before: {prepared.original_bytes:>12,} bytes  {prepared.original_seconds or 0:8.1f} s")
+    print(
+        f"  after:  {prepared.encoded_bytes:>12,} bytes  {prepared.speech_seconds or 0:8.1f} s  "
+        f"{len(prepared.chunks)} chunk(s), {prepared.mime_type or 'unchanged'}, preprocessing {prep_ms:.0f} ms"
+    )
+    if prepared.original_bytes:
+        print(f"  upload reduction: {100 * (1 - prepared.encoded_bytes / prepared.original_bytes):.1f}%")
+
+    if upload:
+        from provider_clients import get_groq_client
+        from patient_query import transcribe_with_groq
+
+        client = get_groq_client()
+        with open(audio_path, "rb") as audio_file:
+            raw = audio_file.read()
+        _, raw_ms = timed(client.audio.transcriptions.create, model=model,
+                          file=(os.path.basename(audio_path), raw), language="en")
+        _, new_ms = timed(transcribe_with_groq, model, audio_path, None)
+        print(f"  transcription: before {raw_ms:.0f} ms, after {new_ms:.0f} ms (including preprocessing)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", nargs="*", help="Audio files to benchmark")
+    parser.add_argument("--synthetic", action="store_true", help="Also benchmark a generated 25 s recording")
+    parser.add_argument("--long", action="store_true", help="Also benchmark a generated 25 min recording (chunked)")
+    parser.add_argument("--upload", action="store_true", help="Time real Whisper calls (uses the Groq API)")
+    args = parser.parse_args()
+
+    recordings = list(args.recordings)
+    if args.synthetic or not recordings:
+        recordings.append(make_synthetic_recording(os.path.join(tempfile.gettempdir(), "bench_recording.wav")))
+    if args.long:
+        recordings.append(make_synthetic_recording(
+            os.path.join(tempfile.gettempdir(), "bench_recording_long.wav"), speech_seconds=25 * 60))
+
+    for audio_path in recordings:
+        bench(audio_path, upload=args.upload)
+
+
+if __name__ == "__main__":
+    main()
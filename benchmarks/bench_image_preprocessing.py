@@ -0,0 +1,86 @@
+"""
+Benchmark: raw base64 upload vs. preprocessed image payload.
+
+Reports payload bytes and encoding time for the old path (raw file bytes, base64)
+and the new path (prepare_image, cold and cached). With --upload it also times a
+real vision call for both payloads (requires GROQ_API_KEY).
+
+Usage:
+    python benchmarks/bench_image_preprocessing.py acne.webp
+    python benchmarks/bench_image_preprocessing.py --synthetic
+    python benchmarks/bench_image_preprocessing.py acne.webp --upload
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_preprocessing  # noqa: E402
+from image_preprocessing import prepare_image  # noqa: E402
+
+
+def make_synthetic_photo(path, size=(4032, 3024)):
+    """
+    Writes a 12 MP noisy JPEG, which compresses like a real phone photo.
+    """
+    from PIL import Image
+
+    Image.effect_noise(size, 64).convert("RGB").save(path, format="JPEG", quality=92)
+    return path
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def raw_encode(image_path):
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode("utf-8")
+
+
+def bench(image_path, upload=False, model="llama-3.2-11b-vision-preview"):
+    raw_payload, raw_ms = timed(raw_encode, image_path)
+    image_preprocessing._cache.clear()
+    prepared, cold_ms = timed(prepare_image, image_path)
+    _, warm_ms = timed(prepare_image, image_path)
+
+    print(f"\n{image_path}")
+    print(f"  before: {len(raw_payload):>10,} base64 bytes  encode {raw_ms:8.1f} ms  (always image/jpeg)")
+    print(
+        f"  after:  {len(prepared.data):>10,} base64 bytes  encode {cold_ms:8.1f} ms cold, "
+        f"{warm_ms:.2f} ms cached  ({prepared.mime_type}, {prepared.width}x{prepared.height})"
+    )
+    print(f"  payload reduction: {100 * (1 - len(prepared.data) / len(raw_payload)):.1f}%")
+
+    if upload:
+        from ai_medical_assistant import analyze_image_with_query
+
+        query = "Describe this image in one sentence."
+        _, raw_upload_ms = timed(analyze_image_with_query, query, model, raw_payload)
+        _, new_upload_ms = timed(analyze_image_with_query, query, model, prepared.data, prepared.mime_type)
+        print(f"  vision call: before {raw_upload_ms:.0f} ms, after {new_upload_ms:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*", help="Image files to benchmark")
+    parser.add_argument("--synthetic", action="store_true", help="Also benchmark a generated 12 MP photo")
+    parser.add_argument("--upload", action="store_true", help="Time real vision calls (uses the Groq API)")
+    args = parser.parse_args()
+
+    images = list(args.images)
+    if args.synthetic or not images:
+        images.append(make_synthetic_photo(os.path.join(tempfile.gettempdir(), "bench_12mp.jpg")))
+
+    for image_path in images:
+        bench(image_path, upload=args.upload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Measures cold import time of the app modules with `python -X importtime`.
+
+Each module is imported in a fresh interpreter several times; the median total is
+reported together with the slowest top-level imports of the last run. Use it to
+check that the pipeline modules stay light and that provider SDKs are only loaded
+on first use.
+
+Usage:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --modules consultation,patient_query --runs 7 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = "app,consultation,ai_medical_assistant,patient_query,doctor_voice_tts"
+
+
+def import_profile(module):
+    """
+    Imports `module` in a fresh interpreter and parses the -X importtime output.
+    Returns:
+        tuple: (total microseconds, {package imported by the module: cumulative microseconds})
+    """
+    env = dict(os.environ, GROQ_API_KEY=os.environ.get("GROQ_API_KEY", ""))  # Imports must not need a key
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    # Children are printed before their parent, indented two spaces per level
+    children = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, raw_name = line[len("import time:"):].split("|")
+        name = raw_name.strip()
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        if depth == 1:
+            top = name.split(".")[0]
+            children[top] = children.get(top, 0) + int(cumulative)
+        elif depth == 0:
+            if name == module:
+                return int(cumulative), children
+            children = {}
+    raise RuntimeError(f"{module} not found in -X importtime output")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=DEFAULT_MODULES, help="Comma-separated modules to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=8, help="Slowest top-level imports to list")
+    args = parser.parse_args()
+
+    for module in args.modules.split(","):
+        totals = []
+        packages = {}
+        for _ in range(args.runs):
+            total, packages = import_profile(module)
+            totals.append(total)
+        print(f"\n=== import {module}: median {statistics.median(totals) / 1000:.0f} ms "
+              f"(min {min(totals) / 1000:.0f} ms, {args.runs} runs) ===")
+        for name, micros in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {name:<28}{micros / 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
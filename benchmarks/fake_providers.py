@@ -0,0 +1,273 @@
+"""
+Local stand-ins for the Groq (Whisper, vision, batches) and ElevenLabs HTTP APIs.
+
+Each endpoint has configurable latency, jitter, error rate and payload size, so
+the pipeline can be load-tested offline without paid API calls. The servers speak
+just enough of each API for the official SDKs to parse the responses.
+
+Usage (standalone):
+    python benchmarks/fake_providers.py --port 8900 --vision-latency 800
+Then point the app at it:
+    GROQ_BASE_URL=http://127.0.0.1:8900 ELEVENLABS_BASE_URL=http://127.0.0.1:8900 python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "with what I see I think you might have mild acne here are some remedies wash your face "
+    "twice a day with a gentle cleanser avoid touching the area and consider benzoyl peroxide"
+).split()
+
+
+class EndpointConfig:
+    """
+    Behaviour of one fake endpoint.
+    Args:
+        latency_ms (float): Mean response latency.
+        jitter_ms (float): Standard deviation added to the latency.
+        error_rate (float): Fraction of requests answered with HTTP 500.
+        payload_size (int): Response size (words for text endpoints, bytes for audio).
+    """
+
+    def __init__(self, latency_ms=200.0, jitter_ms=50.0, error_rate=0.0, payload_size=40):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.payload_size = payload_size
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+
+def _sentence(words):
+    text = " ".join(random.choice(WORDS) for _ in range(words))
+    return text[:1].upper() + text[1:] + "."
+
+
+def make_handler(config):
+    """
+    Builds a request handler class bound to a {"stt", "vision", "tts"} -> EndpointConfig mapping.
+    """
+    files = {}  # Uploaded batch inputs and generated batch outputs
+    batches = {}
+
+    class FakeProviderHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _send(self, status, body, content_type="application/json"):
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _fail(self):
+            self._send(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+
+        def do_GET(self):
+            if self.path.startswith("/v1/voices"):
+                # ElevenLabs resolves the voice name to an id before synthesis
+                self._send(200, {"voices": [{"voice_id": "fakevoiceid000000001", "name": "Aria"}]})
+            elif "/batches/" in self.path:
+                batch = batches.get(self.path.rsplit("/", 1)[-1])
+                self._send(200, batch) if batch else self._send(404, {"error": "not found"})
+            elif self.path.endswith("/content") and "/files/" in self.path:
+                content = files.get(self.path.split("/files/")[1].split("/")[0])
+                self._send(200, content, "application/octet-stream") if content is not None else self._send(404, {"error": "not found"})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = self._read_body()
+            if self.path.endswith("/audio/transcriptions"):
+                self._handle("stt", lambda cfg: self._send(200, {"text": _sentence(cfg.payload_size)}))
+            elif self.path.endswith("/chat/completions"):
+                request = json.loads(body or b"{}")
+                self._handle("vision", lambda cfg: self._chat(cfg, request))
+            elif self.path.endswith("/files"):
+                self._upload_file(body)
+            elif self.path.endswith("/batches"):
+                self._create_batch(json.loads(body or b"{}"))
+            elif self.path.startswith("/v1/text-to-speech/"):
+                self._handle("tts", lambda cfg: self._send(200, random.randbytes(cfg.payload_size), "audio/mpeg"))
+            else:
+                self._send(404, {"error": "not found"})
+
+        def _handle(self, endpoint, respond):
+            cfg = config[endpoint]
+            time.sleep(cfg.delay())
+            if cfg.should_fail():
+                self._fail()
+            else:
+                respond(cfg)
+
+        def _upload_file(self, body):
+            # Multipart upload; the batch input is the only part with a file name
+            message = BytesParser().parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("latin-1") + body)
+            content = next(part.get_payload(decode=True) for part in message.walk() if part.get_filename())
+            file_id = f"file_{uuid.uuid4().hex[:24]}"
+            files[file_id] = content
+            self._send(200, {"id": file_id, "object": "file", "bytes": len(content), "purpose": "batch",
+                             "created_at": int(time.time()), "filename": "batch.jsonl"})
+
+        def _create_batch(self, request):
+            # The whole batch is answered at once; vision latency is not simulated per request
+            output = []
+            for line in files.get(request.get("input_file_id"), b"").decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                text = " ".join(_sentence(random.randint(8, 14)) for _ in range(max(1, config["vision"].payload_size // 10)))
+                output.append(json.dumps({"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": item["custom_id"], "response": {
+                    "status_code": 200, "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}}}))
+            output_id = f"file_{uuid.uuid4().hex[:24]}"
+            files[output_id] = ("\n".join(output) + "\n").encode("utf-8")
+            batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+            batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": request.get("endpoint"), "completion_window": "24h",
+                "input_file_id": request.get("input_file_id"), "status": "completed", "created_at": int(time.time()),
+                "output_file_id": output_id, "error_file_id": None,
+                "request_counts": {"total": len(output), "completed": len(output), "failed": 0},
+            }
+            self._send(200, batches[batch_id])
+
+        def _chat(self, cfg, request):
+            text = " ".join(_sentence(random.randint(8, 14)) for _ in range(max(1, cfg.payload_size // 10)))
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            model = request.get("model", "fake-model")
+            created = int(time.time())
+            if not request.get("stream"):
+                self._send(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": len(text.split()), "total_tokens": 100 + len(text.split())},
+                })
+                return
+
+            # Server-sent events, one word per chunk
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write_event(payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+            for word in text.split(" "):
+                time.sleep(cfg.jitter_ms / 1000 / 10)  # Token pacing
+                write_event(json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                }))
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return FakeProviderHandler
+
+
+class FakeProviders:
+    """
+    Runs the fake Groq/ElevenLabs server on a background thread.
+    Example:
+        with FakeProviders(vision=EndpointConfig(latency_ms=800)) as fake:
+            os.environ["GROQ_BASE_URL"] = fake.base_url
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, stt=None, vision=None, tts=None):
+        self.config = {
+            "stt": stt or EndpointConfig(latency_ms=300, payload_size=15),
+            "vision": vision or EndpointConfig(latency_ms=700, payload_size=30),
+            "tts": tts or EndpointConfig(latency_ms=400, payload_size=48_000),
+        }
+        self.server = ThreadingHTTPServer((host, port), make_handler(self.config))
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_endpoint_arguments(parser):
+    """
+    Adds --<endpoint>-latency/-jitter/-error-rate/-payload options for stt, vision and tts.
+    """
+    defaults = {"stt": (300, 50, 0.0, 15), "vision": (700, 100, 0.0, 30), "tts": (400, 80, 0.0, 48_000)}
+    for endpoint, (latency, jitter, error_rate, payload) in defaults.items():
+        parser.add_argument(f"--{endpoint}-latency", type=float, default=latency, help=f"{endpoint} mean latency (ms)")
+        parser.add_argument(f"--{endpoint}-jitter", type=float, default=jitter, help=f"{endpoint} latency std dev (ms)")
+        parser.add_argument(f"--{endpoint}-error-rate", type=float, default=error_rate, help=f"{endpoint} HTTP 500 rate")
+        parser.add_argument(f"--{endpoint}-payload", type=int, default=payload,
+                            help=f"{endpoint} payload size (words for text, bytes for audio)")
+
+
+def endpoint_configs(args):
+    return {
+        endpoint: EndpointConfig(
+            latency_ms=getattr(args, f"{endpoint}_latency"),
+            jitter_ms=getattr(args, f"{endpoint}_jitter"),
+            error_rate=getattr(args, f"{endpoint}_error_rate"),
+            payload_size=getattr(args, f"{endpoint}_payload"),
+        )
+        for endpoint in ("stt", "vision", "tts")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_endpoint_arguments(parser)
+    args = parser.parse_args()
+
+    fake = FakeProviders(args.host, args.port, **endpoint_configs(args)).start()
+    print(f"Fake providers listening on {fake.base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
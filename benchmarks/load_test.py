@@ -0,0 +1,170 @@
+"""
+Load test for the consultation pipeline against local fake providers.
+
+Starts the fake Groq/ElevenLabs server (benchmarks/fake_providers.py), points the
+app at it, and drives the pipeline at one or more concurrency levels. Reports
+p50/p95/p99 latency per stage and end to end, requests per second, error counts
+and peak RSS. No paid API is called.
+
+Usage:
+    python benchmarks/load_test.py --requests 200 --concurrency 1,8,32
+    python benchmarks/load_test.py --mode async --concurrency 64 --vision-latency 1500
+    python benchmarks/load_test.py --vision-error-rate 0.05 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_providers import FakeProviders, add_endpoint_arguments, endpoint_configs  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("transcribe", "encode", "analyze", "speak")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def configure_environment(base_url, tts_cache, response_cache=False):
+    """
+    Points every provider at the fake server. Must run before the app modules are imported.
+    """
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ["ELEVENLABS_BASE_URL"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "fake-groq-key")
+    os.environ.setdefault("ELEVENLABS_API_KEY", "fake-elevenlabs-key")
+    os.environ["TTS_CACHE_ENABLED"] = "1" if tts_cache else "0"
+    # Every load-test request is identical, so the vision response cache would answer all but the first
+    os.environ["RESPONSE_CACHE_ENABLED"] = "1" if response_cache else "0"
+
+
+def make_audio_input():
+    # A real WAV, so the audio preprocessing stage does its usual work before the fake upload
+    from bench_audio_preprocessing import make_synthetic_recording
+
+    return make_synthetic_recording(os.path.join(tempfile.gettempdir(), "loadtest_input.wav"), speech_seconds=8.0)
+
+
+def run_level(consultation, mode, concurrency, total, audio_path, image_path):
+    """
+    Runs `total` consultations with at most `concurrency` in flight.
+    Returns:
+        dict: Latency samples per stage, end-to-end samples, error counts and wall time.
+    """
+    samples = {stage: [] for stage in STAGES}
+    samples["end_to_end"] = []
+    errors = {stage: 0 for stage in STAGES}
+
+    def record(run):
+        samples["end_to_end"].append(run.wall_ms)
+        for stage, timing in run.timings.items():
+            samples[stage].append(timing["duration_ms"])
+        for stage in run.errors:
+            errors[stage] += 1
+
+    start = time.perf_counter()
+    if mode == "async":
+        async def drive():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with semaphore:
+                    record(await consultation.run_consultation_async(audio_path, image_path))
+
+            await asyncio.gather(*(one() for _ in range(total)))
+
+        asyncio.run(drive())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for run in pool.map(lambda _: consultation.run_consultation(audio_path, image_path), range(total)):
+                record(run)
+    wall = time.perf_counter() - start
+    return {"samples": samples, "errors": errors, "wall_seconds": wall}
+
+
+def summarize(mode, concurrency, total, result):
+    summary = {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": round(total / result["wall_seconds"], 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "errors": result["errors"],
+        "latency_ms": {},
+    }
+    for stage, values in result["samples"].items():
+        summary["latency_ms"][stage] = {
+            "p50": round(percentile(values, 50), 1),
+            "p95": round(percentile(values, 95), 1),
+            "p99": round(percentile(values, 99), 1),
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n=== mode={summary['mode']} concurrency={summary['concurrency']} requests={summary['requests']} ===")
+    print(f"throughput: {summary['rps']} req/s   peak RSS: {summary['peak_rss_mb']} MB   errors: {summary['errors']}")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, latency in summary["latency_ms"].items():
+        print(f"{stage:<12}{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="Consultations per concurrency level")
+    parser.add_argument("--concurrency", default="1,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync",
+                        help="sync: run_consultation on a thread pool; async: run_consultation_async")
+    parser.add_argument("--image", default=os.path.join(REPO_ROOT, "acne.webp"), help="Image sent with every request")
+    parser.add_argument("--tts-cache", action="store_true", help="Keep the TTS cache enabled")
+    parser.add_argument("--response-cache", action="store_true", help="Keep the vision response cache enabled")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    add_endpoint_arguments(parser)
+    args = parser.parse_args()
+
+    fake = FakeProviders(**endpoint_configs(args)).start()
+    configure_environment(fake.base_url, args.tts_cache, args.response_cache)
+
+    import consultation  # Imported after the environment points at the fake server (no Gradio needed)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    audio_path = make_audio_input()
+    results = []
+    try:
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            result = run_level(consultation, args.mode, concurrency, args.requests, audio_path, args.image)
+            summary = summarize(args.mode, concurrency, args.requests, result)
+            print_summary(summary)
+            results.append(summary)
+    finally:
+        fake.stop()
+
+    print(f"\nProvider pool stats: {consultation.pool_stats()}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+# Consultation pipeline: speech-to-text, image analysis and text-to-speech.
+# This module has no UI dependencies, so batch jobs and benchmarks can import it
+# without paying for the Gradio import; app.py builds the web UI on top of it.
+from dotenv import load_dotenv  # For loading environment variables from a .env file
+load_dotenv()  # Load environment variables
+
+import os  # For interacting with the operating system
+import logging  # For structured, trace-tagged log lines
+import time  # For per-stage timings
+import asyncio  # For the async pipeline
+import queue  # For passing streamed text and audio events between threads
+import threading  # For reading the token stream while chunks are handed to the UI
+import contextvars  # For carrying the trace ID into worker threads
+from concurrent.futures import ThreadPoolExecutor  # For synthesizing sentences while the response streams
+
+# Import custom modules
+from image_preprocessing import prepare_image  # For image downscaling and encoding
+from patient_query import transcribe_audio, transcribe_audio_async  # For audio transcription
+from doctor_voice_tts import synthesize_speech, synthesize_speech_async  # For text-to-speech conversion
+from provider_router import get_router, router_snapshot  # For failover and hedging across provider backends
+from tts_cache import tts_cache  # For reporting TTS cache hits and savings
+from response_cache import response_cache, vision_cache_key  # For reusing analyses of resubmitted images
+from provider_clients import pool_stats  # For reporting connection pool reuse
+from scheduler import scheduler  # For reporting per-provider queueing
+from stage_graph import Stage, PipelineRun, run_stages  # For running independent stages concurrently
+from sentence_stream import split_sentences  # For sending complete sentences to TTS while streaming
+from conversation import session_registry  # For reporting conversation memory
+from local_models import local_models_configured  # For running without Groq on local models
+import image_preprocessing  # For image cache statistics
+from metrics import (  # For per-stage metrics and trace IDs
+    CallbackMetric, register, observe_run, new_trace_id,
+    payload_bytes, request_duration, time_to_first_audio
+)
+
+
+# Step 0: Configuration check
+# Runs at application startup (not at import time), so importing this module never exits.
+def check_configuration():
+    """
+    Verifies that the provider API keys are configured.
+    Exits if GROQ_API_KEY is missing, unless speech-to-text has a local backend (the app then
+    runs degraded, without image analysis); a missing ELEVENLABS_API_KEY only disables the
+    doctor's voice, so it is a warning.
+    """
+    if not os.environ.get("GROQ_API_KEY"):
+        if "stt" not in local_models_configured():
+            logging.error("GROQ_API_KEY is missing. Please check your .env file.")
+            raise SystemExit(1)
+        logging.warning("GROQ_API_KEY is missing; speech is transcribed locally and image analysis is unavailable.")
+    else:
+        logging.info("GROQ API Key successfully loaded.")
+    if not os.environ.get("ELEVENLABS_API_KEY"):
+        logging.warning("ELEVENLABS_API_KEY is missing; the doctor's voice falls back to the next TTS backend.")
+
+
+# Step 1: Define System Prompt
+# This prompt guides the AI model to act like a professional doctor.
+system_prompt = """You have to act as a professional doctor. Keep in mind this is for learning purposes only. 
+                Do not add any numbers or special characters in your response. Your response should be in one long paragraph.
+                Always answer as if you are addressing a real person. Mimic an actual doctor's tone, not an AI bot.
+                If you make a differential diagnosis, suggest some remedies. Start your response immediately without preamble.
+                Example: "With what I see, I think you might have... Here are some remedies..." 
+                Keep your answer concise (maximum 2 sentences)."""
+
+# Step 2: Pipeline stages
+# Upstream calls go through the provider routers (STT_BACKENDS, VISION_BACKENDS, TTS_BACKENDS).
+# VISION_MODEL is the primary vision model; it names the response cache entries and Groq batch jobs.
+VISION_MODEL = "llama-3.2-11b-vision-preview"
+
+# Fallback messages used when a stage fails, so the remaining stages can still run.
+TRANSCRIPTION_ERROR_MESSAGE = "An error occurred while transcribing the audio."
+ANALYSIS_ERROR_MESSAGE = "An error occurred while analyzing the image."
+NO_IMAGE_MESSAGE = "No image provided for analysis."
+# Fixed responses that are synthesized into the TTS cache at startup
+FALLBACK_MESSAGES = [NO_IMAGE_MESSAGE, ANALYSIS_ERROR_MESSAGE, TRANSCRIPTION_ERROR_MESSAGE]
+
+def build_consultation_stages(audio_filepath, image_filepath, transcript=None, session=None):
+    """
+    Describes the consultation as a dependency graph.
+    Transcription and image preprocessing do not depend on each other and run concurrently;
+    the vision call waits for both, and text-to-speech waits for the vision call.
+    A transcript produced while the patient was speaking (live_transcription.py) skips Whisper.
+    With a ConsultationSession (conversation.py), follow-up questions reuse the session's
+    image and earlier turns are added to the prompt.
+    """
+    def transcribe():
+        # Step 2a: Convert Audio to Text (Speech-to-Text)
+        if transcript is not None:
+            return transcript
+        if not audio_filepath:
+            return "No audio provided."
+        logging.info("Transcribing audio...")
+        text = transcribe_audio(audio_filepath)
+        logging.info(f"Transcription complete: {text}")
+        return text
+
+    def encode():
+        # Step 2b: Downscale and encode the image into base64 (overlaps with transcription)
+        if session is not None:
+            return session.use_image(image_filepath)  # Follow-ups reuse the already encoded image
+        if not image_filepath:
+            return None
+        return prepare_image(image_filepath)
+
+    def analyze(transcribe, encode):
+        # Step 2c: Analyze Image (if provided)
+        if encode is None:
+            if image_filepath:
+                raise RuntimeError("Image could not be prepared for analysis.")
+            return NO_IMAGE_MESSAGE
+        logging.info("Analyzing image...")
+        patient_text = session.patient_context(transcribe) if session is not None else transcribe
+        # Identical resubmissions (same image, question, model and prompt) reuse the stored analysis
+        doctor_response = response_cache.get_or_compute(
+            vision_cache_key(encode, patient_text, VISION_MODEL, system_prompt),
+            lambda: get_router("vision").call(
+                query=system_prompt + patient_text,  # Combine system prompt with transcription
+                encoded_image=encode.data,
+                mime_type=encode.mime_type
+            )
+        )
+        logging.info(f"Doctor's response: {doctor_response}")
+        remember_turn(session, transcribe, doctor_response)
+        return doctor_response
+
+    def speak(analyze):
+        # Step 2d: Convert Doctor's Response to Speech (Text-to-Speech)
+        # The MP3 stays in memory; Gradio accepts the bytes directly, so no file is written.
+        logging.info("Generating doctor's voice...")
+        audio_bytes = synthesize_speech(analyze)
+        logging.info("Voice generation complete.")
+        return audio_bytes
+
+    return [
+        Stage("transcribe", transcribe, fallback=TRANSCRIPTION_ERROR_MESSAGE),
+        Stage("encode", encode, fallback=None),
+        Stage("analyze", analyze, deps=("transcribe", "encode"), fallback=ANALYSIS_ERROR_MESSAGE),
+        Stage("speak", speak, deps=("analyze",), fallback=None),
+    ]
+
+
+def remember_turn(session, patient_text, doctor_response):
+    """
+    Adds a completed turn to the session history (failed transcriptions are not remembered).
+    """
+    if session is not None and patient_text != TRANSCRIPTION_ERROR_MESSAGE:
+        session.add_turn(patient_text, doctor_response)
+
+
+def run_consultation(audio_filepath, image_filepath, transcript=None, session=None):
+    """
+    Runs the consultation stage graph and returns the full run, including per-stage timings.
+    """
+    new_trace_id()  # Ties together every log line of this consultation
+    run = run_stages(build_consultation_stages(audio_filepath, image_filepath, transcript, session))
+    record_run_metrics(run, "sync", audio_filepath)
+    logging.info(f"Stage timings: {run.summary()}")
+    logging.info(f"Provider pool stats: {pool_stats()}")
+    logging.info(f"TTS cache stats: {tts_cache.snapshot()}")
+    logging.info(f"Provider routers: {router_snapshot()}")
+    return run
+
+
+def record_run_metrics(run, pipeline, audio, partial=False):
+    """
+    Records stage durations, errors and payload sizes of one consultation.
+    """
+    observe_run(run, pipeline, partial)
+    try:
+        if isinstance(audio, (bytes, bytearray)):
+            payload_bytes.observe(len(audio), kind="audio_upload")
+        elif isinstance(audio, (str, os.PathLike)):
+            payload_bytes.observe(os.path.getsize(audio), kind="audio_upload")
+    except OSError:
+        pass
+    if run.results.get("speak"):
+        payload_bytes.observe(len(run.results["speak"]), kind="tts_audio")
+
+
+# Step 3: Main Function to Process Inputs
+def process_inputs(audio_filepath, image_filepath, transcript=None, session=None):
+    """
+    Processes audio and image inputs, generates a doctor's response, and converts it to speech.
+    
+    Args:
+        audio_filepath (str | bytes): The recording, as a file path or in memory.
+        image_filepath (str): Path to the uploaded image file.
+        transcript (str): Transcript already produced during live capture, if any.
+        session (ConsultationSession): Conversation state for follow-up questions, if any.
+    
+    Returns:
+        str: Transcribed text from the audio.
+        str: Doctor's response based on the analysis.
+        bytes: The doctor's voice as MP3 audio (None if speech synthesis failed).
+    """
+    run = run_consultation(audio_filepath, image_filepath, transcript, session)
+    return run.results["transcribe"], run.results["analyze"], run.results["speak"]
+
+
+# Step 3a: Async variant of process_inputs
+# Upstream calls run on the event loop through the per-provider scheduler, so a worker
+# is not tied up while a consultation waits on Groq or ElevenLabs.
+async def run_consultation_async(audio_filepath, image_filepath, transcript=None, session=None):
+    """
+    Async version of run_consultation with the same stages, fallbacks and timings.
+    Returns:
+        PipelineRun: Per-stage results, errors and timings.
+    """
+    new_trace_id()  # Ties together every log line of this consultation
+    run = PipelineRun()
+    pipeline_start = time.perf_counter()
+
+    async def stage(name, coroutine, fallback):
+        start = time.perf_counter()
+        try:
+            result = await coroutine
+        except Exception as e:
+            logging.error(f"Error during stage '{name}': {e}")
+            result = fallback
+            run.errors[name] = e
+        end = time.perf_counter()
+        run.results[name] = result
+        run.timings[name] = {
+            "start_ms": (start - pipeline_start) * 1000,
+            "end_ms": (end - pipeline_start) * 1000,
+            "duration_ms": (end - start) * 1000,
+        }
+        return result
+
+    async def transcribe():
+        if transcript is not None:
+            return transcript
+        if not audio_filepath:
+            return "No audio provided."
+        return await transcribe_audio_async(audio_filepath)
+
+    async def encode():
+        if session is not None:
+            return await asyncio.to_thread(session.use_image, image_filepath)
+        if not image_filepath:
+            return None
+        return await asyncio.to_thread(prepare_image, image_filepath)  # Pillow work stays off the event loop
+
+    async def analyze(transcript, prepared_image):
+        if prepared_image is None:
+            if image_filepath:
+                raise RuntimeError("Image could not be prepared for analysis.")
+            return NO_IMAGE_MESSAGE
+        patient_context = session.patient_context(transcript) if session is not None else transcript
+        doctor_response = await response_cache.get_or_compute_async(
+            vision_cache_key(prepared_image, patient_context, VISION_MODEL, system_prompt),
+            lambda: get_router("vision").call_async(
+                query=system_prompt + patient_context,
+                encoded_image=prepared_image.data,
+                mime_type=prepared_image.mime_type
+            )
+        )
+        remember_turn(session, transcript, doctor_response)
+        return doctor_response
+
+    async def speak(doctor_response):
+        return await synthesize_speech_async(doctor_response)
+
+    # Transcription and image preprocessing run concurrently
+    patient_text, prepared_image = await asyncio.gather(
+        stage("transcribe", transcribe(), TRANSCRIPTION_ERROR_MESSAGE),
+        stage("encode", encode(), None),
+    )
+    doctor_response = await stage("analyze", analyze(patient_text, prepared_image), ANALYSIS_ERROR_MESSAGE)
+    await stage("speak", speak(doctor_response), None)
+
+    run.wall_ms = (time.perf_counter() - pipeline_start) * 1000
+    record_run_metrics(run, "async", audio_filepath)
+    logging.info(f"Stage timings: {run.summary()}")
+    logging.info(f"Scheduler: {scheduler.snapshot()}")
+    return run
+
+
+async def process_inputs_async(audio_filepath, image_filepath, transcript=None, session=None):
+    """
+    Async version of process_inputs with the same outputs and error fallbacks.
+    """
+    run = await run_consultation_async(audio_filepath, image_filepath, transcript, session)
+    return run.results["transcribe"], run.results["analyze"], run.results["speak"]
+
+
+# Step 3b: Streaming variant of process_inputs
+def synthesize_sentence(sentence):
+    """
+    Converts one sentence of the doctor's response to speech.
+    Returns:
+        bytes: MP3 audio for this sentence.
+    """
+    return synthesize_speech(sentence)
+
+
+def process_inputs_streaming(audio_filepath, image_filepath, transcript=None, session=None):
+    """
+    Streams the doctor's response: tokens from the vision model are grouped into sentences,
+    and each sentence is sent to text-to-speech as soon as it is complete, so the first
+    audio is ready after roughly one sentence instead of after the whole response.
+
+    Yields:
+        tuple: (transcript, doctor's response so far, new MP3 audio chunk or None)
+    """
+    new_trace_id()  # Ties together every log line of this consultation
+    request_start = time.perf_counter()
+    stages = build_consultation_stages(audio_filepath, image_filepath, transcript, session)
+    # Transcription and image preprocessing still run concurrently before streaming starts
+    run = run_stages([stage for stage in stages if stage.name in ("transcribe", "encode")])
+    record_run_metrics(run, "streaming", audio_filepath, partial=True)  # The request duration is recorded at the end
+    transcript, prepared_image = run.results["transcribe"], run.results["encode"]
+    yield transcript, "", None
+
+    # A producer thread reads the token stream and starts TTS for every finished sentence;
+    # this generator forwards text updates and finished audio chunks (in order) as they happen.
+    events = queue.Queue()
+
+    def report_tokens(tokens):
+        partial = ""
+        for token in tokens:
+            partial += token
+            events.put(("partial", partial))
+            yield token
+
+    def start_tts(sentence):
+        future = _tts_executor.submit(contextvars.copy_context().run, synthesize_sentence, sentence)
+        future.add_done_callback(lambda _: events.put(("audio", None)))
+        return future
+
+    def produce():
+        try:
+            if prepared_image is None:
+                sentences = [ANALYSIS_ERROR_MESSAGE if image_filepath else NO_IMAGE_MESSAGE]
+            else:
+                patient_context = session.patient_context(transcript) if session is not None else transcript
+                cache_key = vision_cache_key(prepared_image, patient_context, VISION_MODEL, system_prompt)
+                cached_response = response_cache.lookup(cache_key)
+                if cached_response is not None:
+                    logging.info("Serving the doctor's response from the response cache.")
+                    tokens = iter([cached_response])
+                else:
+                    logging.info("Analyzing image (streaming)...")
+                    tokens = cache_stream(cache_key, get_router("vision").stream(
+                        query=system_prompt + patient_context,  # Combine system prompt with transcription
+                        encoded_image=prepared_image.data,
+                        mime_type=prepared_image.mime_type
+                    ))
+                sentences = split_sentences(report_tokens(tokens))
+            spoken = []
+            for sentence in sentences:
+                spoken.append(sentence)
+                events.put(("sentence", (sentence, start_tts(sentence))))
+            if prepared_image is not None:
+                remember_turn(session, transcript, " ".join(spoken))
+        except Exception as e:
+            events.put(("error", e))
+        finally:
+            events.put(("done", None))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+
+    doctor_response = ""
+    pending_audio = []  # TTS futures, in sentence order
+    first_audio = True
+    finished = False
+    while not finished or pending_audio:
+        kind, payload = events.get()
+        if kind == "partial":
+            doctor_response = payload.strip()
+        elif kind == "sentence":
+            sentence, future = payload
+            pending_audio.append(future)
+            if not doctor_response:
+                doctor_response = sentence
+        elif kind == "error":
+            logging.error(f"Error during streaming image analysis: {payload}")
+            if not doctor_response:
+                doctor_response = ANALYSIS_ERROR_MESSAGE
+                pending_audio.append(start_tts(doctor_response))
+        elif kind == "done":
+            finished = True
+            logging.info(f"Doctor's response: {doctor_response}")
+        if kind != "audio":
+            yield transcript, doctor_response, None
+        # Hand over every finished chunk without waiting for the rest of the response
+        while pending_audio and pending_audio[0].done():
+            audio_chunk = _audio_chunk(pending_audio.pop(0))
+            if audio_chunk:
+                if first_audio:
+                    time_to_first_audio.observe(time.perf_counter() - request_start)
+                    first_audio = False
+                payload_bytes.observe(len(audio_chunk), kind="tts_audio")
+                yield transcript, doctor_response, audio_chunk
+    request_duration.observe(time.perf_counter() - request_start, pipeline="streaming")
+
+
+def cache_stream(cache_key, tokens):
+    """
+    Passes a token stream through and stores the full response once it completed.
+    """
+    parts = []
+    for token in tokens:
+        parts.append(token)
+        yield token
+    response_cache.store(cache_key, "".join(parts).strip())
+
+
+def _audio_chunk(future):
+    try:
+        return future.result()
+    except Exception as e:
+        logging.error(f"Error during voice generation: {e}")
+        return None
+
+
+_tts_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tts")
+
+
+# Step 3c: Metrics read from existing statistics at scrape time
+def _cache_hits():
+    tts, vision = tts_cache.snapshot(), response_cache.counters()
+    return [
+        ({"cache": "tts", "tier": "memory"}, tts["memory_hits"]),
+        ({"cache": "tts", "tier": "disk"}, tts["disk_hits"]),
+        ({"cache": "image", "tier": "memory"}, image_preprocessing.cache_stats["hits"]),
+        ({"cache": "vision", "tier": "response"}, vision["hits"]),
+    ]
+
+
+def _cache_misses():
+    tts, vision = tts_cache.snapshot(), response_cache.counters()
+    return [
+        ({"cache": "tts"}, tts["misses"]),
+        ({"cache": "image"}, image_preprocessing.cache_stats["misses"]),
+        ({"cache": "vision"}, vision["misses"]),
+    ]
+
+
+# The response cache is read through counters(): its snapshot() also counts backend entries,
+# which is a SQLite COUNT(*) or a Redis keyspace scan and has no place in a scrape
+register(CallbackMetric("voicebot_cache_hits_total", "Cache hits by cache and tier.", _cache_hits, type_name="counter"))
+register(CallbackMetric("voicebot_cache_misses_total", "Cache misses by cache.", _cache_misses, type_name="counter"))
+register(CallbackMetric(
+    "voicebot_response_cache_coalesced_total", "Vision requests that shared an identical in-flight call.",
+    lambda: [({}, response_cache.counters()["coalesced"])],
+    type_name="counter",
+))
+register(CallbackMetric(
+    "voicebot_provider_connections_total", "Upstream connections by provider, new or reused from the pool.",
+    lambda: [
+        ({"provider": provider, "kind": kind}, stats[f"{kind}_connections"])
+        for provider, stats in pool_stats().items() for kind in ("new", "reused")
+    ],
+    type_name="counter",
+))
+register(CallbackMetric(
+    "voicebot_scheduler_queue_depth", "Async calls waiting for a provider slot.",
+    lambda: [({"provider": provider}, state["waiting"]) for provider, state in scheduler.snapshot().items()],
+))
+register(CallbackMetric(
+    "voicebot_router_latency_ewma_ms", "Rolling latency average used to rank each provider backend.",
+    lambda: [
+        ({"kind": kind, "backend": backend}, state["ewma_ms"])
+        for kind, backends in router_snapshot().items() for backend, state in backends.items()
+    ],
+))
+register(CallbackMetric(
+    "voicebot_router_breaker_open", "1 while a backend's circuit breaker is open or half-open.",
+    lambda: [
+        ({"kind": kind, "backend": backend}, int(state["breaker"] != "closed"))
+        for kind, backends in router_snapshot().items() for backend, state in backends.items()
+    ],
+))
+register(CallbackMetric(
+    "voicebot_sessions", "Conversation sessions alive in this process.",
+    lambda: [({}, session_registry.snapshot()["sessions"])],
+))
+register(CallbackMetric(
+    "voicebot_session_bytes", "Memory held by conversation sessions (images and turns).",
+    lambda: [({}, session_registry.snapshot()["bytes"])],
+))
+register(CallbackMetric(
+    "voicebot_sessions_evicted_total", "Sessions cleared for being idle or beyond SESSION_MAX_SESSIONS.",
+    lambda: [({}, session_registry.snapshot()["evicted_sessions"])],
+    type_name="counter",
+))
@@ -0,0 +1,218 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading session settings from the environment
+import time  # For idle tracking
+import uuid  # For session IDs in log lines
+import logging
+import threading  # For guarding sessions and the registry
+import weakref  # For tracking live sessions without keeping them alive
+from collections import namedtuple
+
+from image_preprocessing import prepare_image  # For encoding a session's image once
+
+# Step 1: Session settings
+# A session remembers the encoded image and the previous turns of one browser tab, so a
+# follow-up question ("Is it contagious?") can be asked without uploading the photo again.
+SESSION_HISTORY_TOKENS = int(os.environ.get("SESSION_HISTORY_TOKENS", "600"))  # Prompt budget for earlier turns
+SESSION_MAX_TURNS = int(os.environ.get("SESSION_MAX_TURNS", "20"))  # Turns kept per session
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", str(1024 * 1024)))  # Memory cap per session
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", "1800"))  # Idle sessions are cleared after this
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "500"))  # Least recently used sessions beyond this are cleared
+
+CHARS_PER_TOKEN = 4  # Rough estimate for English text; no tokenizer is needed
+EARLIER_QUESTION_WORDS = 20  # Older questions are kept as short excerpts once full turns no longer fit
+
+Turn = namedtuple("Turn", ["patient", "doctor"])
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in a text (about four characters per token).
+    """
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _excerpt(text, words=EARLIER_QUESTION_WORDS):
+    parts = (text or "").split()
+    return " ".join(parts[:words]) + (" ..." if len(parts) > words else "")
+
+
+# Step 2: Per-tab conversation state
+class ConsultationSession:
+    """
+    Conversation memory of one browser tab: the prepared image and previous turns.
+    Stored in a gr.State, so Gradio drops it when the tab is closed.
+    """
+
+    def __init__(self):
+        self.session_id = uuid.uuid4().hex[:12]
+        self.image_filepath = None
+        self.prepared_image = None
+        self.turns = []
+        self.last_active = time.monotonic()
+        self._lock = threading.Lock()
+        session_registry.add(self)
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def use_image(self, image_filepath):
+        """
+        Returns the prepared image for this turn. A newly uploaded image replaces the session
+        image; without an upload, the image of the earlier turns is reused without re-encoding.
+        Returns:
+            PreparedImage: The image to analyze, or None if the session has no image yet.
+        """
+        session_registry.maybe_evict()  # Before taking the lock: eviction clears other sessions
+        with self._lock:
+            self.touch()
+            if image_filepath and image_filepath != self.image_filepath:
+                self.prepared_image = prepare_image(image_filepath)
+                self.image_filepath = image_filepath
+                self._enforce_memory_cap()
+            return self.prepared_image
+
+    @property
+    def has_image(self):
+        return self.prepared_image is not None
+
+    def patient_context(self, transcript):
+        """
+        Builds the patient part of the prompt: earlier turns that fit in SESSION_HISTORY_TOKENS,
+        newest first in priority, followed by the current question. The first turn is just the
+        transcript, so its prompt (and response cache key) is the same as without a session.
+        """
+        with self._lock:
+            turns = list(self.turns)
+        if not turns:
+            return transcript
+
+        budget = SESSION_HISTORY_TOKENS
+        recent = []  # Full turns, newest first
+        for turn in reversed(turns):
+            line = f"Patient: {turn.patient}\nDoctor: {turn.doctor}"
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            recent.append(line)
+            budget -= cost
+
+        earlier = []  # Older turns compacted to short excerpts of the question
+        for turn in reversed(turns[:len(turns) - len(recent)]):
+            excerpt = _excerpt(turn.patient)
+            cost = estimate_tokens(excerpt) + 1
+            if cost > budget:
+                break
+            earlier.append(excerpt)
+            budget -= cost
+
+        sections = []
+        if earlier:
+            sections.append("Earlier questions: " + "; ".join(reversed(earlier)))
+        if recent:
+            sections.append("Previous conversation:\n" + "\n".join(reversed(recent)))
+        sections.append(f"Current question: {transcript}")
+        return "\n".join(sections)
+
+    def add_turn(self, patient, doctor):
+        """
+        Records a completed turn, keeping at most SESSION_MAX_TURNS turns and SESSION_MAX_BYTES.
+        """
+        session_registry.maybe_evict()
+        with self._lock:
+            self.touch()
+            self.turns.append(Turn(patient or "", doctor or ""))
+            del self.turns[:-SESSION_MAX_TURNS]
+            self._enforce_memory_cap()
+
+    def memory_bytes(self):
+        """
+        Approximate memory held by this session (image payload plus turn text).
+        """
+        image_bytes = len(self.prepared_image.data) if self.prepared_image is not None else 0
+        return image_bytes + sum(len(turn.patient) + len(turn.doctor) for turn in self.turns)
+
+    def _enforce_memory_cap(self):
+        while self.turns and self.memory_bytes() > SESSION_MAX_BYTES:
+            self.turns.pop(0)  # Oldest turns go first; the image is needed for follow-ups
+
+    def clear(self):
+        """
+        Forgets the image and all turns (new consultation, idle eviction or tab closed).
+        """
+        with self._lock:
+            self.image_filepath = None
+            self.prepared_image = None
+            self.turns = []
+
+
+# Step 3: Bounding memory across sessions
+class SessionRegistry:
+    """
+    Tracks live sessions so idle ones, and the least recently used ones beyond
+    SESSION_MAX_SESSIONS, can be cleared even if their tab never closes.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, idle_seconds=SESSION_IDLE_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._last_eviction = 0.0
+        self.evicted_sessions = 0
+
+    def add(self, session):
+        with self._lock:
+            self._sessions.add(session)
+        self.evict()
+
+    def discard(self, session):
+        """
+        Forgets a session whose gr.State was deleted (tab closed or time_to_live expired).
+        Gradio passes the stored value, which is None if the tab never submitted a question.
+        """
+        if session is None:
+            return
+        session.clear()
+        with self._lock:
+            self._sessions.discard(session)
+
+    def maybe_evict(self, interval=60.0):
+        if time.monotonic() - self._last_eviction >= interval:
+            self.evict()
+
+    def evict(self):
+        """
+        Clears sessions idle for longer than idle_seconds, then the least recently active
+        sessions until at most max_sessions hold data.
+        Returns:
+            int: Number of sessions cleared.
+        """
+        now = self._last_eviction = time.monotonic()
+        with self._lock:
+            sessions = [session for session in self._sessions if session.memory_bytes()]
+        sessions.sort(key=lambda s: s.last_active, reverse=True)
+        evicted = [
+            session for index, session in enumerate(sessions)
+            if now - session.last_active > self.idle_seconds or index >= self.max_sessions
+        ]
+        for session in evicted:
+            session.clear()  # The tab keeps its (now empty) session and starts over
+        if evicted:
+            self.evicted_sessions += len(evicted)
+            logging.info(f"Evicted {len(evicted)} conversation session(s).")
+        return len(evicted)
+
+    def snapshot(self):
+        with self._lock:
+            sessions = list(self._sessions)
+        return {
+            "sessions": len(sessions),
+            "bytes": sum(session.memory_bytes() for session in sessions),
+            "evicted_sessions": self.evicted_sessions,
+        }
+
+
+session_registry = SessionRegistry()
@@ -2,11 +2,18 @@
 from dotenv import load_dotenv 
 load_dotenv()  
 
+import io  # For in-memory audio buffers
 import os  # For interacting with the operating system
-from gtts import gTTS  # Google Text-to-Speech library
-from elevenlabs.client import ElevenLabs  # ElevenLabs TTS generation
+import time  # For measuring synthesis latency
+import asyncio  # For the async synthesis path
+import logging
+from provider_clients import get_elevenlabs_client, get_async_elevenlabs_client  # Shared, pooled ElevenLabs clients
+from scheduler import scheduler  # Per-provider concurrency and rate limits for async calls
 import subprocess  # For playing audio files
 import platform  # For detecting the operating system
+import shutil  # For finding an installed audio player
+from tts_cache import tts_cache, TTS_CACHE_ENABLED  # Content-addressed cache of synthesized audio
+from provider_router import get_router  # Failover and hedging across TTS backends
 
 # Step 1a: Setup Text-to-Speech (TTS) model with gTTS
 def text_to_speech_with_gtts_old(input_text, output_filepath):
@@ -24,6 +31,7 @@ def text_to_speech_with_gtts_old(input_text, output_filepath):
     language = "en"  # Language for TTS
     try:
         print(f"Creating gTTS object with text: {input_text}")
+        from gtts import gTTS  # Imported on first use; only the gTTS path needs it
         audioobj = gTTS(
             text=input_text,
             lang=language,
@@ -47,13 +55,11 @@ def text_to_speech_with_elevenlabs_old(input_text, output_filepath):
     ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")  # Retrieve API key
     if not ELEVENLABS_API_KEY:
         raise ValueError("ELEVENLABS_API_KEY is missing. Please check your .env file.")
-    
-    from elevenlabs.client import ElevenLabs  # Import the ElevenLabs client
 
     print("Starting ElevenLabs TTS conversion...")
     try:
-        # Initialize the ElevenLabs client
-        client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+        # Reuse the shared ElevenLabs client
+        client = get_elevenlabs_client(ELEVENLABS_API_KEY)
         
         # Generate audio
         audio = client.generate(
@@ -82,91 +88,298 @@ def text_to_speech_with_elevenlabs_old(input_text, output_filepath):
 # output_filepath = "elevenlabs_testing.mp3"
 # text_to_speech_with_elevenlabs_old(input_text, output_filepath=output_filepath)
 
-# Step 2: Use Model for Text Output to Voice with Autoplay
-def text_to_speech_with_gtts(input_text, output_filepath):
+# Step 2: Pure synthesis API used by the web app
+# These functions only produce audio (bytes or a file). They never play it, so a
+# server worker is released as soon as synthesis finishes.
+ELEVENLABS_VOICE = "Aria"  # Voice model
+ELEVENLABS_MODEL = "eleven_turbo_v2"  # Model version
+
+# ElevenLabs looks a voice name up with an extra GET /v1/voices on every request;
+# resolving each name once and passing the id saves that round trip.
+_voice_ids = {}
+
+
+def _voice_id(client, voice):
+    if voice not in _voice_ids:
+        voices = client.voices.get_all(show_legacy=True).voices
+        _voice_ids[voice] = next((v.voice_id for v in voices if v.name == voice), voice)
+    return _voice_ids[voice]
+
+
+async def _voice_id_async(client, voice):
+    if voice not in _voice_ids:
+        voices = (await client.voices.get_all(show_legacy=True)).voices
+        _voice_ids[voice] = next((v.voice_id for v in voices if v.name == voice), voice)
+    return _voice_ids[voice]
+
+
+def synthesize_with_gtts(input_text, language="en", use_cache=True):
     """
-    Converts text to speech using gTTS, saves the audio file, and plays it automatically.
+    Converts text to speech using gTTS.
     Args:
         input_text (str): The text to convert to speech.
-        output_filepath (str): The path to save the generated audio file.
+        language (str): Language for TTS.
+        use_cache (bool): Serve repeated phrases from the TTS cache.
+    Returns:
+        bytes: MP3 audio.
     """
-    language = "en"  # Language for TTS
-    audioobj = gTTS(
-        text=input_text,
-        lang=language,
-        slow=False  # Normal speed
-    )
-    audioobj.save(output_filepath)  # Save the audio file
-    
-    # Play the audio file based on the operating system
-    os_name = platform.system()
-    try:
-        if os_name == "Darwin":  # macOS
-            subprocess.run(['afplay', output_filepath])
-        elif os_name == "Windows":  # Windows
-            subprocess.run(['powershell', '-c', f'(New-Object Media.SoundPlayer "{output_filepath}").PlaySync();'])
-        elif os_name == "Linux":  # Linux
-            subprocess.run(['aplay', output_filepath])  # Alternative: use 'mpg123' or 'ffplay'
-        else:
-            raise OSError("Unsupported operating system")
-    except Exception as e:
-        print(f"An error occurred while trying to play the audio: {e}")
-
+    def generate():
+        from gtts import gTTS  # Imported on first use; only the gTTS path needs it
+        audioobj = gTTS(
+            text=input_text,
+            lang=language,
+            slow=False  # Normal speed
+        )
+        buffer = io.BytesIO()
+        audioobj.write_to_fp(buffer)
+        return buffer.getvalue()
 
-# Example usage for gTTS with autoplay (uncomment to test)
-# input_text = "Hi, How have you been, autoplay testing!"
-# text_to_speech_with_gtts(input_text=input_text, output_filepath="gtts_testing_autoplay.mp3")
+    if not (use_cache and TTS_CACHE_ENABLED):
+        return generate()
+    return tts_cache.get_or_synthesize(input_text, "gtts", language, None, generate)
 
 
-def text_to_speech_with_elevenlabs(input_text, output_filepath):
+def synthesize_with_elevenlabs(input_text, voice=ELEVENLABS_VOICE, model=ELEVENLABS_MODEL, use_cache=True):
     """
-    Converts text to speech using ElevenLabs, saves the audio file, and plays it automatically.
+    Converts text to speech using ElevenLabs.
     Args:
         input_text (str): The text to convert to speech.
-        output_filepath (str): The path to save the generated audio file.
+        voice (str): ElevenLabs voice name.
+        model (str): ElevenLabs model id.
+        use_cache (bool): Serve repeated phrases from the TTS cache.
+    Returns:
+        bytes: MP3 audio.
     """
     ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")  # Retrieve API key
     if not ELEVENLABS_API_KEY:
         raise ValueError("ELEVENLABS_API_KEY is missing. Please check your .env file.")
-    
-    print("Starting ElevenLabs TTS conversion...")
-    try:
-        # Initialize the ElevenLabs client
-        client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-        
-        # Generate audio
+
+    def generate():
+        # Reuse the shared ElevenLabs client
+        client = get_elevenlabs_client(ELEVENLABS_API_KEY)
         audio = client.generate(
             text=input_text,
-            voice="Aria",  # Voice model
-            model="eleven_turbo_v2"  # Model version
+            voice=_voice_id(client, voice),
+            model=model
         )
-        print(f"Saving audio file to {output_filepath}...")
-        
-        # Save the audio file
-        with open(output_filepath, "wb") as f:
-            for chunk in audio:
-                f.write(chunk)  # Write audio chunks to the file
-        print("Audio file saved successfully.")
-    except Exception as e:
-        print(f"An error occurred during ElevenLabs TTS conversion: {e}")
-        return
+        return b"".join(audio)  # Collect the streamed audio chunks
+
+    if not (use_cache and TTS_CACHE_ENABLED):
+        return generate()
+    return tts_cache.get_or_synthesize(input_text, "elevenlabs", voice, model, generate)
 
-    # Play the audio file based on the operating system
+
+async def synthesize_with_elevenlabs_async(input_text, voice=ELEVENLABS_VOICE, model=ELEVENLABS_MODEL, use_cache=True):
+    """
+    Async version of synthesize_with_elevenlabs using the shared AsyncElevenLabs client.
+    Calls are queued through the per-provider scheduler; cache lookups run off the event loop.
+    Returns:
+        bytes: MP3 audio.
+    """
+    ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")  # Retrieve API key
+    if not ELEVENLABS_API_KEY:
+        raise ValueError("ELEVENLABS_API_KEY is missing. Please check your .env file.")
+
+    use_cache = use_cache and TTS_CACHE_ENABLED
+    if use_cache:
+        cached = await asyncio.to_thread(tts_cache.lookup, input_text, "elevenlabs", voice, model)
+        if cached is not None:
+            return cached
+
+    async def generate():
+        client = get_async_elevenlabs_client(ELEVENLABS_API_KEY)
+        audio = await client.generate(
+            text=input_text,
+            voice=await _voice_id_async(client, voice),
+            model=model
+        )
+        return b"".join([chunk async for chunk in audio])
+
+    start = time.perf_counter()
+    audio_bytes = await scheduler.run("elevenlabs", generate)
+    if use_cache:
+        await asyncio.to_thread(
+            tts_cache.store, input_text, "elevenlabs", voice, model, audio_bytes, time.perf_counter() - start
+        )
+    return audio_bytes
+
+
+def prewarm_tts_cache(messages, provider="elevenlabs"):
+    """
+    Synthesizes fixed messages (e.g. fallback responses) into the TTS cache ahead of time.
+    Args:
+        messages (list[str]): Texts to synthesize.
+        provider (str): "elevenlabs" or "gtts".
+    """
+    if provider == "gtts":
+        tts_cache.prewarm(messages, "gtts", "en", None, lambda text: synthesize_with_gtts(text, use_cache=False))
+    else:
+        tts_cache.prewarm(
+            messages, "elevenlabs", ELEVENLABS_VOICE, ELEVENLABS_MODEL,
+            lambda text: synthesize_with_elevenlabs(text, use_cache=False)
+        )
+    logging.info(f"TTS cache prewarmed: {tts_cache.snapshot()}")
+
+
+def _save_audio(audio_bytes, output_filepath):
+    with open(output_filepath, "wb") as f:
+        f.write(audio_bytes)
+
+
+def text_to_speech_with_gtts(input_text, output_filepath, play=False):
+    """
+    Converts text to speech using gTTS and saves the audio file.
+    Args:
+        input_text (str): The text to convert to speech.
+        output_filepath (str): The path to save the generated audio file.
+        play (bool): Also play the file locally in the background (CLI use only).
+    """
+    _save_audio(synthesize_with_gtts(input_text), output_filepath)
+    if play:
+        play_audio(output_filepath)
+
+
+async def text_to_speech_with_elevenlabs_async(input_text, output_filepath):
+    """
+    Async version of text_to_speech_with_elevenlabs (no playback).
+    """
+    audio_bytes = await synthesize_with_elevenlabs_async(input_text)
+    await asyncio.to_thread(_save_audio, audio_bytes, output_filepath)
+
+
+def text_to_speech_with_elevenlabs(input_text, output_filepath, play=False):
+    """
+    Converts text to speech using ElevenLabs and saves the audio file.
+    Args:
+        input_text (str): The text to convert to speech.
+        output_filepath (str): The path to save the generated audio file.
+        play (bool): Also play the file locally in the background (CLI use only).
+    """
+    logging.info("Starting ElevenLabs TTS conversion...")
+    audio_bytes = synthesize_with_elevenlabs(input_text)
+    logging.info(f"Saving audio file to {output_filepath}...")
+    _save_audio(audio_bytes, output_filepath)
+    logging.info("Audio file saved successfully.")
+    if play:
+        play_audio(output_filepath)
+
+
+# Step 2b: Routed text-to-speech
+# Tries the backends in TTS_BACKENDS (default: ElevenLabs, then gTTS as a fallback),
+# with failover, hedging and circuit breakers (see provider_router.py).
+# The TTS cache is checked here, before routing, so cache hits never count as backend
+# latency. Audio from a fallback-only backend (gTTS) is not cached, so a phrase is voiced
+# by the preferred voice again once it recovers.
+# The audio stays in memory; only text_to_speech() writes a file.
+def _cached_speech(router, input_text):
+    for backend in router.backends:
+        if backend.cache_key and not backend.fallback_only:
+            audio = tts_cache.lookup(input_text, *backend.cache_key)
+            if audio is not None:
+                return audio
+    return None
+
+
+def _store_speech(backend, input_text, audio_bytes, synthesis_seconds):
+    if backend.cache_key and not backend.fallback_only:
+        tts_cache.store(input_text, *backend.cache_key, audio_bytes, synthesis_seconds)
+
+
+def synthesize_speech(input_text):
+    """
+    Converts text to speech with the fastest healthy TTS backend, served from the TTS cache when possible.
+    Returns:
+        bytes: MP3 audio.
+    Raises:
+        AllBackendsFailed: If every backend failed.
+    """
+    router = get_router("tts")
+    if not TTS_CACHE_ENABLED:
+        return router.call(text=input_text)
+    cached = _cached_speech(router, input_text)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    audio_bytes, backend = router.call_with_backend(text=input_text)
+    _store_speech(backend, input_text, audio_bytes, time.perf_counter() - start)
+    return audio_bytes
+
+
+async def synthesize_speech_async(input_text):
+    """
+    Async version of synthesize_speech; cache lookups run off the event loop.
+    """
+    router = get_router("tts")
+    if not TTS_CACHE_ENABLED:
+        return await router.call_async(text=input_text)
+    cached = await asyncio.to_thread(_cached_speech, router, input_text)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    audio_bytes, backend = await router.call_with_backend_async(text=input_text)
+    await asyncio.to_thread(_store_speech, backend, input_text, audio_bytes, time.perf_counter() - start)
+    return audio_bytes
+
+
+def text_to_speech(input_text, output_filepath):
+    """
+    Converts text to speech with the fastest healthy TTS backend and saves the audio file.
+    Args:
+        input_text (str): The text to convert to speech.
+        output_filepath (str): The path to save the generated audio file.
+    """
+    _save_audio(synthesize_speech(input_text), output_filepath)
+
+
+# Step 3: Opt-in local playback (CLI only)
+def _player_command(filepath):
     os_name = platform.system()
+    if os_name == "Darwin":  # macOS
+        return ['afplay', filepath]
+    if os_name == "Windows":  # Windows
+        return ['powershell', '-c', f'(New-Object Media.SoundPlayer "{filepath}").PlaySync();']
+    if os_name == "Linux":  # Linux: aplay cannot decode MP3, so use an MP3-capable player
+        for player in (['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet'], ['mpg123', '-q']):
+            if shutil.which(player[0]):
+                return player + [filepath]
+        raise OSError("No MP3 player found. Install ffmpeg (ffplay) or mpg123.")
+    raise OSError("Unsupported operating system")
+
+
+def play_audio(filepath, wait=False):
+    """
+    Plays an audio file on the local machine in a background process.
+    Args:
+        filepath (str): The audio file to play.
+        wait (bool): Block until playback has finished.
+    Returns:
+        subprocess.Popen: The player process, or None if playback could not start.
+    """
     try:
-        print("Playing audio file...")
-        if os_name == "Darwin":  # macOS
-            subprocess.run(['afplay', output_filepath])
-        elif os_name == "Windows":  # Windows
-            subprocess.run(['powershell', '-c', f'(New-Object Media.SoundPlayer "{output_filepath}").PlaySync();'])
-        elif os_name == "Linux":  # Linux
-            subprocess.run(['aplay', output_filepath])  # Alternative: use 'mpg123' or 'ffplay'
-        else:
-            raise OSError("Unsupported operating system")
-        print("Audio playback complete.")
+        process = subprocess.Popen(_player_command(filepath), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     except Exception as e:
         print(f"An error occurred while trying to play the audio: {e}")
+        return None
+    if wait:
+        process.wait()
+    return process
 
-# Example usage for ElevenLabs with autoplay (uncomment to test)
-# input_text = "Hi, How have you been, autoplay testing!"
-# text_to_speech_with_elevenlabs(input_text, output_filepath="elevenlabs_testing_autoplay.mp3")
\ No newline at end of file
+
+# Example usage from the command line:
+# python doctor_voice_tts.py "Hi, How have you been, autoplay testing!" --provider gtts --play
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert text to the doctor's voice.")
+    parser.add_argument("text", help="Text to convert to speech")
+    parser.add_argument("--provider", choices=["elevenlabs", "gtts"], default="elevenlabs")
+    parser.add_argument("--output", default="doctor_voice_testing.mp3", help="Where to save the audio file")
+    parser.add_argument("--play", action="store_true", help="Play the audio after synthesis")
+    args = parser.parse_args()
+
+    if args.provider == "gtts":
+        text_to_speech_with_gtts(args.text, args.output)
+    else:
+        text_to_speech_with_elevenlabs(args.text, args.output)
+    if args.play:
+        play_audio(args.output, wait=True)  # Keep the CLI alive until playback ends
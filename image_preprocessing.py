@@ -0,0 +1,148 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading preprocessing settings from the environment
+import io  # For encoding images in memory
+import base64  # For encoding images into base64 format
+import hashlib  # For content-addressed caching
+import threading  # For guarding the encoded-image cache
+from collections import OrderedDict, namedtuple
+
+from PIL import Image, ImageOps  # Pillow for decoding, orienting and resizing images
+
+# Step 1: Preprocessing settings
+# The vision model does not need a 12 MP photo; a ~1024px edge keeps the
+# clinically relevant detail while shrinking the upload by an order of magnitude.
+IMAGE_MAX_EDGE = int(os.environ.get("IMAGE_MAX_EDGE", "1024"))  # Longest edge in pixels
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(300 * 1024)))  # Upper bound for the encoded image
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))  # Starting quality, lowered until under IMAGE_MAX_BYTES
+IMAGE_MIN_QUALITY = 40  # Below this the image is downscaled further instead
+IMAGE_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", "64"))  # Number of encoded images kept in memory
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# Result of preprocessing one image
+PreparedImage = namedtuple(
+    "PreparedImage",
+    ["data", "mime_type", "width", "height", "original_bytes", "encoded_bytes", "content_hash"],
+)
+
+
+# Step 2: Encoding helpers
+def _to_rgb(image):
+    """
+    Flattens transparency onto a white background so the image can be saved as JPEG.
+    """
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert("RGB")
+
+
+def _encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _encode_bounded(image, image_format, max_bytes):
+    """
+    Encodes the image, lowering quality and then resolution until it fits in max_bytes.
+    """
+    quality = IMAGE_QUALITY
+    while True:
+        encoded = _encode(image, image_format, quality)
+        if len(encoded) <= max_bytes:
+            return encoded, image
+        if quality > IMAGE_MIN_QUALITY:
+            quality -= 10
+            continue
+        if max(image.size) <= 256:
+            return encoded, image  # Give up shrinking; the image is already tiny
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.LANCZOS)
+
+
+# Step 3: Content-addressed cache of encoded images
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0}
+
+
+def prepare_image(image_path, max_edge=None, image_format=None, max_bytes=None):
+    """
+    Orients, downscales and re-encodes an image, returning a base64 payload for the vision model.
+    Results are cached by content hash, so re-submitting the same photo is free.
+    Args:
+        image_path (str): Path to the uploaded image file.
+        max_edge (int): Longest edge in pixels after downscaling.
+        image_format (str): Output format, "JPEG" or "WEBP".
+        max_bytes (int): Upper bound for the encoded image size.
+    Returns:
+        PreparedImage: base64 data, MIME type, dimensions and before/after sizes.
+    """
+    max_edge = max_edge or IMAGE_MAX_EDGE
+    image_format = (image_format or IMAGE_FORMAT).upper()
+    max_bytes = max_bytes or IMAGE_MAX_BYTES
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {image_format}")
+
+    with open(image_path, "rb") as image_file:
+        raw = image_file.read()
+    content_hash = hashlib.sha256(raw).hexdigest()
+    cache_key = (content_hash, max_edge, image_format, max_bytes)
+
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+        if cached is not None:
+            _cache.move_to_end(cache_key)
+            cache_stats["hits"] += 1
+            return cached
+        cache_stats["misses"] += 1
+
+    with Image.open(io.BytesIO(raw)) as image:
+        source_format = image.format
+        source_size = image.size
+        # An upright, already compact upload in a format the model accepts can be sent as-is.
+        passthrough_ok = (
+            source_format in MIME_TYPES
+            and image.getexif().get(0x0112, 1) == 1  # EXIF orientation tag
+            and len(raw) <= max_bytes
+        )
+        if passthrough_ok and max(source_size) <= max_edge:
+            encoded, output_format, (width, height) = raw, source_format, source_size
+        else:
+            image.draft("RGB", (max_edge, max_edge))  # Lets the JPEG decoder downscale while decoding
+            image = ImageOps.exif_transpose(image)  # Apply EXIF orientation before resizing
+            image = _to_rgb(image)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)  # Keeps aspect ratio, never upscales
+            encoded, image = _encode_bounded(image, image_format, max_bytes)
+            output_format, (width, height) = image_format, image.size
+            if passthrough_ok and len(encoded) >= len(raw):
+                # Re-encoding did not pay off (e.g. a well-compressed WebP); keep the original.
+                encoded, output_format, (width, height) = raw, source_format, source_size
+
+    prepared = PreparedImage(
+        data=base64.b64encode(encoded).decode("utf-8"),
+        mime_type=MIME_TYPES[output_format],
+        width=width,
+        height=height,
+        original_bytes=len(raw),
+        encoded_bytes=len(encoded),
+        content_hash=content_hash,
+    )
+
+    with _cache_lock:
+        _cache[cache_key] = prepared
+        _cache.move_to_end(cache_key)
+        while len(_cache) > IMAGE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return prepared
+
+
+# Example usage (uncomment to test)
+# prepared = prepare_image("acne.webp")
+# print(prepared.mime_type, prepared.original_bytes, prepared.encoded_bytes)
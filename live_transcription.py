@@ -0,0 +1,215 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading live-capture settings from the environment
+import time  # For measuring how long the final transcript takes after the patient stops
+import logging
+import threading  # For guarding the segment buffer
+import contextvars  # For carrying the trace ID into transcription threads
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np  # For buffering, downmixing and resampling audio windows
+
+from audio_preprocessing import AUDIO_SAMPLE_RATE, AUDIO_FORMAT, AUDIO_VAD_FRAME_MS, frame_dbfs, speech_bounds, encode_samples
+from patient_query import transcribe_audio_bytes, transcribe_chunk, join_transcripts  # STT for one in-memory segment
+from metrics import stage_duration  # For the time between end of speech and the final transcript
+
+# Step 1: Live capture settings
+# Audio arrives in small windows while the patient talks. Once a pause follows enough
+# speech, the buffered segment is sent to Whisper in the background, so by the time the
+# patient stops only the last few seconds are still being transcribed.
+LIVE_MIN_SEGMENT_SECONDS = float(os.environ.get("LIVE_MIN_SEGMENT_SECONDS", "4"))  # Speech before a pause may cut
+LIVE_MAX_SEGMENT_SECONDS = float(os.environ.get("LIVE_MAX_SEGMENT_SECONDS", "15"))  # Forced cut without a pause
+LIVE_PAUSE_MS = int(os.environ.get("LIVE_PAUSE_MS", "400"))  # Trailing silence that ends a segment
+LIVE_TRANSCRIPTION_WORKERS = int(os.environ.get("LIVE_TRANSCRIPTION_WORKERS", "8"))
+
+_segment_executor = ThreadPoolExecutor(max_workers=LIVE_TRANSCRIPTION_WORKERS, thread_name_prefix="live-stt")
+
+
+def to_mono_16k(samples, sample_rate):
+    """
+    Converts one window of microphone audio (int16 or float, mono or interleaved
+    channels as a 2-D array) to 16 kHz mono int16.
+    """
+    samples = np.asarray(samples)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    if samples.dtype.kind == "f":
+        samples = samples * 32767.0
+    samples = samples.astype(np.float64)
+    if sample_rate != AUDIO_SAMPLE_RATE and samples.size:
+        target_length = int(round(samples.size * AUDIO_SAMPLE_RATE / sample_rate))
+        positions = np.linspace(0, samples.size - 1, target_length)
+        samples = np.interp(positions, np.arange(samples.size), samples)
+    return np.clip(np.round(samples), -32768, 32767).astype(np.int16)
+
+
+# Step 2: Incremental transcriber
+class LiveTranscription:
+    """
+    Buffers microphone audio and transcribes finished segments while recording continues.
+    Args:
+        stt_model (str): Pins every segment to this Groq Whisper model; by default segments go
+            through the STT router (STT_BACKENDS) with failover and hedging.
+        transcribe (callable): Called as transcribe((file name, bytes)) -> text; overrides stt_model.
+    """
+
+    def __init__(self, stt_model=None, transcribe=None):
+        self.stt_model = stt_model
+        if transcribe is None and stt_model:
+            transcribe = lambda chunk: transcribe_audio_bytes(stt_model, chunk)  # noqa: E731
+        self.transcribe = transcribe or transcribe_chunk
+        self.frame_length = AUDIO_SAMPLE_RATE * AUDIO_VAD_FRAME_MS // 1000
+        self._buffer = np.zeros(0, dtype=np.int16)  # Audio not yet sent to Whisper; sent audio is not kept
+        self._recorded_samples = 0
+        self._segments = []  # Transcription futures, in speaking order
+        self._lock = threading.Lock()  # Guards the buffer and segment list
+        self._finish_lock = threading.Lock()
+        self._closed = False
+        self._final = None
+        self.finalize_ms = None  # Time from finish() to the final transcript
+
+    def add_audio(self, samples, sample_rate):
+        """
+        Adds one window of microphone audio and starts transcribing a segment if one is complete.
+        """
+        window = to_mono_16k(samples, sample_rate)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Audio added after the live transcription was finished.")
+            self._recorded_samples += window.size
+            self._buffer = np.concatenate([self._buffer, window])
+            self._cut_segments()
+
+    def _cut_segments(self):
+        min_samples = int(LIVE_MIN_SEGMENT_SECONDS * AUDIO_SAMPLE_RATE)
+        max_samples = int(LIVE_MAX_SEGMENT_SECONDS * AUDIO_SAMPLE_RATE)
+        pause_frames = max(1, LIVE_PAUSE_MS // AUDIO_VAD_FRAME_MS)
+        while self._buffer.size >= min_samples:
+            levels = frame_dbfs(self._buffer, self.frame_length)
+            bounds = speech_bounds(levels)
+            if bounds is not None and len(levels) - 1 - bounds[1] >= pause_frames:
+                cut = self._buffer.size  # Speech followed by a pause: send everything buffered
+            elif self._buffer.size >= max_samples:
+                # No pause yet; cut at the quietest frame of the second half of the buffer
+                half = len(levels) // 2
+                cut = (half + int(np.argmin(levels[half:]))) * self.frame_length
+            else:
+                return
+            self._submit(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+
+    def _submit(self, segment):
+        if speech_bounds(frame_dbfs(segment, self.frame_length)) is None:
+            return  # Silence only; nothing for Whisper to do
+        chunk = (f"live_{len(self._segments)}.{AUDIO_FORMAT}", encode_samples(segment, AUDIO_SAMPLE_RATE, AUDIO_FORMAT))
+        context = contextvars.copy_context()  # Segment log lines keep the request's trace ID
+        self._segments.append(_segment_executor.submit(context.run, self.transcribe, chunk))
+
+    def partial_transcript(self):
+        """
+        Returns the text of the segments transcribed so far, in speaking order.
+        """
+        with self._lock:
+            segments = list(self._segments)
+        texts = []
+        for future in segments:
+            if not future.done():
+                break  # Later segments are shown once everything before them is ready
+            texts.append(_segment_text(future))
+        return join_transcripts(texts)
+
+    def finish(self):
+        """
+        Sends the remaining audio and waits for every segment.
+        Safe to call more than once; later calls return the same transcript.
+        Returns:
+            str: The full transcript.
+        """
+        with self._finish_lock:  # Concurrent callers wait for the first one's transcript
+            if self._final is not None:
+                return self._final
+            with self._lock:
+                start = time.perf_counter()
+                self._closed = True
+                if self._buffer.size:
+                    self._submit(self._buffer)
+                    self._buffer = np.zeros(0, dtype=np.int16)
+                segments = list(self._segments)
+            # Waited for without holding the lock, so partial_transcript() is never blocked
+            self._final = join_transcripts(_segment_text(future) for future in segments)
+            self.finalize_ms = (time.perf_counter() - start) * 1000
+        stage_duration.observe(self.finalize_ms / 1000, pipeline="live", stage="finalize")
+        logging.info(f"Live transcription finished ({len(segments)} segment(s)); "
+                     f"final transcript ready {self.finalize_ms:.0f} ms after the patient stopped.")
+        return self._final
+
+    @property
+    def recorded_seconds(self):
+        return self._recorded_samples / AUDIO_SAMPLE_RATE
+
+
+def _segment_text(future):
+    try:
+        return future.result()
+    except Exception as e:
+        logging.error(f"An error occurred during live transcription: {e}")
+        return ""
+
+
+# Step 3: Command-line capture from the microphone
+def transcribe_microphone(window_seconds=0.5, stop_after_silence=2.0, max_seconds=120):
+    """
+    Records from the default microphone in fixed-size windows, printing the partial
+    transcript as segments complete. Stops after `stop_after_silence` seconds of silence
+    (once speech has started), after `max_seconds`, or on Ctrl+C.
+    Requires `speech_recognition` and PyAudio.
+    Returns:
+        str: The full transcript.
+    """
+    import speech_recognition as sr
+
+    live = LiveTranscription()
+    recognizer = sr.Recognizer()
+    shown = ""
+    with sr.Microphone() as source:
+        logging.info("Adjusting for ambient noise...")
+        recognizer.adjust_for_ambient_noise(source, duration=1)
+        logging.info("Start speaking now (Ctrl+C to stop)...")
+        frames_per_window = int(source.SAMPLE_RATE * window_seconds)
+        silent_seconds, heard_speech, start = 0.0, False, time.monotonic()
+        try:
+            while time.monotonic() - start < max_seconds:
+                data = source.stream.read(frames_per_window)
+                samples = np.frombuffer(data, dtype=f"<i{source.SAMPLE_WIDTH}")
+                live.add_audio(samples, source.SAMPLE_RATE)
+
+                is_speech = speech_bounds(frame_dbfs(to_mono_16k(samples, source.SAMPLE_RATE), live.frame_length)) is not None
+                heard_speech = heard_speech or is_speech
+                silent_seconds = 0.0 if is_speech else silent_seconds + window_seconds
+                if heard_speech and silent_seconds >= stop_after_silence:
+                    break
+
+                partial = live.partial_transcript()
+                if partial != shown:
+                    print(f"... {partial}")
+                    shown = partial
+        except KeyboardInterrupt:
+            pass
+    return live.finish()
+
+
+if __name__ == "__main__":
+    import argparse
+    from metrics import configure_logging
+
+    parser = argparse.ArgumentParser(description="Transcribe the microphone while you speak.")
+    parser.add_argument("--window", type=float, default=0.5, help="Capture window in seconds")
+    parser.add_argument("--stop-after-silence", type=float, default=2.0, help="Seconds of silence that end the recording")
+    parser.add_argument("--max-seconds", type=float, default=120, help="Longest recording")
+    args = parser.parse_args()
+
+    configure_logging()
+    transcript = transcribe_microphone(args.window, args.stop_after_silence, args.max_seconds)
+    print(f"Transcription: {transcript}")
@@ -0,0 +1,265 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import io  # For in-memory audio buffers
+import os  # For reading local model settings from the environment
+import time  # For measuring load times
+import wave  # For building WAV files from synthesized samples
+import queue  # For handing requests to the inference threads
+import asyncio
+import logging
+import threading  # For the dedicated inference threads
+from concurrent.futures import Future
+
+from provider_router import Backend, backend_spec, get_router
+from metrics import CallbackMetric, register  # For request count reporting
+
+# Step 1: Local model settings
+# Optional on-CPU backends for when the network is slow or down. They are used by listing
+# "local" in STT_BACKENDS / TTS_BACKENDS and need `faster-whisper` (speech-to-text) and
+# `piper-tts` plus a voice model (text-to-speech); neither is required otherwise.
+LOCAL_WHISPER_MODEL = os.environ.get("LOCAL_WHISPER_MODEL", "base.en")  # faster-whisper model name or path
+LOCAL_WHISPER_COMPUTE_TYPE = os.environ.get("LOCAL_WHISPER_COMPUTE_TYPE", "int8")  # Quantized weights for CPU
+LOCAL_WHISPER_BEAM_SIZE = int(os.environ.get("LOCAL_WHISPER_BEAM_SIZE", "1"))  # Greedy decoding is much faster on CPU
+LOCAL_CPU_THREADS = int(os.environ.get("LOCAL_CPU_THREADS", "0"))  # Threads per model (0 = library default)
+LOCAL_TTS_VOICE = os.environ.get("LOCAL_TTS_VOICE")  # Path to a Piper voice (.onnx)
+LOCAL_BATCH_MAX = int(os.environ.get("LOCAL_BATCH_MAX", "8"))  # 30-second windows of one long recording decoded together
+LOCAL_STT_EXPECTED_MS = float(os.environ.get("LOCAL_STT_EXPECTED_MS", "4000"))  # Latency prior until measured
+LOCAL_TTS_EXPECTED_MS = float(os.environ.get("LOCAL_TTS_EXPECTED_MS", "2000"))
+
+SAMPLE_RATE = 16000  # Whisper's input rate
+WINDOW_SECONDS = 30  # Whisper's window; only longer recordings gain from the batched pipeline
+
+
+# Step 2: Dedicated inference thread
+class InferenceWorker:
+    """
+    Runs a model on its own thread, one request at a time, so inference never occupies the
+    pipeline or router pools and requests are never mixed.
+    Args:
+        name (str): Thread name.
+        run (callable): Takes one item and returns its result.
+    """
+
+    def __init__(self, name, run):
+        self.run = run
+        self.requests = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True, name=name).start()
+
+    def submit(self, item):
+        """
+        Queues one item.
+        Returns:
+            concurrent.futures.Future: Resolves to the item's result.
+        """
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def call(self, item):
+        return self.submit(item).result()
+
+    async def call_async(self, item):
+        # Waits without holding a thread; a cancelled caller's item is still processed
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _loop(self):
+        while True:
+            item, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.requests += 1
+            try:
+                future.set_result(self.run(item))
+            except Exception as e:
+                future.set_exception(e)
+
+
+# Step 3: Local speech-to-text with faster-whisper
+class LocalWhisper:
+    """
+    A faster-whisper model loaded once and shared by all requests.
+    """
+
+    def __init__(self, model_name=LOCAL_WHISPER_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._batched = None
+        self._lock = threading.Lock()
+        self.worker = InferenceWorker("local-stt", self._transcribe_chunk)
+
+    def load(self):
+        """
+        Loads the model on first call; later calls return immediately.
+        """
+        with self._lock:
+            if self._model is not None:
+                return
+            from faster_whisper import WhisperModel  # Optional dependency, only needed for local STT
+
+            started = time.perf_counter()
+            self._model = WhisperModel(self.model_name, device="cpu", compute_type=LOCAL_WHISPER_COMPUTE_TYPE,
+                                       cpu_threads=LOCAL_CPU_THREADS)
+            try:
+                from faster_whisper import BatchedInferencePipeline  # faster-whisper >= 1.1
+                self._batched = BatchedInferencePipeline(model=self._model)
+            except ImportError:
+                logging.info("This faster-whisper version has no batched pipeline; long recordings are decoded window by window.")
+            logging.info(f"Loaded local Whisper model '{self.model_name}' ({LOCAL_WHISPER_COMPUTE_TYPE}) "
+                         f"in {time.perf_counter() - started:.1f}s.")
+
+    def transcribe(self, chunk):
+        """
+        Transcribes one (file name, audio bytes) chunk on the model thread.
+        """
+        return self.worker.call(chunk)
+
+    async def transcribe_async(self, chunk):
+        return await self.worker.call_async(chunk)
+
+    def _transcribe_one(self, audio):
+        """
+        Transcribes one recording. Recordings are never combined with other requests: the
+        batched pipeline only decodes the 30-second windows of a single long recording together.
+        """
+        if self._batched is not None and len(audio) > WINDOW_SECONDS * SAMPLE_RATE:
+            try:
+                segments, _ = self._batched.transcribe(
+                    audio, language="en", beam_size=LOCAL_WHISPER_BEAM_SIZE, batch_size=LOCAL_BATCH_MAX)
+                return " ".join(segment.text.strip() for segment in segments)
+            except Exception as e:
+                logging.warning(f"Batched local transcription failed ({e}); using the sequential decoder from now on.")
+                self._batched = None
+        segments, _ = self._model.transcribe(audio, language="en", beam_size=LOCAL_WHISPER_BEAM_SIZE)
+        return " ".join(segment.text.strip() for segment in segments)
+
+    def _transcribe_chunk(self, chunk):
+        from faster_whisper.audio import decode_audio
+
+        self.load()
+        _, data = chunk
+        return self._transcribe_one(decode_audio(io.BytesIO(data), sampling_rate=SAMPLE_RATE))
+
+
+# Step 4: Local text-to-speech with Piper
+class LocalVoice:
+    """
+    A Piper voice loaded once; synthesis runs on its own thread and returns MP3 like the remote voices.
+    """
+
+    def __init__(self, voice_path):
+        if not voice_path:
+            raise ValueError("Local TTS needs a Piper voice: set LOCAL_TTS_VOICE or use TTS_BACKENDS=local:<path>.")
+        self.voice_path = voice_path
+        self.name = os.path.splitext(os.path.basename(voice_path))[0]
+        self._voice = None
+        self._lock = threading.Lock()
+        self.worker = InferenceWorker("local-tts", self._synthesize)
+
+    def load(self):
+        with self._lock:
+            if self._voice is not None:
+                return
+            from piper import PiperVoice  # Optional dependency, only needed for local TTS
+
+            started = time.perf_counter()
+            self._voice = PiperVoice.load(self.voice_path)
+            logging.info(f"Loaded local voice '{self.name}' in {time.perf_counter() - started:.1f}s.")
+
+    def _synthesize(self, text):
+        from pydub import AudioSegment
+
+        self.load()
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            # piper-tts >= 1.3 renamed synthesize(text, wav_file) to synthesize_wav
+            synthesize = getattr(self._voice, "synthesize_wav", None) or self._voice.synthesize
+            synthesize(text, wav_file)
+        buffer.seek(0)
+        mp3 = io.BytesIO()
+        AudioSegment.from_wav(buffer).export(mp3, format="mp3", bitrate="64k")
+        return mp3.getvalue()
+
+    def synthesize(self, text):
+        """
+        Converts text to MP3 speech on the voice thread. Routed calls are cached by synthesize_speech.
+        """
+        return self.worker.call(text)
+
+
+# Step 5: Router backends
+# Local backends compete with the remote ones on measured latency (see provider_router.py):
+# they start with a pessimistic prior and take over when the remote backend fails or gets
+# slower than local inference. The router's background probes keep measuring the remote
+# backend, so it takes traffic back once its latency recovers.
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _shared(key, create):
+    with _models_lock:
+        if key not in _models:
+            _models[key] = create()
+        return _models[key]
+
+
+def local_whisper_backend(model=None):
+    """
+    Router backend for STT_BACKENDS=local[:model].
+    """
+    whisper = _shared(("stt", model or LOCAL_WHISPER_MODEL), lambda: LocalWhisper(model or LOCAL_WHISPER_MODEL))
+    return Backend(
+        f"local:{whisper.model_name}",
+        call=lambda chunk: whisper.transcribe(chunk),
+        call_async=lambda chunk: whisper.transcribe_async(chunk),
+        expected_ms=LOCAL_STT_EXPECTED_MS,
+    )
+
+
+def local_voice_backend(voice_path=None):
+    """
+    Router backend for TTS_BACKENDS=local[:voice path].
+    """
+    voice = _shared(("tts", voice_path or LOCAL_TTS_VOICE), lambda: LocalVoice(voice_path or LOCAL_TTS_VOICE))
+    return Backend(f"local:{voice.name}", call=lambda text: voice.synthesize(text), expected_ms=LOCAL_TTS_EXPECTED_MS,
+                   cache_key=("piper", voice.name, None))
+
+
+def local_models_configured():
+    """
+    Returns the capabilities ("stt", "tts") that list a local backend.
+    """
+    return [kind for kind in ("stt", "tts") if any(provider == "local" for provider, _ in backend_spec(kind))]
+
+
+def load_local_models():
+    """
+    Loads every configured local model, so the first request does not pay for it.
+    Run at startup in a background thread; a request routed to a local backend before
+    then waits for the load (the router hedges to a remote backend meanwhile).
+    """
+    for kind in local_models_configured():
+        try:
+            get_router(kind)  # Creates the shared model objects
+        except Exception as e:
+            logging.error(f"Could not set up the {kind} backends: {e}")
+    with _models_lock:
+        models = list(_models.values())
+    for model in models:
+        try:
+            model.load()
+        except Exception as e:
+            logging.error(f"Could not load local model {getattr(model, 'model_name', None) or model.name}: {e}")
+
+
+def _local_requests():
+    with _models_lock:
+        models = dict(_models)
+    return [({"kind": kind, "model": name}, model.worker.requests) for (kind, name), model in models.items()]
+
+
+register(CallbackMetric(
+    "voicebot_local_requests_total", "Requests served by local models.", _local_requests, "counter",
+))
@@ -0,0 +1,226 @@
+# Import necessary libraries
+import time  # For timing helpers
+import uuid  # For per-request trace IDs
+import logging
+import threading  # For guarding metric updates
+import contextvars  # For carrying the trace ID across threads and tasks
+from contextlib import contextmanager
+
+# Step 1: Per-request trace IDs
+# The trace ID lives in a context variable, so it follows a request into stage
+# threads (the stage executor copies the context) and asyncio tasks. Every log
+# record gets a `trace_id` attribute that the log format can print.
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - [%(trace_id)s] %(message)s"
+
+
+def new_trace_id():
+    """
+    Starts a new trace for the current request and returns its ID.
+    """
+    trace_id = uuid.uuid4().hex[:16]
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+def current_trace_id():
+    return trace_id_var.get()
+
+
+_default_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs):
+    record = _default_record_factory(*args, **kwargs)
+    record.trace_id = trace_id_var.get()
+    return record
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Configures logging so every line carries the current request's trace ID.
+    """
+    logging.setLogRecordFactory(_record_factory)
+    logging.basicConfig(level=level, format=LOG_FORMAT, force=True)
+
+
+# Step 2: Minimal Prometheus-style metric types
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """
+    A monotonically increasing value per label set.
+    """
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count per label set.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            for bound, count in zip(self.buckets, state):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': le})} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}"
+
+
+class CallbackMetric:
+    """
+    A gauge or counter whose samples are read from a callback at scrape time,
+    e.g. cache statistics that are already tracked elsewhere.
+    The callback returns a list of (labels dict, value) pairs.
+    """
+
+    def __init__(self, name, documentation, callback, type_name="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.type_name = type_name
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logging.warning(f"Metric callback {self.name} failed: {e}")
+            return
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}"
+
+
+# Step 3: Registry and exposition
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def register(metric):
+    with _registry_lock:
+        if all(existing.name != metric.name for existing in _registry):
+            _registry.append(metric)
+    return metric
+
+
+def render_metrics():
+    """
+    Renders every registered metric in the Prometheus text exposition format.
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# Step 4: Pipeline metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+stage_duration = register(Histogram(
+    "voicebot_stage_duration_seconds", "Duration of each pipeline stage.", ("pipeline", "stage"), LATENCY_BUCKETS))
+stage_errors = register(Counter(
+    "voicebot_stage_errors_total", "Pipeline stages that failed and used their fallback.", ("pipeline", "stage")))
+request_duration = register(Histogram(
+    "voicebot_request_duration_seconds", "End-to-end consultation latency.", ("pipeline",), LATENCY_BUCKETS))
+time_to_first_audio = register(Histogram(
+    "voicebot_time_to_first_audio_seconds", "Time until the first audio chunk is ready (streaming).", (), LATENCY_BUCKETS))
+payload_bytes = register(Histogram(
+    "voicebot_payload_bytes", "Payload sizes sent to or received from providers.", ("kind",), SIZE_BUCKETS))
+provider_requests = register(Counter(
+    "voicebot_provider_requests_total", "HTTP requests to upstream providers by status code.", ("provider", "status")))
+provider_retries = register(Counter(
+    "voicebot_provider_retries_total", "Requests that were SDK retries of an earlier attempt.", ("provider",)))
+router_attempts = register(Counter(
+    "voicebot_router_attempts_total", "Backend attempts made by the provider routers.", ("kind", "backend", "outcome")))
+router_hedges = register(Counter(
+    "voicebot_router_hedges_total", "Hedged requests started because a backend missed its latency deadline.", ("kind",)))
+router_probes = register(Counter(
+    "voicebot_router_probes_total", "Background probes of backends that had not been tried for a while.", ("kind", "backend")))
+admission_wait = register(Histogram(
+    "voicebot_admission_wait_seconds", "Time admitted consultations waited in the admission queue.", (), LATENCY_BUCKETS))
+admission_rejected = register(Counter(
+    "voicebot_admission_rejected_total", "Consultations rejected as busy, by reason.", ("reason",)))
+
+
+def observe_run(run, pipeline, partial=False):
+    """
+    Records stage durations, errors and payload sizes of one PipelineRun.
+    Args:
+        partial (bool): The run covers only some stages of a request (streaming), so its
+            wall time is not the request duration; the caller records that itself.
+    """
+    for stage, timing in run.timings.items():
+        stage_duration.observe(timing["duration_ms"] / 1000, pipeline=pipeline, stage=stage)
+    for stage in run.errors:
+        stage_errors.inc(pipeline=pipeline, stage=stage)
+    if run.wall_ms and not partial:
+        request_duration.observe(run.wall_ms / 1000, pipeline=pipeline)
+
+    prepared_image = run.results.get("encode")
+    if prepared_image is not None:
+        payload_bytes.observe(prepared_image.original_bytes, kind="image_original")
+        payload_bytes.observe(prepared_image.encoded_bytes, kind="image_encoded")
@@ -3,38 +3,52 @@ load_dotenv()
 
 # Step 1: Setup Audio Recorder (ffmpeg & portaudio)
 # Dependencies: ffmpeg, portaudio, pyaudio
+# speech_recognition and pydub are imported inside record_audio: the web app only transcribes
+# uploaded files, so it should not pay for (or require) the microphone stack at import time.
 import logging
-import speech_recognition as sr
-from pydub import AudioSegment
 from io import BytesIO
 
-# Configure logging for better debugging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-def record_audio(file_path, timeout=20, phrase_time_limit=None):
+def record_audio_bytes(timeout=20, phrase_time_limit=None):
     """
-    Simplified function to record audio from the microphone and save it as an MP3 file.
-    Requires `speech_recognition`, `pydub`, and `ffmpeg`.
+    Records one utterance from the microphone and returns it as WAV bytes, without touching disk.
+    Requires `speech_recognition` and PyAudio.
+    Returns:
+        bytes: The recording as a WAV file, or None if recording failed.
     """
+    import speech_recognition as sr
+
     recognizer = sr.Recognizer()
-    
+
     try:
         with sr.Microphone() as source:
             logging.info("Adjusting for ambient noise...")
             recognizer.adjust_for_ambient_noise(source, duration=1)  # Adjusts for background noise
             logging.info("Start speaking now...")
-            
+
             # Record the audio using the microphone
             audio_data = recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
             logging.info("Recording complete.")
-            
-            # Convert the recorded audio to WAV format and then export as MP3
-            wav_data = audio_data.get_wav_data()
-            audio_segment = AudioSegment.from_wav(BytesIO(wav_data))  # Convert to AudioSegment
-            audio_segment.export(file_path, format="mp3", bitrate="128k")  # Export as MP3
-            
-            logging.info(f"Audio saved to {file_path}")
+            return audio_data.get_wav_data()
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        return None
+
+def record_audio(file_path, timeout=20, phrase_time_limit=None):
+    """
+    Simplified function to record audio from the microphone and save it as an MP3 file.
+    Only needed to keep the recording; transcription can take the bytes of record_audio_bytes().
+    Requires `speech_recognition`, `pydub`, and `ffmpeg`.
+    """
+    from pydub import AudioSegment
 
+    wav_data = record_audio_bytes(timeout, phrase_time_limit)
+    if wav_data is None:
+        return
+    try:
+        audio_segment = AudioSegment.from_wav(BytesIO(wav_data))  # Convert to AudioSegment
+        audio_segment.export(file_path, format="mp3", bitrate="128k")  # Export as MP3
+        logging.info(f"Audio saved to {file_path}")
     except Exception as e:
         logging.error(f"An error occurred: {e}")
 
@@ -46,40 +60,147 @@ audio_filepath = "patient_voice_test_for_patient.mp3"
 
 # Step 2: Setup Speech-to-Text (STT) Model for Transcription
 import os
-from groq import Groq
+import asyncio
+import contextvars  # For carrying the trace ID into chunk threads
+from provider_clients import get_groq_client, get_async_groq_client  # Shared, pooled Groq clients
+from scheduler import scheduler  # Per-provider concurrency and rate limits for async calls
+from audio_preprocessing import prepare_audio  # Silence trimming, 16 kHz mono, FLAC, chunking
+from concurrent.futures import ThreadPoolExecutor  # For transcribing long recordings in parallel
+from provider_router import get_router  # Failover and hedging across STT backends
 
 # Retrieve GROQ_API_KEY from environment variables
+# A missing key is reported when a client is first created, not at import time.
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    logging.error("ERROR: GROQ_API_KEY is missing. Please check your .env file.")
-    exit(1)
 
 stt_model = "whisper-large-v3"  # Specify the STT model to use
 
+# Chunks of one long recording are transcribed concurrently
+STT_CHUNK_WORKERS = int(os.environ.get("STT_CHUNK_WORKERS", "4"))
+_chunk_executor = ThreadPoolExecutor(max_workers=STT_CHUNK_WORKERS, thread_name_prefix="stt-chunk")
+
 def transcribe_with_groq(stt_model, audio_filepath, GROQ_API_KEY):
     """
     Function to transcribe audio using Groq's Whisper model.
-    Requires an API key and the path to the audio file.
+    Requires an API key and the audio (a file path, bytes or a binary file-like object).
+    The recording is trimmed, downmixed and compressed first (see audio_preprocessing.py);
+    long recordings are split at silence and the chunks are transcribed in parallel.
     """
     try:
-        client = Groq(api_key=GROQ_API_KEY)  # Initialize Groq client with API key
-        
-        # Open the audio file and send it to Groq for transcription
-        with open(audio_filepath, "rb") as audio_file:
-            logging.info("Transcribing audio...")
-            transcription = client.audio.transcriptions.create(
-                model=stt_model,  # Specify the model (e.g., whisper-large-v3)
-                file=audio_file,  # Pass the audio file
-                language="en"  # Specify the language (English in this case)
-            )
-        
+        client = get_groq_client(GROQ_API_KEY)  # Reuse the shared Groq client
+        prepared = prepare_audio(audio_filepath)
+        if not prepared.chunks:
+            return ""  # Nothing but silence
+
+        # Send the preprocessed audio to Groq for transcription
+        logging.info(f"Transcribing audio ({len(prepared.chunks)} chunk(s), "
+                     f"{prepared.original_bytes} -> {prepared.encoded_bytes} bytes)...")
+
+        def transcribe_chunk(chunk):
+            return transcribe_audio_bytes(stt_model, chunk, client)
+
+        if len(prepared.chunks) == 1:
+            texts = [transcribe_chunk(prepared.chunks[0])]
+        else:
+            texts = list(_chunk_executor.map(transcribe_chunk, prepared.chunks))
+
         logging.info("Transcription complete.")
-        return transcription.text  # Return the transcribed text
+        return join_transcripts(texts)  # Return the transcribed text
 
     except Exception as e:
         logging.error(f"An error occurred during transcription: {e}")
         return None
 
+def transcribe_audio_bytes(stt_model, chunk, client=None):
+    """
+    Transcribes one in-memory audio segment with Groq's Whisper model.
+    Args:
+        stt_model (str): The STT model to use (e.g., whisper-large-v3).
+        chunk (tuple): (file name, audio bytes); the extension tells Whisper the format.
+        client: Groq client; defaults to the shared client.
+    Returns:
+        str: The transcribed text.
+    """
+    client = client or get_groq_client()
+    return client.audio.transcriptions.create(
+        model=stt_model,  # Specify the model (e.g., whisper-large-v3)
+        file=chunk,  # Pass the audio as (file name, bytes)
+        language="en"  # Specify the language (English in this case)
+    ).text
+
+async def transcribe_with_groq_async(stt_model, audio_filepath, GROQ_API_KEY):
+    """
+    Async version of transcribe_with_groq using the shared AsyncGroq client.
+    Calls are queued through the per-provider scheduler.
+    """
+    try:
+        client = get_async_groq_client(GROQ_API_KEY)
+
+        # Preprocess off the event loop, then upload each chunk as (name, bytes)
+        prepared = await asyncio.to_thread(prepare_audio, audio_filepath)
+        if not prepared.chunks:
+            return ""
+        logging.info("Transcribing audio...")
+
+        texts = await asyncio.gather(*(transcribe_audio_bytes_async(stt_model, chunk, client) for chunk in prepared.chunks))
+
+        logging.info("Transcription complete.")
+        return join_transcripts(texts)
+
+    except Exception as e:
+        logging.error(f"An error occurred during transcription: {e}")
+        return None
+
+async def transcribe_audio_bytes_async(stt_model, chunk, client=None):
+    """
+    Async version of transcribe_audio_bytes, queued through the per-provider scheduler.
+    """
+    client = client or get_async_groq_client()
+    transcription = await scheduler.run("groq_stt", lambda: client.audio.transcriptions.create(
+        model=stt_model,
+        file=chunk,
+        language="en"
+    ))
+    return transcription.text
+
+def transcribe_chunk(chunk):
+    """
+    Transcribes one in-memory audio segment with the fastest healthy STT backend
+    (STT_BACKENDS, see provider_router.py).
+    Raises:
+        AllBackendsFailed: If every backend failed.
+    """
+    return get_router("stt").call(chunk=chunk)
+
+def transcribe_audio(audio):
+    """
+    Preprocesses a recording and transcribes it through the STT router.
+    Unlike transcribe_with_groq, errors are raised so the caller can apply its own fallback.
+    Args:
+        audio (str | bytes | file-like): The recording, as a path or in memory.
+    Returns:
+        str: The transcribed text ("" for a silent recording).
+    """
+    prepared = prepare_audio(audio)
+    if len(prepared.chunks) <= 1:
+        return join_transcripts(transcribe_chunk(chunk) for chunk in prepared.chunks)
+    context = contextvars.copy_context()
+    return join_transcripts(_chunk_executor.map(lambda chunk: context.copy().run(transcribe_chunk, chunk), prepared.chunks))
+
+async def transcribe_audio_async(audio):
+    """
+    Async version of transcribe_audio; chunks are transcribed concurrently.
+    """
+    prepared = await asyncio.to_thread(prepare_audio, audio)
+    router = get_router("stt")
+    texts = await asyncio.gather(*(router.call_async(chunk=chunk) for chunk in prepared.chunks))
+    return join_transcripts(texts)
+
+def join_transcripts(texts):
+    """
+    Stitches chunk transcripts back together in order.
+    """
+    return " ".join(text.strip() for text in texts if text and text.strip())
+
 # Example usage of the transcription function
 # Uncomment the lines below to test transcription
 # transcript = transcribe_with_groq(stt_model, audio_filepath, GROQ_API_KEY)
@@ -87,13 +208,16 @@ def transcribe_with_groq(stt_model, audio_filepath, GROQ_API_KEY):
 
 # Combined Test: Record audio and transcribe it
 if __name__ == "__main__":
-    # Step 1: Record audio
+    # Configure logging for better debugging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Step 1: Record audio (kept in memory; use record_audio to also save an MP3)
     logging.info("Starting audio recording...")
-    record_audio(file_path=audio_filepath)
-    
+    recording = record_audio_bytes()
+
     # Step 2: Transcribe the recorded audio
     logging.info("Starting transcription...")
-    transcript = transcribe_with_groq(stt_model, audio_filepath, GROQ_API_KEY)
+    transcript = transcribe_with_groq(stt_model, recording, GROQ_API_KEY) if recording else None
     if transcript:
         logging.info(f"Transcription: {transcript}")
     else:
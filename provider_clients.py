@@ -0,0 +1,317 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading pool/timeout settings from the environment
+import threading  # For guarding the shared client registry
+import weakref  # For remembering which connections have already been seen
+import logging
+
+from metrics import provider_requests, provider_retries  # Per-provider request and retry counters
+
+# Step 1: Pool, timeout and retry settings
+# Every setting can be overridden from the .env file so deployments can tune
+# the connection pool without touching the code.
+POOL_MAX_CONNECTIONS = int(os.environ.get("PROVIDER_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.environ.get("PROVIDER_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get("PROVIDER_POOL_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.environ.get("PROVIDER_CONNECT_TIMEOUT", "5"))
+REQUEST_TIMEOUT = float(os.environ.get("PROVIDER_REQUEST_TIMEOUT", "60"))
+MAX_RETRIES = int(os.environ.get("PROVIDER_MAX_RETRIES", "2"))  # Retries with exponential backoff
+CONNECT_RETRIES = int(os.environ.get("PROVIDER_CONNECT_RETRIES", "2"))  # Transport-level connect retries
+
+# Optional base URL overrides (useful for proxies and local stand-in servers)
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL") or None
+ELEVENLABS_BASE_URL = os.environ.get("ELEVENLABS_BASE_URL") or None
+
+
+# Step 2: Connection reuse statistics
+class PoolStats:
+    """
+    Counts requests and distinguishes fresh connections from reused keep-alive ones.
+    httpcore exposes the underlying network stream in the response extensions, so a
+    stream we have already seen means the request rode on a pooled connection.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.errors = 0
+        self._seen_streams = weakref.WeakSet()
+        self._seen_ids = set()  # Fallback for stream objects that cannot be weakly referenced
+        self._lock = threading.Lock()
+
+    def record_request(self, request):
+        # The Groq SDK marks its automatic retries with this header
+        try:
+            if int(request.headers.get("x-stainless-retry-count", "0")) > 0:
+                provider_retries.inc(provider=self.name)
+        except ValueError:
+            pass
+
+    def record_response(self, response):
+        provider_requests.inc(provider=self.name, status=response.status_code)
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            self.requests += 1
+            if response.status_code >= 400:
+                self.errors += 1
+            if stream is None:
+                return
+            try:
+                reused = stream in self._seen_streams
+                self._seen_streams.add(stream)
+            except TypeError:
+                reused = id(stream) in self._seen_ids
+                self._seen_ids.add(id(stream))
+            if reused:
+                self.reused_connections += 1
+            else:
+                self.new_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            reuse_ratio = self.reused_connections / self.requests if self.requests else 0.0
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "errors": self.errors,
+                "reuse_ratio": round(reuse_ratio, 3),
+            }
+
+
+# Step 3: Process-wide provider registry
+_registry_lock = threading.Lock()
+_clients = {}  # (provider, api_key) -> SDK client
+# Async clients hold connections bound to one event loop, so they are kept per loop
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {(provider, api_key): SDK client}
+_stats = {}  # provider -> PoolStats
+
+
+def _async_registry():
+    """
+    Returns the async client registry for the running event loop.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    registry = _async_clients.get(loop)
+    if registry is None:
+        registry = _async_clients[loop] = {}
+    return registry
+
+
+def _get_stats(provider):
+    if provider not in _stats:
+        _stats[provider] = PoolStats(provider)
+    return _stats[provider]
+
+
+def _build_http_client(provider):
+    """
+    Builds a keep-alive httpx client with bounded pool limits for one provider.
+    httpx (like the provider SDKs) is imported on first use to keep module import fast.
+    """
+    import httpx
+
+    stats = _get_stats(provider)
+    limits = httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+    return httpx.Client(
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        transport=httpx.HTTPTransport(retries=CONNECT_RETRIES, limits=limits),
+        event_hooks={"request": [stats.record_request], "response": [stats.record_response]},
+    )
+
+
+def _build_async_http_client(provider):
+    """
+    Async counterpart of _build_http_client, sharing the same limits and statistics.
+    """
+    import httpx
+
+    stats = _get_stats(provider)
+    limits = httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+
+    async def record_request(request):
+        stats.record_request(request)
+
+    async def record_response(response):
+        stats.record_response(response)
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        transport=httpx.AsyncHTTPTransport(retries=CONNECT_RETRIES, limits=limits),
+        event_hooks={"request": [record_request], "response": [record_response]},
+    )
+
+
+def _elevenlabs_environment():
+    """
+    Builds the ElevenLabs environment for ELEVENLABS_BASE_URL.
+    The SDK's own base_url argument always forces https and drops the port, so the
+    environment is built directly to keep plain-http local endpoints working.
+    """
+    from elevenlabs.environment import ElevenLabsEnvironment
+
+    base = ELEVENLABS_BASE_URL.rstrip("/")
+    wss = "ws" + base[len("http"):] if base.startswith("http") else base
+    return ElevenLabsEnvironment(base=base, wss=wss)
+
+
+def get_groq_client(api_key=None):
+    """
+    Returns the shared Groq client for the given API key, creating it on first use.
+    Args:
+        api_key (str): Groq API key. Defaults to GROQ_API_KEY from the environment.
+    """
+    api_key = api_key or os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY is missing. Please check your .env file.")
+
+    key = ("groq", api_key)
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            import httpx
+            from groq import Groq
+
+            client = Groq(
+                api_key=api_key,
+                base_url=GROQ_BASE_URL,
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+                max_retries=MAX_RETRIES,  # The SDK retries 408/429/5xx with exponential backoff
+                http_client=_build_http_client("groq"),
+            )
+            _clients[key] = client
+            logging.info("Created shared Groq client.")
+        return client
+
+
+def get_elevenlabs_client(api_key=None):
+    """
+    Returns the shared ElevenLabs client for the given API key, creating it on first use.
+    Args:
+        api_key (str): ElevenLabs API key. Defaults to ELEVENLABS_API_KEY from the environment.
+    """
+    api_key = api_key or os.environ.get("ELEVENLABS_API_KEY")
+    if not api_key:
+        raise ValueError("ELEVENLABS_API_KEY is missing. Please check your .env file.")
+
+    key = ("elevenlabs", api_key)
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            from elevenlabs.client import ElevenLabs
+
+            kwargs = {
+                "api_key": api_key,
+                "timeout": REQUEST_TIMEOUT,
+                "httpx_client": _build_http_client("elevenlabs"),
+            }
+            if ELEVENLABS_BASE_URL:
+                kwargs["environment"] = _elevenlabs_environment()
+            client = ElevenLabs(**kwargs)
+            _clients[key] = client
+            logging.info("Created shared ElevenLabs client.")
+        return client
+
+
+def get_async_groq_client(api_key=None):
+    """
+    Returns the shared AsyncGroq client for the given API key and the running event loop.
+    Args:
+        api_key (str): Groq API key. Defaults to GROQ_API_KEY from the environment.
+    """
+    api_key = api_key or os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY is missing. Please check your .env file.")
+
+    key = ("groq", api_key)
+    with _registry_lock:
+        registry = _async_registry()
+        client = registry.get(key)
+        if client is None:
+            import httpx
+            from groq import AsyncGroq
+
+            client = AsyncGroq(
+                api_key=api_key,
+                base_url=GROQ_BASE_URL,
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+                max_retries=MAX_RETRIES,
+                http_client=_build_async_http_client("groq"),
+            )
+            registry[key] = client
+            logging.info("Created shared AsyncGroq client.")
+        return client
+
+
+def get_async_elevenlabs_client(api_key=None):
+    """
+    Returns the shared AsyncElevenLabs client for the given API key and the running event loop.
+    Args:
+        api_key (str): ElevenLabs API key. Defaults to ELEVENLABS_API_KEY from the environment.
+    """
+    api_key = api_key or os.environ.get("ELEVENLABS_API_KEY")
+    if not api_key:
+        raise ValueError("ELEVENLABS_API_KEY is missing. Please check your .env file.")
+
+    key = ("elevenlabs", api_key)
+    with _registry_lock:
+        registry = _async_registry()
+        client = registry.get(key)
+        if client is None:
+            from elevenlabs.client import AsyncElevenLabs
+
+            kwargs = {
+                "api_key": api_key,
+                "timeout": REQUEST_TIMEOUT,
+                "httpx_client": _build_async_http_client("elevenlabs"),
+            }
+            if ELEVENLABS_BASE_URL:
+                kwargs["environment"] = _elevenlabs_environment()
+            client = AsyncElevenLabs(**kwargs)
+            registry[key] = client
+            logging.info("Created shared AsyncElevenLabs client.")
+        return client
+
+
+def pool_stats():
+    """
+    Returns connection pool statistics for every provider used so far.
+    Returns:
+        dict: provider name -> request / new connection / reused connection counts.
+    """
+    with _registry_lock:
+        providers = list(_stats.items())
+    return {name: stats.snapshot() for name, stats in providers}
+
+
+def close_clients():
+    """
+    Closes all shared sync clients and their connection pools (e.g. on shutdown).
+    Async clients are released together with their event loop.
+    """
+    with _registry_lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                logging.warning(f"Error while closing provider client: {e}")
+        _clients.clear()
+
+
+# Example usage (uncomment to test)
+# client = get_groq_client()
+# print(pool_stats())
@@ -0,0 +1,548 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import io  # For the in-memory probe recording
+import os  # For reading backend lists and router settings from the environment
+import time  # For latency measurements and breaker timeouts
+import asyncio  # For the async pipeline
+import logging
+import wave  # For building the probe recording
+import threading  # For guarding health state
+import contextvars  # For carrying the trace ID into hedged attempts
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import router_attempts, router_hedges, router_probes  # Per-backend outcomes, hedges and probes
+
+# Step 1: Router settings
+# Each capability (stt, vision, tts) has an ordered list of backends, e.g.
+#   TTS_BACKENDS=elevenlabs,gtts
+#   STT_BACKENDS=groq:whisper-large-v3,groq:whisper-large-v3-turbo
+# Backends are ranked by a rolling latency average (EWMA); a backend whose breaker is
+# open is skipped. If the chosen backend misses its latency deadline, the next one is
+# started as a hedge and whichever answers first wins. A backend that has not been tried
+# for ROUTER_PROBE_SECONDS gets a small synthetic request in the background (a second of
+# silence, a one-word phrase), so a backend that lost the ranking is measured again and
+# takes traffic back once it recovers. Patient data is never sent in a probe.
+DEFAULT_BACKENDS = {
+    "stt": "groq:whisper-large-v3,groq:whisper-large-v3-turbo",
+    "vision": "groq:llama-3.2-11b-vision-preview,groq:llama-3.2-90b-vision-preview",
+    "tts": "elevenlabs,gtts",
+}
+ROUTER_EWMA_ALPHA = float(os.environ.get("ROUTER_EWMA_ALPHA", "0.2"))  # Weight of the newest latency sample
+ROUTER_HEDGE_FACTOR = float(os.environ.get("ROUTER_HEDGE_FACTOR", "2.0"))  # Deadline = factor x backend EWMA
+ROUTER_HEDGE_MIN_MS = float(os.environ.get("ROUTER_HEDGE_MIN_MS", "500"))  # Never hedge earlier than this
+ROUTER_MAX_HEDGES = int(os.environ.get("ROUTER_MAX_HEDGES", "1"))  # Extra concurrent attempts per call
+ROUTER_BREAKER_FAILURES = int(os.environ.get("ROUTER_BREAKER_FAILURES", "3"))  # Consecutive failures that open a breaker
+ROUTER_BREAKER_RESET_SECONDS = float(os.environ.get("ROUTER_BREAKER_RESET_SECONDS", "30"))  # Open time before a trial call
+ROUTER_PROBE_SECONDS = float(os.environ.get("ROUTER_PROBE_SECONDS", "60"))  # Idle time before a backend is probed (0 = off)
+ROUTER_WORKERS = int(os.environ.get("ROUTER_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=ROUTER_WORKERS, thread_name_prefix="router")
+
+
+class AllBackendsFailed(RuntimeError):
+    """
+    Raised when every backend of a router failed; `errors` maps backend name to its exception.
+    """
+
+    def __init__(self, kind, errors):
+        self.errors = errors
+        details = "; ".join(f"{name}: {error}" for name, error in errors.items())
+        super().__init__(f"All {kind} backends failed ({details})")
+
+
+# Step 2: Backends and their health
+class Backend:
+    """
+    One implementation of a capability.
+    Args:
+        name (str): Unique name, e.g. "groq:whisper-large-v3".
+        call (callable): Synchronous implementation.
+        call_async (callable): Coroutine implementation; defaults to `call` in a worker thread.
+        stream (callable): Optional generator implementation (vision streaming).
+        expected_ms (float): Latency prior used until real samples arrive.
+        fallback_only (bool): Only used after the regular backends failed or missed their deadline.
+        cache_key (tuple): (provider, voice, model) under which a TTS backend's audio is cached.
+        probe (callable): Cheap synthetic request, called without arguments, that re-measures an
+            idle backend. Backends without one (e.g. vision, where every call is billed per
+            image) are never probed.
+    """
+
+    def __init__(self, name, call, call_async=None, stream=None, expected_ms=1000.0, fallback_only=False, cache_key=None,
+                 probe=None):
+        self.name = name
+        self.call = call
+        self.call_async = call_async
+        self.stream = stream
+        self.fallback_only = fallback_only
+        self.cache_key = cache_key
+        self.probe = probe
+        self.ewma_ms = expected_ms  # Full call (or full stream) latency, used for ranking calls and hedge deadlines
+        self.samples = 0
+        self.ttft_ms = None  # Time to first token of streams, kept apart because it is much shorter
+        self.ttft_samples = 0
+        self.last_attempt = time.monotonic()  # Start of the latest attempt or probe
+        self.consecutive_failures = 0
+        self.opened_at = None  # Breaker open since (monotonic time), or None when closed
+        self.trial_in_progress = False
+
+    # Circuit breaker: closed -> open after N consecutive failures -> half-open trial after a timeout
+    def available(self, now):
+        if self.opened_at is None:
+            return True
+        return now - self.opened_at >= ROUTER_BREAKER_RESET_SECONDS and not self.trial_in_progress
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= ROUTER_BREAKER_RESET_SECONDS else "open"
+
+    def deadline_seconds(self):
+        return max(ROUTER_HEDGE_MIN_MS, ROUTER_HEDGE_FACTOR * self.ewma_ms) / 1000
+
+
+class ProviderRouter:
+    """
+    Routes calls for one capability across its backends with EWMA ranking, circuit
+    breakers, failover and hedged requests.
+    """
+
+    def __init__(self, kind, backends):
+        if not backends:
+            raise ValueError(f"No {kind} backends configured.")
+        self.kind = kind
+        self.backends = list(backends)
+        self._lock = threading.Lock()
+
+    def ranked(self, streaming=False):
+        """
+        Returns the backends to try, fastest healthy first. Fallback-only backends come last;
+        if every breaker is open, all backends are tried anyway.
+        Args:
+            streaming (bool): Rank by time to first token where it has been measured.
+        """
+        now = time.monotonic()
+        with self._lock:
+            order = {backend.name: index for index, backend in enumerate(self.backends)}
+            healthy = [backend for backend in self.backends if backend.available(now)] or list(self.backends)
+
+            def latency(backend):
+                if streaming and backend.ttft_ms is not None:
+                    return backend.ttft_ms
+                return backend.ewma_ms
+
+            return sorted(healthy, key=lambda b: (b.fallback_only, latency(b), order[b.name]))
+
+    def _begin(self, backend):
+        with self._lock:
+            backend.last_attempt = time.monotonic()
+            if backend.opened_at is not None:
+                backend.trial_in_progress = True  # Half-open: this call decides the breaker state
+
+    @staticmethod
+    def _observe_latency(backend, elapsed_ms):
+        backend.ewma_ms = elapsed_ms if backend.samples == 0 else (
+            ROUTER_EWMA_ALPHA * elapsed_ms + (1 - ROUTER_EWMA_ALPHA) * backend.ewma_ms)
+        backend.samples += 1
+
+    @staticmethod
+    def _observe_ttft(backend, elapsed_ms):
+        backend.ttft_ms = elapsed_ms if backend.ttft_samples == 0 else (
+            ROUTER_EWMA_ALPHA * elapsed_ms + (1 - ROUTER_EWMA_ALPHA) * backend.ttft_ms)
+        backend.ttft_samples += 1
+
+    def _record(self, backend, elapsed_ms, error):
+        with self._lock:
+            backend.trial_in_progress = False
+            if error is None:
+                self._observe_latency(backend, elapsed_ms)
+                backend.consecutive_failures = 0
+                if backend.opened_at is not None:
+                    logging.info(f"{self.kind} backend {backend.name} recovered; closing its breaker.")
+                backend.opened_at = None
+            else:
+                backend.consecutive_failures += 1
+                if backend.opened_at is not None or backend.consecutive_failures >= ROUTER_BREAKER_FAILURES:
+                    if backend.opened_at is None:
+                        logging.warning(f"{self.kind} backend {backend.name} failed "
+                                        f"{backend.consecutive_failures} times; opening its breaker.")
+                    backend.opened_at = time.monotonic()
+        router_attempts.inc(kind=self.kind, backend=backend.name, outcome="success" if error is None else "error")
+
+    def _attempt(self, backend, kwargs):
+        self._begin(backend)
+        start = time.perf_counter()
+        try:
+            result = backend.call(**kwargs)
+        except Exception as e:
+            self._record(backend, (time.perf_counter() - start) * 1000, e)
+            raise
+        self._record(backend, (time.perf_counter() - start) * 1000, None)
+        return result
+
+    def _probe_candidate(self, chosen):
+        """
+        Returns a healthy regular backend with a probe that has not been tried for
+        ROUTER_PROBE_SECONDS, or None. Without probes, a backend that once ranked behind
+        another would never be measured again, even after it recovered.
+        """
+        if ROUTER_PROBE_SECONDS <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            for backend in self.backends:
+                if (backend is not chosen and backend.probe is not None and not backend.fallback_only and backend.available(now)
+                        and now - backend.last_attempt >= ROUTER_PROBE_SECONDS):
+                    backend.last_attempt = now  # Claimed, so concurrent calls do not probe it too
+                    return backend
+        return None
+
+    def _start_probe(self, chosen):
+        """
+        Sends the synthetic probe request to an idle backend in the background. The answer is
+        discarded; its latency or failure updates the backend's average and breaker.
+        """
+        backend = self._probe_candidate(chosen)
+        if backend is None:
+            return
+        router_probes.inc(kind=self.kind, backend=backend.name)
+        logging.info(f"Probing idle {self.kind} backend {backend.name}.")
+
+        def probe():
+            self._begin(backend)
+            start = time.perf_counter()
+            try:
+                backend.probe()
+            except Exception as e:
+                self._record(backend, (time.perf_counter() - start) * 1000, e)
+                logging.info(f"Probe of {self.kind} backend {backend.name} failed: {e}")
+                return
+            self._record(backend, (time.perf_counter() - start) * 1000, None)
+
+        _executor.submit(contextvars.copy_context().run, probe)
+
+    # Step 3: Synchronous calls with failover and hedging
+    def call(self, **kwargs):
+        """
+        Calls the best backend. If it fails, the next one is tried; if it misses its latency
+        deadline, the next one is started in parallel and the first successful result wins.
+        Raises:
+            AllBackendsFailed: If no backend succeeded.
+        """
+        return self.call_with_backend(**kwargs)[0]
+
+    def call_with_backend(self, **kwargs):
+        """
+        Same as call(), but returns (result, Backend) so the caller knows which backend answered.
+        """
+        candidates = self.ranked()
+        in_flight = {}
+        errors = {}
+        hedges = 0
+
+        def start_next():
+            backend = candidates.pop(0)
+            context = contextvars.copy_context()  # Hedged attempts keep the request's trace ID
+            in_flight[_executor.submit(context.run, self._attempt, backend, kwargs)] = backend
+            return backend
+
+        current = start_next()
+        self._start_probe(current)
+        while in_flight:
+            can_hedge = candidates and hedges < ROUTER_MAX_HEDGES
+            done, _ = wait(in_flight, timeout=current.deadline_seconds() if can_hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                hedges += 1
+                router_hedges.inc(kind=self.kind)
+                logging.info(f"{self.kind} backend {current.name} missed its {current.deadline_seconds():.2f}s deadline; "
+                             f"hedging with {candidates[0].name}.")
+                current = start_next()
+                continue
+            for future in done:
+                backend = in_flight.pop(future)
+                try:
+                    return future.result(), backend  # Slower attempts still finish and update their EWMA
+                except Exception as e:
+                    errors[backend.name] = e
+                    logging.warning(f"{self.kind} backend {backend.name} failed: {e}")
+            if not in_flight and candidates:
+                current = start_next()  # Failover
+        raise AllBackendsFailed(self.kind, errors)
+
+    # Step 4: Async calls (losing attempts are cancelled)
+    async def _attempt_async(self, backend, kwargs):
+        self._begin(backend)
+        start = time.perf_counter()
+        try:
+            if backend.call_async is not None:
+                result = await backend.call_async(**kwargs)
+            else:
+                result = await asyncio.to_thread(backend.call, **kwargs)
+        except asyncio.CancelledError:
+            # Lost to a faster attempt: the elapsed time is a lower bound of this backend's
+            # latency, so it still counts, otherwise a slow backend would keep ranking first
+            with self._lock:
+                backend.trial_in_progress = False
+                self._observe_latency(backend, (time.perf_counter() - start) * 1000)
+            router_attempts.inc(kind=self.kind, backend=backend.name, outcome="cancelled")
+            raise
+        except Exception as e:
+            self._record(backend, (time.perf_counter() - start) * 1000, e)
+            raise
+        self._record(backend, (time.perf_counter() - start) * 1000, None)
+        return result
+
+    async def call_async(self, **kwargs):
+        """
+        Async version of call(). Once one attempt succeeds, the others are cancelled.
+        """
+        return (await self.call_with_backend_async(**kwargs))[0]
+
+    async def call_with_backend_async(self, **kwargs):
+        """
+        Async version of call_with_backend().
+        """
+        candidates = self.ranked()
+        in_flight = {}
+        errors = {}
+        hedges = 0
+
+        def start_next():
+            backend = candidates.pop(0)
+            in_flight[asyncio.ensure_future(self._attempt_async(backend, kwargs))] = backend
+            return backend
+
+        current = start_next()
+        self._start_probe(current)
+        try:
+            while in_flight:
+                can_hedge = candidates and hedges < ROUTER_MAX_HEDGES
+                done, _ = await asyncio.wait(
+                    in_flight, timeout=current.deadline_seconds() if can_hedge else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    router_hedges.inc(kind=self.kind)
+                    logging.info(f"{self.kind} backend {current.name} missed its deadline; hedging with {candidates[0].name}.")
+                    current = start_next()
+                    continue
+                for task in done:
+                    backend = in_flight.pop(task)
+                    try:
+                        return task.result(), backend
+                    except Exception as e:
+                        errors[backend.name] = e
+                        logging.warning(f"{self.kind} backend {backend.name} failed: {e}")
+                if not in_flight and candidates:
+                    current = start_next()
+            raise AllBackendsFailed(self.kind, errors)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    # Step 5: Streaming with failover before the first token
+    def stream(self, **kwargs):
+        """
+        Streams from the best backend that supports streaming. A backend that fails before
+        yielding anything is skipped; after the first token the stream is committed.
+        Time to first token ranks streams; the full stream time feeds the latency average
+        used for calls and hedge deadlines, and an error mid-stream counts as a failure.
+        """
+        errors = {}
+        candidates = [b for b in self.ranked(streaming=True) if b.stream is not None]
+        if candidates:
+            self._start_probe(candidates[0])
+        for backend in candidates:
+            self._begin(backend)
+            start = time.perf_counter()
+            tokens = backend.stream(**kwargs)
+            try:
+                first = next(tokens)
+            except StopIteration:
+                self._record(backend, (time.perf_counter() - start) * 1000, None)
+                return
+            except Exception as e:
+                self._record(backend, (time.perf_counter() - start) * 1000, e)
+                errors[backend.name] = e
+                logging.warning(f"{self.kind} backend {backend.name} failed before streaming: {e}")
+                continue
+            with self._lock:
+                self._observe_ttft(backend, (time.perf_counter() - start) * 1000)
+            completed = False
+            try:
+                yield first
+                yield from tokens
+                completed = True
+            except Exception as e:
+                self._record(backend, (time.perf_counter() - start) * 1000, e)
+                logging.warning(f"{self.kind} backend {backend.name} failed while streaming: {e}")
+                raise
+            finally:
+                if completed:
+                    self._record(backend, (time.perf_counter() - start) * 1000, None)
+                else:
+                    with self._lock:
+                        backend.trial_in_progress = False  # Abandoned by the consumer: no verdict
+            return
+        raise AllBackendsFailed(self.kind, errors)
+
+    def snapshot(self):
+        """
+        Returns the ranking inputs and breaker state of every backend.
+        """
+        with self._lock:
+            return {
+                backend.name: {
+                    "ewma_ms": round(backend.ewma_ms, 1),
+                    "samples": backend.samples,
+                    "ttft_ms": round(backend.ttft_ms, 1) if backend.ttft_ms is not None else None,
+                    "breaker": backend.state,
+                    "consecutive_failures": backend.consecutive_failures,
+                    "fallback_only": backend.fallback_only,
+                }
+                for backend in self.backends
+            }
+
+
+# Step 6: Backend registry
+# Factories build a Backend from a spec like "groq:whisper-large-v3". Provider modules are
+# imported inside the factories, so importing the router stays cheap and cycle-free.
+PROBE_TEXT = "Hello."  # Spoken by TTS probes
+
+
+def probe_audio():
+    """
+    One second of 16 kHz silence as a WAV file, transcribed by STT probes.
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(b"\x00\x00" * 16000)
+    return buffer.getvalue()
+
+
+def _groq_stt(model):
+    from patient_query import transcribe_audio_bytes, transcribe_audio_bytes_async
+
+    return Backend(
+        f"groq:{model}",
+        call=lambda chunk: transcribe_audio_bytes(model, chunk),
+        call_async=lambda chunk: transcribe_audio_bytes_async(model, chunk),
+        expected_ms=1000,
+        probe=lambda: transcribe_audio_bytes(model, ("probe.wav", probe_audio())),
+    )
+
+
+def _groq_vision(model):
+    from ai_medical_assistant import analyze_image_with_query, analyze_image_with_query_async, stream_image_analysis
+
+    return Backend(
+        f"groq:{model}",
+        call=lambda query, encoded_image, mime_type: analyze_image_with_query(query, model, encoded_image, mime_type),
+        call_async=lambda query, encoded_image, mime_type: analyze_image_with_query_async(query, model, encoded_image, mime_type),
+        stream=lambda query, encoded_image, mime_type: stream_image_analysis(query, model, encoded_image, mime_type),
+        expected_ms=3000,
+    )
+
+
+def _elevenlabs_tts(voice=None):
+    from doctor_voice_tts import synthesize_with_elevenlabs, synthesize_with_elevenlabs_async, ELEVENLABS_VOICE, ELEVENLABS_MODEL
+
+    voice = voice or ELEVENLABS_VOICE
+    # The TTS cache is checked before routing (see synthesize_speech), so a cache hit is
+    # never measured as backend latency
+    return Backend(
+        f"elevenlabs:{voice}",
+        call=lambda text: synthesize_with_elevenlabs(text, voice=voice, use_cache=False),
+        call_async=lambda text: synthesize_with_elevenlabs_async(text, voice=voice, use_cache=False),
+        expected_ms=1000,
+        cache_key=("elevenlabs", voice, ELEVENLABS_MODEL),
+        probe=lambda: synthesize_with_elevenlabs(PROBE_TEXT, voice=voice, use_cache=False),
+    )
+
+
+def _gtts_tts(language=None):
+    from doctor_voice_tts import synthesize_with_gtts
+
+    language = language or "en"
+    # Robotic compared to ElevenLabs, so only used when the preferred voice is failing or slow
+    return Backend(f"gtts:{language}", call=lambda text: synthesize_with_gtts(text, language, use_cache=False),
+                   expected_ms=1500, fallback_only=True, cache_key=("gtts", language, None))
+
+
+def _local_stt(model=None):
+    from local_models import local_whisper_backend
+
+    return local_whisper_backend(model)
+
+
+def _local_tts(voice=None):
+    from local_models import local_voice_backend
+
+    return local_voice_backend(voice)
+
+
+BACKEND_FACTORIES = {
+    "stt": {"groq": _groq_stt, "local": _local_stt},
+    "vision": {"groq": _groq_vision},
+    "tts": {"elevenlabs": _elevenlabs_tts, "gtts": _gtts_tts, "local": _local_tts},
+}
+
+
+def register_backend_factory(kind, provider, factory):
+    """
+    Makes a new provider usable in <KIND>_BACKENDS, e.g. register_backend_factory("stt", "deepgram", make_deepgram_backend).
+    The factory is called with the part after the colon (or None) and returns a Backend.
+    """
+    BACKEND_FACTORIES[kind][provider] = factory
+
+
+def backend_spec(kind, spec=None):
+    """
+    Parses a comma-separated backend spec (default: the <KIND>_BACKENDS environment variable).
+    Returns:
+        list: (provider, argument or None) pairs in order.
+    """
+    spec = spec or os.environ.get(f"{kind.upper()}_BACKENDS", DEFAULT_BACKENDS[kind])
+    items = []
+    for item in (part.strip() for part in spec.split(",") if part.strip()):
+        provider, _, argument = item.partition(":")
+        items.append((provider, argument or None))
+    return items
+
+
+def build_router(kind, spec=None):
+    """
+    Builds the router for a capability from a comma-separated backend spec
+    (default: the <KIND>_BACKENDS environment variable).
+    """
+    backends = []
+    for provider, argument in backend_spec(kind, spec):
+        factory = BACKEND_FACTORIES[kind].get(provider)
+        if factory is None:
+            raise ValueError(f"Unknown {kind} backend provider '{provider}' in {spec or kind.upper() + '_BACKENDS'}.")
+        backends.append(factory(argument))
+    return ProviderRouter(kind, backends)
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(kind):
+    """
+    Returns the shared router for "stt", "vision" or "tts", building it on first use.
+    """
+    with _routers_lock:
+        if kind not in _routers:
+            _routers[kind] = build_router(kind)
+        return _routers[kind]
+
+
+def router_snapshot():
+    with _routers_lock:
+        routers = dict(_routers)
+    return {kind: router.snapshot() for kind, router in routers.items()}
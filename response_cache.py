@@ -0,0 +1,338 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading cache settings from the environment
+import time  # For TTLs and measuring saved latency
+import json  # For serializing entries in the SQLite and Redis backends
+import asyncio  # For coalescing duplicate requests in the async pipeline
+import sqlite3  # For the SQLite file backend
+import hashlib  # For cache keys
+import tempfile  # For the default SQLite location
+import threading  # For guarding the memory backend and in-flight requests
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from tts_cache import normalize_text  # Same whitespace/Unicode normalization as the TTS cache
+
+# Step 1: Cache settings
+# Resubmitting the same photo with the same (or no) question, e.g. after a UI timeout,
+# returns the stored analysis instead of paying for another vision call.
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") != "0"
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory").lower()  # memory, sqlite or redis
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", str(24 * 3600)))  # Seconds an analysis stays valid
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH") or os.path.join(tempfile.gettempdir(), "voicebot_responses.sqlite3")
+RESPONSE_CACHE_REDIS_URL = os.environ.get("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+
+def normalize_transcript(text):
+    """
+    Normalizes a transcript so "Is this acne?" and "is this acne" share a cache entry.
+    """
+    return normalize_text(text or "").casefold().strip(" .!?,;:")
+
+
+def prompt_version(prompt):
+    """
+    Short hash that identifies one wording of the system prompt.
+    """
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def vision_cache_key(prepared_image, transcript, model, prompt):
+    """
+    Builds the cache key for one vision analysis.
+    Args:
+        prepared_image (PreparedImage): The preprocessed image (its encoded payload is hashed).
+        transcript (str): The patient's question.
+        model (str): Vision model id.
+        prompt (str): The system prompt; a change of wording invalidates old entries.
+    """
+    image_hash = hashlib.sha256(prepared_image.data.encode("ascii")).hexdigest()
+    raw = "\x1f".join([image_hash, normalize_transcript(transcript), model, prompt_version(prompt)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Step 2: Backends
+# Each backend stores text values by key with a TTL, and evicts the least recently used
+# entries beyond max_entries.
+class MemoryBackend:
+    """
+    In-process LRU dictionary; entries are lost on restart.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    Single-file SQLite store shared by every worker process on the host; survives restarts.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()  # One connection per thread
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")  # Readers do not block the writer
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires_at >= ?", (key, now)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            connection.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class RedisBackend:
+    """
+    Redis (or any Redis-compatible server) shared across hosts. Expiry uses Redis TTLs;
+    size-based LRU eviction is left to the server's maxmemory-policy (allkeys-lru).
+    Requires the optional `redis` package.
+    """
+
+    prefix = "voicebot:response:"
+
+    def __init__(self, url):
+        import redis  # Optional dependency, only needed for this backend
+
+        self._client = redis.Redis.from_url(url)
+        self._client.ping()
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(f"{self.prefix}*"))
+
+
+def create_backend(name=RESPONSE_CACHE_BACKEND):
+    """
+    Creates the configured backend, falling back to memory if it cannot be used.
+    """
+    try:
+        if name == "sqlite":
+            return SQLiteBackend(RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES)
+        if name == "redis":
+            return RedisBackend(RESPONSE_CACHE_REDIS_URL)
+        if name != "memory":
+            logging.warning(f"Unknown RESPONSE_CACHE_BACKEND '{name}'; using memory.")
+    except Exception as e:
+        logging.warning(f"Could not use the {name} response cache backend, using memory instead: {e}")
+    return MemoryBackend(RESPONSE_CACHE_MAX_ENTRIES)
+
+
+# Step 3: Cache with in-flight request coalescing
+class ResponseCache:
+    """
+    Caches vision analyses by key. Concurrent requests for the same key share a single
+    upstream call: the first caller computes the response, the others wait for its result.
+    Failed or empty responses are never cached.
+    """
+
+    def __init__(self, backend=None, ttl=RESPONSE_CACHE_TTL, enabled=RESPONSE_CACHE_ENABLED):
+        self._backend = backend  # Created on first use, so importing never opens files or sockets
+        self.ttl = ttl
+        self.enabled = enabled
+        self._in_flight = {}  # key -> concurrent.futures.Future (threads)
+        self._in_flight_async = {}  # (event loop, key) -> asyncio.Future
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "compute_seconds": 0.0}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = create_backend()
+        return self._backend
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def lookup(self, key):
+        """
+        Returns the cached response for key, or None. Backend errors count as a miss.
+        """
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logging.warning(f"Response cache lookup failed: {e}")
+            self._count("errors")
+            return None
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def store(self, key, value):
+        if not self.enabled or not value:
+            return
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logging.warning(f"Response cache store failed: {e}")
+            self._count("errors")
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached response for key, calling compute() on a miss.
+        Threads asking for a key that is already being computed wait for that result.
+        """
+        if not self.enabled:
+            return compute()
+        value = self.lookup(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            return future.result()
+
+        start = time.perf_counter()
+        try:
+            value = compute()
+            self.store(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                self.stats["compute_seconds"] += time.perf_counter() - start
+
+    async def get_or_compute_async(self, key, compute):
+        """
+        Async version of get_or_compute; compute is a coroutine function.
+        Backend lookups run in a worker thread so SQLite/Redis never block the event loop.
+        """
+        if not self.enabled:
+            return await compute()
+        value = await asyncio.to_thread(self.lookup, key)
+        if value is not None:
+            return value
+
+        loop = asyncio.get_running_loop()
+        in_flight_key = (loop, key)
+        future = self._in_flight_async.get(in_flight_key)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)  # A cancelled waiter must not cancel the shared call
+
+        future = self._in_flight_async[in_flight_key] = loop.create_future()
+        start = time.perf_counter()
+        try:
+            value = await compute()
+            await asyncio.to_thread(self.store, key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            self._in_flight_async.pop(in_flight_key, None)
+            self._count("compute_seconds", time.perf_counter() - start)
+
+    def counters(self):
+        """
+        Returns hit/miss counters and the hit rate without touching the backend, so it is
+        cheap enough for every metrics scrape. `coalesced` counts misses that waited for an
+        identical in-flight request instead of calling upstream.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["upstream_calls"] = stats["misses"] - stats["coalesced"]
+        stats["compute_seconds"] = round(stats["compute_seconds"], 3)
+        return stats
+
+    def snapshot(self):
+        """
+        Returns the counters plus the backend type and size. Counting entries scans the
+        SQLite table or the Redis keyspace, so use counters() for anything periodic.
+        """
+        stats = self.counters()
+        stats["backend"] = type(self.backend).__name__
+        try:
+            stats["entries"] = len(self.backend)
+        except Exception:
+            stats["entries"] = None
+        return stats
+
+
+# Shared cache used by the consultation pipeline
+response_cache = ResponseCache()
@@ -0,0 +1,174 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading per-provider limits from the environment
+import time  # For token-bucket refills and queue wait times
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+# Step 1: Per-provider limits
+# Each upstream gets its own concurrency and rate budget, so a slow or rate-limited
+# provider only queues its own requests instead of starving the others.
+DEFAULT_LIMITS = {
+    "groq_stt": {"concurrency": 8, "rpm": 0},  # rpm 0 means no client-side rate limit
+    "groq_vision": {"concurrency": 8, "rpm": 0},
+    "elevenlabs": {"concurrency": 4, "rpm": 0},
+}
+
+
+def load_limits():
+    """
+    Reads SCHEDULER_<PROVIDER>_CONCURRENCY and SCHEDULER_<PROVIDER>_RPM overrides from the environment.
+    """
+    limits = {}
+    for provider, defaults in DEFAULT_LIMITS.items():
+        prefix = f"SCHEDULER_{provider.upper()}"
+        limits[provider] = {
+            "concurrency": int(os.environ.get(f"{prefix}_CONCURRENCY", defaults["concurrency"])),
+            "rpm": float(os.environ.get(f"{prefix}_RPM", defaults["rpm"])),
+        }
+    return limits
+
+
+class _ProviderState:
+    """
+    Concurrency semaphore, token bucket and rate-limit pause for one provider on one event loop.
+    """
+
+    def __init__(self, concurrency, rpm, loop):
+        self.loop = loop
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rpm = rpm
+        self.tokens = max(1.0, rpm / 60) if rpm else 0.0  # Allow a burst of one second's worth
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rate_limited = 0
+        self.total_wait_seconds = 0.0
+
+    def take_token_delay(self):
+        """
+        Takes one token if available; otherwise returns how long to wait for the next one.
+        """
+        if not self.rpm:
+            return 0.0
+        now = time.monotonic()
+        rate = self.rpm / 60
+        self.tokens = min(max(1.0, rate), self.tokens + (now - self.last_refill) * rate)
+        self.last_refill = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+# Step 2: Scheduler
+class ProviderScheduler:
+    """
+    Queues upstream calls per provider with a concurrency limit, an optional requests-per-minute
+    budget, and a pause after the provider answers 429 (honouring Retry-After).
+    """
+
+    def __init__(self, limits=None):
+        self.limits = limits or load_limits()
+        self._states = {}
+
+    def _state(self, provider):
+        loop = asyncio.get_running_loop()
+        state = self._states.get(provider)
+        if state is None or state.loop is not loop:
+            # asyncio primitives belong to one event loop; rebuild them for a new loop
+            limit = self.limits.get(provider, {"concurrency": 4, "rpm": 0})
+            state = _ProviderState(limit["concurrency"], limit["rpm"], loop)
+            self._states[provider] = state
+        return state
+
+    @asynccontextmanager
+    async def slot(self, provider):
+        """
+        Waits for a free slot for the provider, then holds it for the duration of the block.
+        """
+        state = self._state(provider)
+        enqueued = time.monotonic()
+        state.waiting += 1
+        try:
+            await state.semaphore.acquire()
+            try:
+                while True:
+                    # Wait out a 429 pause before touching the bucket, so the pause does not
+                    # also drain the tokens that refill during it
+                    pause = state.paused_until - time.monotonic()
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+                        continue
+                    delay = state.take_token_delay()
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+            except BaseException:
+                state.semaphore.release()
+                raise
+        finally:
+            state.waiting -= 1
+        state.total_wait_seconds += time.monotonic() - enqueued
+        state.in_flight += 1
+        try:
+            yield
+        finally:
+            state.in_flight -= 1
+            state.completed += 1
+            state.semaphore.release()
+
+    def report_rate_limited(self, provider, retry_after=None):
+        """
+        Pauses new calls to a provider after it answered 429.
+        Args:
+            retry_after (float): Seconds from the Retry-After header, if any.
+        """
+        state = self._state(provider)
+        pause = retry_after if retry_after else 1.0
+        state.paused_until = max(state.paused_until, time.monotonic() + pause)
+        state.rate_limited += 1
+        logging.warning(f"{provider} is rate limited; pausing new requests for {pause:.1f}s.")
+
+    async def run(self, provider, call):
+        """
+        Runs `await call()` inside a provider slot, pausing the provider on HTTP 429.
+        """
+        async with self.slot(provider):
+            try:
+                return await call()
+            except Exception as e:
+                response = getattr(e, "response", None)
+                if getattr(response, "status_code", None) == 429 or getattr(e, "status_code", None) == 429:
+                    retry_after = None
+                    if response is not None:
+                        try:
+                            retry_after = float(response.headers.get("retry-after", 0)) or None
+                        except ValueError:
+                            retry_after = None
+                    self.report_rate_limited(provider, retry_after)
+                raise
+
+    def snapshot(self):
+        """
+        Returns queue depth, in-flight calls and average queue wait per provider.
+        """
+        return {
+            provider: {
+                "waiting": state.waiting,
+                "in_flight": state.in_flight,
+                "completed": state.completed,
+                "rate_limited": state.rate_limited,
+                "avg_wait_ms": round(1000 * state.total_wait_seconds / state.completed, 1) if state.completed else 0.0,
+            }
+            for provider, state in self._states.items()
+        }
+
+
+# Shared scheduler used by the async pipeline
+scheduler = ProviderScheduler()
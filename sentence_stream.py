@@ -0,0 +1,45 @@
+# Import necessary libraries
+import re  # For detecting sentence boundaries
+
+# Step 1: Sentence boundary settings
+# A boundary is sentence-ending punctuation followed by whitespace. Common
+# abbreviations are skipped so "Dr. Smith" is not split in two, and very short
+# fragments are merged into the next sentence to avoid tiny TTS requests.
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+ABBREVIATIONS = {"dr", "mr", "mrs", "ms", "st", "vs", "etc", "e.g", "i.e", "approx", "no"}
+MIN_SENTENCE_CHARS = 20
+
+
+def _is_abbreviation(text, end):
+    words = text[:end].rstrip(".!?\"')]").split()
+    return bool(words) and words[-1].lower().rstrip(".") in ABBREVIATIONS
+
+
+# Step 2: Split a stream of text fragments into sentences
+def split_sentences(fragments, min_chars=MIN_SENTENCE_CHARS):
+    """
+    Groups a stream of text fragments (e.g. LLM tokens) into complete sentences.
+    Each sentence is yielded as soon as its closing punctuation and the following
+    whitespace have arrived; the remainder is flushed when the stream ends.
+    Args:
+        fragments (iterable[str]): Text fragments in order.
+        min_chars (int): Sentences shorter than this are merged with the next one.
+    """
+    buffer = ""
+    for fragment in fragments:
+        buffer += fragment
+        search_from = 0
+        while True:
+            match = SENTENCE_END.search(buffer, search_from)
+            if not match:
+                break
+            end = match.end()
+            sentence = buffer[:end].strip()
+            if _is_abbreviation(buffer, match.start() + 1) or len(sentence) < min_chars:
+                search_from = end  # Keep accumulating into the same sentence
+                continue
+            yield sentence
+            buffer = buffer[end:]
+            search_from = 0
+    if buffer.strip():
+        yield buffer.strip()
@@ -0,0 +1,265 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For reading server settings from the environment
+import sys
+import hashlib  # For mapping affinity cookies to workers
+import argparse
+import logging
+import threading  # For the worker supervisor and the TTS prewarm
+import subprocess  # For running the worker processes
+import uuid
+
+import httpx  # For forwarding requests to the workers
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.routing import Route
+
+from metrics import configure_logging
+
+# Step 1: Server settings
+# One Python process serves one event loop, and CPU-bound work (audio and image preprocessing,
+# JSON, Gradio itself) competes with it for the GIL. WEB_WORKERS runs several copies of the app
+# behind a small sticky proxy so throughput scales with cores.
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "1"))  # Worker processes (1 = serve in-process)
+WEB_HOST = os.environ.get("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.environ.get("WEB_PORT", "7860"))  # Public port
+WEB_WORKER_BASE_PORT = int(os.environ.get("WEB_WORKER_BASE_PORT", "7870"))  # Workers listen on 127.0.0.1 from here
+WEB_PROXY_TIMEOUT = float(os.environ.get("WEB_PROXY_TIMEOUT", "300"))  # Longest idle gap in a proxied response
+
+AFFINITY_COOKIE = "voicebot_affinity"  # Same cookie as app.create_app()
+RESTART_DELAY_SECONDS = 2.0  # Pause before restarting a worker that exited
+
+# Connection-level headers that must not be forwarded by a proxy
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade",
+}
+
+
+def run_worker(port):
+    """
+    Runs one app process on 127.0.0.1:port (started by the supervisor).
+    """
+    import uvicorn
+    from app import create_app
+    from local_models import load_local_models
+
+    configure_logging()
+    # Each worker loads its own copy of the local models (STT_BACKENDS/TTS_BACKENDS=local)
+    threading.Thread(target=load_local_models, daemon=True, name="local-models").start()
+    uvicorn.run(create_app(), host="127.0.0.1", port=port, log_level="warning")
+
+
+# Step 2: Worker supervisor
+class WorkerPool:
+    """
+    Starts WEB_WORKERS app processes and restarts any that exit.
+    """
+
+    def __init__(self, count, base_port=WEB_WORKER_BASE_PORT):
+        self.ports = [base_port + index for index in range(count)]
+        self.processes = [None] * count
+        self.restarts = 0
+        self._stopping = threading.Event()
+
+    def _spawn(self, index):
+        env = dict(os.environ)
+        env["ADMISSION_TRUST_PROXY"] = "1"  # The proxy passes the real client address in X-Forwarded-For
+        env["WEB_WORKER_INDEX"] = str(index)
+        command = [sys.executable, os.path.abspath(__file__), "--worker-port", str(self.ports[index])]
+        self.processes[index] = subprocess.Popen(command, env=env)
+        logging.info(f"Started worker {index} on port {self.ports[index]} (pid {self.processes[index].pid}).")
+
+    def start(self):
+        for index in range(len(self.ports)):
+            self._spawn(index)
+        threading.Thread(target=self._supervise, daemon=True, name="worker-supervisor").start()
+
+    def _supervise(self):
+        while not self._stopping.wait(RESTART_DELAY_SECONDS):
+            for index, process in enumerate(self.processes):
+                if process.poll() is not None and not self._stopping.is_set():
+                    logging.error(f"Worker {index} exited with code {process.returncode}; restarting.")
+                    self.restarts += 1
+                    self._spawn(index)
+
+    def stop(self):
+        self._stopping.set()
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+# Step 3: Sticky reverse proxy
+# Gradio keeps its queue and per-tab state in the worker process: the SSE stream of a
+# submission and the request that joined the queue must reach the same worker. Requests are
+# routed by a hash of the affinity cookie, so a browser stays on one worker for its lifetime.
+def worker_for_cookie(cookie, count):
+    """
+    Maps an affinity cookie to a worker index.
+    """
+    return int(hashlib.sha1(cookie.encode()).hexdigest()[:8], 16) % count
+
+
+def build_proxy(pool):
+    """
+    Builds the public ASGI app forwarding to the pool, with aggregated /metrics and /healthz.
+    """
+    client = httpx.AsyncClient(timeout=httpx.Timeout(WEB_PROXY_TIMEOUT, connect=5.0),
+                               limits=httpx.Limits(max_connections=None, max_keepalive_connections=100))
+
+    async def proxy(request):
+        cookie = request.cookies.get(AFFINITY_COOKIE)
+        new_cookie = None
+        if not cookie:
+            # First visit: choose the cookie here, so this request and every later one agree
+            cookie = new_cookie = uuid.uuid4().hex
+        index = worker_for_cookie(cookie, len(pool.ports))
+
+        headers = [(name, value) for name, value in request.headers.raw if name.decode().lower() not in HOP_BY_HOP]
+        if new_cookie:
+            existing = request.headers.get("cookie")
+            headers = [(name, value) for name, value in headers if name.lower() != b"cookie"]
+            headers.append((b"cookie", (f"{existing}; " if existing else "").encode() + f"{AFFINITY_COOKIE}={new_cookie}".encode()))
+        peer = request.client.host if request.client else ""
+        forwarded = request.headers.get("x-forwarded-for")
+        headers = [(name, value) for name, value in headers if name.lower() != b"x-forwarded-for"]
+        headers.append((b"x-forwarded-for", (f"{forwarded}, {peer}" if forwarded else peer).encode()))
+
+        url = f"http://127.0.0.1:{pool.ports[index]}{request.url.path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+        upstream_request = client.build_request(request.method, url, headers=headers,
+                                                content=request.stream() if has_body else None)
+        try:
+            upstream = await client.send(upstream_request, stream=True)
+        except httpx.TransportError as e:
+            logging.warning(f"Worker {index} unavailable: {e}")
+            return PlainTextResponse("The server is restarting. Please retry shortly.", status_code=503,
+                                     headers={"Retry-After": "5"})
+
+        response_headers = [(name.lower(), value) for name, value in upstream.headers.raw if name.decode().lower() not in HOP_BY_HOP]
+        response = StreamingResponse(upstream.aiter_raw(), status_code=upstream.status_code,
+                                     background=BackgroundTask(upstream.aclose))
+        response.raw_headers = response_headers  # Keeps repeated headers such as Set-Cookie
+        if new_cookie:
+            response.set_cookie(AFFINITY_COOKIE, new_cookie, httponly=True, samesite="lax")
+        return response
+
+    async def fetch_all(path):
+        """
+        GETs path from every worker; a worker that does not answer yields None.
+        """
+        results = []
+        for port in pool.ports:
+            try:
+                results.append(await client.get(f"http://127.0.0.1:{port}{path}", timeout=5.0))
+            except httpx.TransportError:
+                results.append(None)
+        return results
+
+    async def metrics_endpoint(request):
+        texts = [response.text if response is not None and response.status_code == 200 else ""
+                 for response in await fetch_all("/metrics")]
+        return PlainTextResponse(merge_metrics(texts), media_type="text/plain; version=0.0.4")
+
+    async def health_endpoint(request):
+        workers = []
+        for index, response in enumerate(await fetch_all("/healthz")):
+            state = response.json() if response is not None else {"saturated": True, "down": True}
+            workers.append(dict(state, worker=index))
+        # Healthy while at least one worker can take new consultations
+        healthy = any(not state["saturated"] for state in workers)
+        return JSONResponse({"workers": workers, "restarts": pool.restarts}, status_code=200 if healthy else 503)
+
+    return Starlette(
+        routes=[
+            Route("/metrics", metrics_endpoint),
+            Route("/healthz", health_endpoint),
+            Route("/{path:path}", proxy, methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]),
+        ],
+        on_shutdown=[client.aclose],
+    )
+
+
+def merge_metrics(texts):
+    """
+    Merges the /metrics output of several workers, adding a worker="<index>" label to every
+    sample and writing each metric family's HELP/TYPE lines once.
+    """
+    families = {}  # name -> [HELP/TYPE lines, samples]; dicts keep first-seen order
+    for index, text in enumerate(texts):
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                family = line.split()[2]
+                header, _ = families.setdefault(family, [[], []])
+                if line not in header:
+                    header.append(line)
+            elif line and family is not None:
+                name, _, rest = line.partition(" ")
+                if "{" in name:
+                    name = name.replace("{", f'{{worker="{index}",', 1)
+                else:
+                    name = f'{name}{{worker="{index}"}}'
+                families[family][1].append(f"{name} {rest}")
+    lines = []
+    for header, samples in families.values():
+        lines.extend(header)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+# Step 4: Entry point
+def main():
+    parser = argparse.ArgumentParser(description="Serve the AI Doctor web app.")
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="Worker processes (1 = serve in-process)")
+    parser.add_argument("--host", default=WEB_HOST)
+    parser.add_argument("--port", type=int, default=WEB_PORT)
+    parser.add_argument("--worker-port", type=int, help=argparse.SUPPRESS)  # Used by the supervisor
+    args = parser.parse_args()
+
+    if args.worker_port:
+        run_worker(args.worker_port)
+        return
+
+    import uvicorn
+    from consultation import check_configuration, FALLBACK_MESSAGES
+    from doctor_voice_tts import prewarm_tts_cache
+
+    configure_logging()
+    check_configuration()  # Fail fast on missing API keys, before starting any worker
+    # The TTS cache lives on disk (TTS_CACHE_DIR), so one prewarm serves every worker
+    threading.Thread(target=prewarm_tts_cache, args=(FALLBACK_MESSAGES,), daemon=True).start()
+
+    if args.workers <= 1:
+        from app import create_app
+        from local_models import load_local_models
+        threading.Thread(target=load_local_models, daemon=True, name="local-models").start()
+        uvicorn.run(create_app(), host=args.host, port=args.port)
+        return
+
+    pool = WorkerPool(args.workers)
+    pool.start()
+    try:
+        logging.info(f"Serving {args.workers} workers on {args.host}:{args.port}.")
+        logging.getLogger("httpx").setLevel(logging.WARNING)  # Not one log line per proxied request
+        # Workers already send Date and Server headers
+        uvicorn.run(build_proxy(pool), host=args.host, port=args.port, log_level="warning",
+                    date_header=False, server_header=False)
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Import necessary libraries
+import os  # For reading the worker count from the environment
+import time  # For per-stage timings
+import logging
+import contextvars  # For carrying the request's trace ID into stage threads
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Step 1: Shared worker pool
+# Stages are mostly network waits (Groq, ElevenLabs) plus some Pillow work,
+# so threads are enough to overlap them. One pool is shared by all requests.
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", "16"))
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="stage")
+
+
+# Step 2: Stage definition
+class Stage:
+    """
+    One step of the consultation pipeline.
+    Args:
+        name (str): Unique stage name; other stages refer to it in `deps`.
+        fn (callable): Called with the results of its dependencies as keyword arguments.
+        deps (tuple): Names of the stages that must finish first.
+        fallback: Result used when `fn` raises, so downstream stages can still run.
+    """
+
+    def __init__(self, name, fn, deps=(), fallback=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.fallback = fallback
+
+
+class PipelineRun:
+    """
+    Results and timings of one run of a stage graph.
+    """
+
+    def __init__(self):
+        self.results = {}  # stage name -> result (or fallback)
+        self.errors = {}  # stage name -> exception
+        self.timings = {}  # stage name -> {"start_ms", "end_ms", "duration_ms"}
+        self.wall_ms = 0.0
+
+    @property
+    def sequential_ms(self):
+        """Total time the same stages would have taken one after another."""
+        return sum(t["duration_ms"] for t in self.timings.values())
+
+    @property
+    def saved_ms(self):
+        """End-to-end latency saved by running independent stages concurrently."""
+        return max(0.0, self.sequential_ms - self.wall_ms)
+
+    def summary(self):
+        stages = ", ".join(f"{name}={t['duration_ms']:.0f}ms" for name, t in self.timings.items())
+        return f"{stages} | wall={self.wall_ms:.0f}ms, sequential={self.sequential_ms:.0f}ms, saved={self.saved_ms:.0f}ms"
+
+
+# Step 3: Dependency-graph executor
+def run_stages(stages):
+    """
+    Runs a set of stages, starting each one as soon as all its dependencies have finished.
+    Independent stages run concurrently on the shared thread pool.
+    Args:
+        stages (list[Stage]): The stages to run; dependencies must be part of the list.
+    Returns:
+        PipelineRun: Per-stage results, errors and timings.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stage(s): {missing}")
+
+    run = PipelineRun()
+    pipeline_start = time.perf_counter()
+
+    def execute(stage):
+        start = time.perf_counter()
+        try:
+            result = stage.fn(**{dep: run.results[dep] for dep in stage.deps})
+            error = None
+        except Exception as e:
+            logging.error(f"Error during stage '{stage.name}': {e}")
+            result, error = stage.fallback, e
+        end = time.perf_counter()
+        return stage.name, result, error, start, end
+
+    pending = dict(by_name)
+    running = {}
+    while pending or running:
+        # Start every stage whose dependencies are satisfied
+        for name, stage in list(pending.items()):
+            if all(dep in run.results for dep in stage.deps):
+                context = contextvars.copy_context()  # Each stage sees the request's trace ID
+                running[_executor.submit(context.run, execute, stage)] = name
+                del pending[name]
+        if not running:
+            raise ValueError(f"Dependency cycle between stages: {sorted(pending)}")
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            del running[future]
+            name, result, error, start, end = future.result()
+            run.results[name] = result
+            if error is not None:
+                run.errors[name] = error
+            run.timings[name] = {
+                "start_ms": (start - pipeline_start) * 1000,
+                "end_ms": (end - pipeline_start) * 1000,
+                "duration_ms": (end - start) * 1000,
+            }
+
+    run.wall_ms = (time.perf_counter() - pipeline_start) * 1000
+    return run
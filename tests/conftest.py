@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the repository root, next to app.py; the fake providers live in benchmarks/
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture
+def fake_providers(monkeypatch):
+    """
+    Points every provider at the local fake Groq/ElevenLabs server with fresh clients,
+    routers and statistics, and turns the TTS and response caches off.
+    """
+    import provider_clients
+    import provider_router
+    import doctor_voice_tts
+    import response_cache
+    from fake_providers import FakeProviders, EndpointConfig
+
+    def instant(payload_size):
+        return EndpointConfig(latency_ms=0, jitter_ms=0, payload_size=payload_size)
+
+    with FakeProviders(stt=instant(5), vision=instant(20), tts=instant(2000)) as fake:
+        monkeypatch.setenv("GROQ_API_KEY", "fake-groq-key")
+        monkeypatch.setenv("ELEVENLABS_API_KEY", "fake-elevenlabs-key")
+        monkeypatch.setattr(provider_clients, "GROQ_BASE_URL", fake.base_url)
+        monkeypatch.setattr(provider_clients, "ELEVENLABS_BASE_URL", fake.base_url)
+        monkeypatch.setattr(provider_clients, "MAX_RETRIES", 0)  # Failures are injected on purpose
+        monkeypatch.setattr(provider_clients, "_clients", {})
+        monkeypatch.setattr(provider_clients, "_stats", {})
+        monkeypatch.setattr(provider_router, "_routers", {})
+        monkeypatch.setattr(doctor_voice_tts, "TTS_CACHE_ENABLED", False)
+        monkeypatch.setattr(response_cache.response_cache, "enabled", False)
+        yield fake
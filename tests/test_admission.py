@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_admits_up_to_the_limit_and_queues_the_rest():
+    controller = AdmissionController(max_concurrent=2, max_queue=2, max_wait=5, client_rpm=0)
+    peak = []
+
+    async def consult(index):
+        async with controller.admit(f"client-{index}"):
+            peak.append(controller.in_flight)
+            await asyncio.sleep(0.02)
+
+    async def main():
+        await asyncio.gather(*[consult(index) for index in range(4)])
+
+    asyncio.run(main())
+    assert max(peak) == 2
+    assert controller.admitted == 4
+    assert controller.in_flight == 0 and controller.waiting == 0
+
+
+def test_full_queue_is_rejected_immediately():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=5, client_rpm=0)
+
+    async def hold(release):
+        async with controller.admit("a"):
+            await release.wait()
+
+    async def main():
+        release = asyncio.Event()
+        holders = [asyncio.ensure_future(hold(release)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as excinfo:
+            async with controller.admit("b"):
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        return excinfo.value
+
+    rejection = asyncio.run(main())
+    assert rejection.reason == "queue_full"
+    assert rejection.retry_after >= 1
+
+
+def test_waiting_too_long_is_rejected_and_frees_the_queue():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, max_wait=0.05, client_rpm=0)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.admit("a"):
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as excinfo:
+            async with controller.admit("b"):
+                pass
+        assert controller.waiting == 0
+        release.set()
+        await holder
+        async with controller.admit("b"):  # The slot was not leaked
+            pass
+        return excinfo.value.reason
+
+    assert asyncio.run(main()) == "timeout"
+
+
+def test_client_rate_limit_allows_a_burst():
+    controller = AdmissionController(max_concurrent=4, max_queue=4, max_wait=1, client_rpm=1, client_burst=2)
+
+    async def main():
+        for _ in range(2):
+            async with controller.admit("a"):
+                pass
+        async with controller.admit("other"):
+            pass
+        with pytest.raises(AdmissionRejected) as excinfo:
+            async with controller.admit("a"):
+                pass
+        return excinfo.value.reason
+
+    assert asyncio.run(main()) == "rate_limited"
+
+
+def test_queue_full_rejection_does_not_use_the_client_allowance():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, max_wait=1, client_rpm=1, client_burst=1)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.admit("other"):
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as excinfo:
+            async with controller.admit("a"):
+                pass
+        assert excinfo.value.reason == "queue_full"
+        release.set()
+        await holder
+        async with controller.admit("a"):  # Still has its one token
+            pass
+
+    asyncio.run(main())
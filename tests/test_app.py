@@ -0,0 +1,27 @@
+import os
+import asyncio
+
+import app
+from live_transcription import LiveTranscription
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "acne.webp")
+
+
+def handler(name):
+    return next(block_fn.fn for block_fn in app.demo.fns.values() if block_fn.name == name)
+
+
+def test_submit_resets_the_live_recording(fake_providers):
+    live = LiveTranscription(transcribe=lambda chunk: "unused")
+    live.finish()
+    on_submit = handler("on_submit")
+
+    async def submit():
+        return [outputs async for outputs in on_submit(None, live, None, IMAGE, False, None)]
+
+    outputs = asyncio.run(submit())
+    assert outputs[-1][-1] is None  # The next submit does not reuse this recording's transcript
+
+
+def test_clearing_the_microphone_forgets_the_recording():
+    assert handler("on_clear_recording")() == (None, "")
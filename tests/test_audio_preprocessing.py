@@ -0,0 +1,93 @@
+import io
+import os
+import wave
+
+import numpy as np
+
+from audio_preprocessing import read_audio, prepare_audio
+
+
+def make_wav(seconds=1.0, sample_rate=16000, channels=1, amplitude=0.3, silence=0.0):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = amplitude * np.sin(2 * np.pi * 220 * t)
+    quiet = rng.normal(0, 0.0005, int(silence * sample_rate))
+    signal = np.concatenate([quiet, tone, quiet])
+    samples = (np.repeat(signal[:, None], channels, axis=1) * 32767).astype(np.int16)
+    return wav_bytes(samples, sample_rate, channels)
+
+
+def wav_bytes(samples, sample_rate=16000, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def test_read_audio_names_in_memory_recordings_by_container():
+    assert read_audio(make_wav()) == ("recording.wav", make_wav())
+    assert read_audio(b"fLaC" + b"\x00" * 8)[0] == "recording.flac"
+    assert read_audio(io.BytesIO(b"ID3" + b"\x00" * 8))[0] == "recording.mp3"
+
+
+def test_read_audio_accepts_a_path(tmp_path):
+    path = tmp_path / "voice.wav"
+    path.write_bytes(make_wav())
+    assert read_audio(str(path)) == ("voice.wav", make_wav())
+
+
+def test_prepare_audio_works_in_memory_without_writing_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    prepared = prepare_audio(make_wav(seconds=2.0, sample_rate=48000, channels=2, silence=2.0), audio_format="wav")
+    assert len(prepared.chunks) == 1
+    name, data = prepared.chunks[0]
+    assert name == "recording_0.wav"
+    with wave.open(io.BytesIO(data)) as wav_file:
+        assert (wav_file.getnchannels(), wav_file.getframerate()) == (1, 16000)
+    assert os.listdir(tmp_path) == []
+
+
+def samples_of(data):
+    with wave.open(io.BytesIO(data)) as wav_file:
+        return np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+
+
+def test_prepare_audio_trims_silence_and_normalizes_the_peak():
+    prepared = prepare_audio(make_wav(seconds=2.0, amplitude=0.1, silence=3.0), audio_format="wav")
+    assert prepared.original_seconds == 8.0
+    assert 2.0 <= prepared.speech_seconds <= 2.6  # The speech plus a little padding
+    assert prepared.encoded_bytes < prepared.original_bytes
+    peak = np.max(np.abs(samples_of(prepared.chunks[0][1]).astype(np.int32))) / 32768
+    assert 20 * np.log10(peak) > -1.5
+
+
+def test_prepare_audio_splits_long_recordings_at_silence():
+    sentence = samples_of(make_wav(seconds=4.0, silence=1.0))
+    data = wav_bytes(np.concatenate([sentence, sentence]))
+    prepared = prepare_audio(data, audio_format="wav", max_chunk_seconds=6.0)
+    assert [name for name, _ in prepared.chunks] == ["recording_0.wav", "recording_1.wav"]
+    first = samples_of(prepared.chunks[0][1])
+    assert 4.0 <= len(first) / 16000 <= 6.0
+    assert np.max(np.abs(first[-160:].astype(np.int32))) < 1000  # Cut in the pause, not mid-word
+
+
+def test_prepare_audio_returns_no_chunks_without_speech():
+    prepared = prepare_audio(make_wav(seconds=0.0, silence=2.0), audio_format="wav")
+    assert prepared.chunks == []
+    assert prepared.speech_seconds == 0.0
+
+
+def test_prepare_audio_uploads_undecodable_audio_unchanged():
+    raw = b"\x00\x01" * 1000
+    prepared = prepare_audio(raw, audio_format="wav")
+    assert prepared.chunks == [("recording.wav", raw)]
+    assert prepared.mime_type is None
+
+
+def test_prepare_audio_encodes_flac_by_default():
+    prepared = prepare_audio(make_wav(seconds=2.0, silence=1.0))
+    assert prepared.mime_type == "audio/flac"
+    assert prepared.chunks[0][1].startswith(b"fLaC")
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import shutil
+
+import pytest
+
+import batch_consultation
+from batch_consultation import ResultWriter, load_cases, finished_case_ids, run_pool, run_groq_batch
+from consultation import NO_IMAGE_MESSAGE
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "acne.webp")
+
+
+def write_manifest(path, entries):
+    path.write_text("\n".join(json.dumps(entry) for entry in entries) + "\n\n", encoding="utf-8")
+    return str(path)
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as results:
+        return {record["id"]: record for record in map(json.loads, results)}
+
+
+@pytest.fixture
+def cases(tmp_path):
+    shutil.copy(IMAGE, tmp_path / "001.webp")
+    return load_cases(write_manifest(tmp_path / "cases.jsonl", [
+        {"id": "with-image", "image": "001.webp", "transcript": "Is this acne?"},
+        {"id": "no-image", "transcript": "Is it contagious?"},
+    ]))
+
+
+def test_manifest_paths_are_relative_to_the_manifest(tmp_path, caplog):
+    manifest = write_manifest(tmp_path / "cases.jsonl", [
+        {"case_id": "a", "audio": "a.wav", "image": "/data/a.jpg"},
+        {"transcript": "Just a question"},
+        {"id": "empty"},
+    ])
+    assert load_cases(manifest) == [
+        {"id": "a", "audio": str(tmp_path / "a.wav"), "image": "/data/a.jpg", "transcript": None},
+        {"id": "line-2", "audio": None, "image": None, "transcript": "Just a question"},
+    ]
+    assert "Skipping manifest line 3" in caplog.text
+
+
+def test_directory_cases_are_grouped_by_file_name(tmp_path):
+    for name in ("001.wav", "001.jpg", "002.png", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    assert load_cases(str(tmp_path)) == [
+        {"id": "001", "audio": str(tmp_path / "001.wav"), "image": str(tmp_path / "001.jpg"), "transcript": None},
+        {"id": "002", "audio": None, "image": str(tmp_path / "002.png"), "transcript": None},
+    ]
+
+
+def test_finished_cases_are_read_from_the_results_file(tmp_path):
+    results = tmp_path / "results.jsonl"
+    results.write_text('{"id": "a", "status": "ok"}\n{"id": "b", "status": "error"}\n{"id": "c", "sta', encoding="utf-8")
+    assert finished_case_ids(str(results)) == {"a", "b"}
+    assert finished_case_ids(str(results), retry_failed=True) == {"a"}
+    assert finished_case_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_worker_pool_writes_one_record_per_case(fake_providers, cases, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    writer = ResultWriter(output)
+    run_pool(cases, writer, workers=2, audio_dir=str(tmp_path / "audio"))
+    writer.close()
+
+    results = read_results(output)
+    assert results["no-image"]["response"] == NO_IMAGE_MESSAGE
+    assert results["with-image"]["status"] == "ok"
+    assert results["with-image"]["transcript"] == "Is this acne?"
+    assert os.path.getsize(results["with-image"]["audio_output"]) > 0
+    assert results["with-image"]["mode"] == "pool"
+
+
+def test_worker_pool_can_skip_speech(fake_providers, cases, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    writer = ResultWriter(output)
+    run_pool(cases, writer, workers=2, skip_tts=True)
+    writer.close()
+    record = read_results(output)["with-image"]
+    assert record["audio_output"] is None
+    assert "speak" not in record["timings_ms"]
+
+
+def test_rerun_skips_finished_cases(fake_providers, cases, tmp_path, monkeypatch):
+    output = str(tmp_path / "results.jsonl")
+    with open(output, "w", encoding="utf-8") as results:
+        results.write(json.dumps({"id": "with-image", "status": "ok"}) + "\n")
+    monkeypatch.setattr(batch_consultation, "load_cases", lambda source: cases)
+    monkeypatch.setattr(batch_consultation, "load_local_models", lambda: None)
+    monkeypatch.setattr(sys, "argv", ["batch_consultation.py", "cases.jsonl", "--output", output, "--skip-tts"])
+    batch_consultation.main()
+    with open(output, encoding="utf-8") as results:
+        assert [json.loads(line)["id"] for line in results] == ["with-image", "no-image"]
+
+
+def test_groq_batch_answers_every_case(fake_providers, cases, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    writer = ResultWriter(output)
+    run_groq_batch(cases, writer, output, workers=2, audio_dir=str(tmp_path / "audio"), poll_interval=0)
+    writer.close()
+
+    results = read_results(output)
+    assert {record["mode"] for record in results.values()} == {"groq_batch"}
+    assert results["with-image"]["status"] == "ok" and results["with-image"]["response"]
+    assert results["no-image"]["response"] == NO_IMAGE_MESSAGE
+    assert not os.path.exists(batch_consultation._checkpoint_path(output))
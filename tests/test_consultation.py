@@ -0,0 +1,51 @@
+import io
+import os
+import wave
+import asyncio
+
+import numpy as np
+
+import consultation
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE = os.path.join(ROOT, "acne.webp")
+
+
+def recording():
+    t = np.arange(16000 * 2) / 16000
+    samples = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def test_consultation_runs_every_stage(fake_providers):
+    run = consultation.run_consultation(recording(), IMAGE)
+    assert not run.errors
+    assert run.results["transcribe"]
+    assert run.results["analyze"] not in (consultation.ANALYSIS_ERROR_MESSAGE, consultation.NO_IMAGE_MESSAGE)
+    assert isinstance(run.results["speak"], bytes) and run.results["speak"]
+    assert set(run.timings) == {"transcribe", "encode", "analyze", "speak"}
+
+
+def test_consultation_without_image_explains_why(fake_providers):
+    transcript, response, audio = consultation.process_inputs(None, None, transcript="Is this acne?")
+    assert (transcript, response) == ("Is this acne?", consultation.NO_IMAGE_MESSAGE)
+    assert audio
+
+
+def test_vision_failure_falls_back_to_the_error_message(fake_providers):
+    fake_providers.config["vision"].error_rate = 1.0
+    transcript, response, audio = consultation.process_inputs(None, IMAGE, transcript="Is this acne?")
+    assert response == consultation.ANALYSIS_ERROR_MESSAGE
+    assert audio  # The error message is still spoken
+
+
+def test_async_consultation_matches_the_sync_stages(fake_providers):
+    run = asyncio.run(consultation.run_consultation_async(recording(), IMAGE))
+    assert not run.errors
+    assert run.results["analyze"] and run.results["speak"]
@@ -0,0 +1,57 @@
+import time
+
+import conversation
+from conversation import ConsultationSession, SessionRegistry, Turn, estimate_tokens
+
+
+def test_first_turn_prompt_is_just_the_transcript():
+    session = ConsultationSession()
+    assert session.patient_context("Is this acne?") == "Is this acne?"
+
+
+def test_history_keeps_recent_turns_within_the_token_budget(monkeypatch):
+    monkeypatch.setattr(conversation, "SESSION_HISTORY_TOKENS", 40)
+    session = ConsultationSession()
+    session.turns = [Turn(f"question {index} " + "word " * 10, f"answer {index}") for index in range(5)]
+    context = session.patient_context("Is it contagious?")
+    assert context.endswith("Current question: Is it contagious?")
+    assert "answer 4" in context
+    assert "answer 0" not in context
+    assert estimate_tokens(context) <= 40 + estimate_tokens("Current question: Is it contagious?") + 10
+
+
+def test_turns_are_bounded(monkeypatch):
+    monkeypatch.setattr(conversation, "SESSION_MAX_TURNS", 3)
+    session = ConsultationSession()
+    for index in range(5):
+        session.add_turn(f"q{index}", f"a{index}")
+    assert [turn.patient for turn in session.turns] == ["q2", "q3", "q4"]
+
+
+def test_discard_clears_the_session():
+    registry = SessionRegistry()
+    session = ConsultationSession()
+    session.add_turn("q", "a")
+    registry.add(session)
+    registry.discard(session)
+    assert session.turns == []
+    assert registry.snapshot()["sessions"] == 0
+
+
+def test_discard_accepts_an_empty_state():
+    # Gradio calls the delete callback with None when the tab never submitted
+    SessionRegistry().discard(None)
+
+
+def test_idle_and_excess_sessions_are_cleared():
+    registry = SessionRegistry(max_sessions=3, idle_seconds=60)
+    idle, old, recent = ConsultationSession(), ConsultationSession(), ConsultationSession()
+    for session in (idle, old, recent):
+        registry.add(session)
+        session.add_turn("q", "a")
+    now = time.monotonic()
+    idle.last_active, old.last_active, recent.last_active = now - 120, now - 10, now
+    registry.max_sessions = 1
+    assert registry.evict() == 2
+    assert idle.turns == [] and old.turns == []
+    assert recent.turns == [Turn("q", "a")]
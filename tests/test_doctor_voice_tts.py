@@ -0,0 +1,90 @@
+import asyncio
+import shutil
+import platform
+
+import pytest
+
+import doctor_voice_tts
+
+
+@pytest.fixture
+def no_player(monkeypatch):
+    started = []
+    monkeypatch.setattr(doctor_voice_tts, "play_audio", lambda filepath, wait=False: started.append(filepath))
+    return started
+
+
+def test_synthesis_returns_audio_without_playing_it(fake_providers, no_player):
+    audio = doctor_voice_tts.synthesize_speech("Keep the area clean.")
+    assert isinstance(audio, bytes) and audio
+    assert no_player == []
+
+
+def test_saving_to_a_file_does_not_play_by_default(fake_providers, no_player, tmp_path):
+    output = tmp_path / "answer.mp3"
+    doctor_voice_tts.text_to_speech_with_elevenlabs("Keep the area clean.", str(output))
+    assert output.read_bytes()
+    assert no_player == []
+
+
+def test_playback_is_opt_in(fake_providers, no_player, tmp_path):
+    output = tmp_path / "answer.mp3"
+    doctor_voice_tts.text_to_speech_with_elevenlabs("Keep the area clean.", str(output), play=True)
+    assert no_player == [str(output)]
+
+
+def test_player_command_per_platform(monkeypatch):
+    monkeypatch.setattr(platform, "system", lambda: "Darwin")
+    assert doctor_voice_tts._player_command("a.mp3") == ["afplay", "a.mp3"]
+
+
+def test_linux_player_must_decode_mp3(monkeypatch):
+    monkeypatch.setattr(platform, "system", lambda: "Linux")
+    monkeypatch.setattr(shutil, "which", lambda name: name == "mpg123")
+    assert doctor_voice_tts._player_command("a.mp3") == ["mpg123", "-q", "a.mp3"]
+    monkeypatch.setattr(shutil, "which", lambda name: None)
+    with pytest.raises(OSError):
+        doctor_voice_tts._player_command("a.mp3")
+
+
+def test_playback_errors_are_reported_not_raised(monkeypatch):
+    monkeypatch.setattr(platform, "system", lambda: "Plan 9")
+    assert doctor_voice_tts.play_audio("a.mp3") is None
+
+
+@pytest.fixture
+def routed_tts(tmp_path, monkeypatch):
+    from tts_cache import TTSCache
+    from provider_router import Backend, ProviderRouter
+
+    def fail(text):
+        raise RuntimeError("voice down")
+
+    calls = []
+    preferred = Backend("preferred", lambda text: calls.append("preferred") or b"preferred", cache_key=("preferred", "v", None))
+    fallback = Backend("fallback", lambda text: calls.append("fallback") or b"fallback", fallback_only=True, cache_key=("fallback", "v", None))
+    router = ProviderRouter("tts", [preferred, fallback])
+    monkeypatch.setattr(doctor_voice_tts, "get_router", lambda kind: router)
+    monkeypatch.setattr(doctor_voice_tts, "TTS_CACHE_ENABLED", True)
+    monkeypatch.setattr(doctor_voice_tts, "tts_cache", TTSCache(directory=str(tmp_path / "tts")))
+    return preferred, calls, fail
+
+
+def test_cache_hits_are_not_measured_as_backend_latency(routed_tts):
+    preferred, calls, _ = routed_tts
+    assert doctor_voice_tts.synthesize_speech("Keep the area clean.") == b"preferred"
+    ewma, samples = preferred.ewma_ms, preferred.samples
+    for _ in range(5):
+        assert doctor_voice_tts.synthesize_speech("Keep the area clean.") == b"preferred"
+    assert calls == ["preferred"]
+    assert (preferred.ewma_ms, preferred.samples) == (ewma, samples)
+
+
+def test_fallback_audio_is_not_cached(routed_tts):
+    preferred, calls, fail = routed_tts
+    working = preferred.call
+    preferred.call = fail
+    assert doctor_voice_tts.synthesize_speech("Keep the area clean.") == b"fallback"
+    preferred.call = working
+    assert asyncio.run(doctor_voice_tts.synthesize_speech_async("Keep the area clean.")) == b"preferred"
+    assert calls == ["fallback", "preferred"]
@@ -0,0 +1,57 @@
+import io
+import base64
+
+import numpy as np
+from PIL import Image
+
+import image_preprocessing
+from image_preprocessing import prepare_image
+
+
+def write_photo(path, size=(3000, 2000), orientation=None, image_format="JPEG"):
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    image = Image.fromarray(pixels)
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(path, format=image_format, quality=95, exif=exif)
+    return path
+
+
+def decode(prepared):
+    return Image.open(io.BytesIO(base64.b64decode(prepared.data)))
+
+
+def test_large_photo_is_downscaled_and_bounded(tmp_path):
+    prepared = prepare_image(str(write_photo(tmp_path / "photo.jpg")), max_edge=1024, max_bytes=200 * 1024)
+    assert max(prepared.width, prepared.height) <= 1024
+    assert prepared.encoded_bytes <= 200 * 1024 < prepared.original_bytes
+    assert prepared.mime_type == "image/jpeg"
+    assert decode(prepared).size == (prepared.width, prepared.height)
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    prepared = prepare_image(str(write_photo(tmp_path / "rotated.jpg", size=(400, 200), orientation=6)), max_edge=1024)
+    assert (prepared.width, prepared.height) == (200, 400)
+
+
+def test_small_upright_upload_is_sent_unchanged(tmp_path):
+    path = write_photo(tmp_path / "small.jpg", size=(64, 64))
+    prepared = prepare_image(str(path))
+    assert base64.b64decode(prepared.data) == path.read_bytes()
+
+
+def test_webp_output_has_matching_mime_type(tmp_path):
+    prepared = prepare_image(str(write_photo(tmp_path / "photo.png", size=(1200, 800), image_format="PNG")),
+                             image_format="WEBP")
+    assert prepared.mime_type == "image/webp"
+    assert decode(prepared).format == "WEBP"
+
+
+def test_resubmitted_image_is_served_from_the_cache(tmp_path):
+    path = str(write_photo(tmp_path / "again.jpg", size=(1500, 1000)))
+    hits = image_preprocessing.cache_stats["hits"]
+    first = prepare_image(path)
+    assert prepare_image(path) is first
+    assert image_preprocessing.cache_stats["hits"] == hits + 1
@@ -0,0 +1,21 @@
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_pipeline_is_cheap_and_silent(tmp_path):
+    # Importing must not need an API key, print, exit, or pull in the UI and provider SDKs
+    code = (
+        "import sys\n"
+        "import consultation, ai_medical_assistant, patient_query, doctor_voice_tts\n"
+        "heavy = ('gradio', 'groq', 'elevenlabs', 'httpx', 'gtts', 'speech_recognition', 'pydub')\n"
+        "sys.stderr.write(','.join(name for name in heavy if name in sys.modules))\n"
+    )
+    env = {key: value for key, value in os.environ.items() if not key.endswith("_API_KEY")}
+    env["PYTHONPATH"] = ROOT
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == ""
+    assert result.stderr == ""
@@ -0,0 +1,118 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from live_transcription import LiveTranscription, to_mono_16k
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t) * 32767).astype(np.int16)
+
+
+def silence(seconds):
+    return (np.random.default_rng(0).normal(0, 0.0005, int(seconds * RATE)) * 32767).astype(np.int16)
+
+
+def feed(live, samples, window_seconds=0.5):
+    step = int(window_seconds * RATE)
+    for start in range(0, samples.size, step):
+        live.add_audio(samples[start:start + step], RATE)
+
+
+class Recorder:
+    """
+    Stands in for Whisper: answers with the segment's file name and remembers each call.
+    """
+
+    def __init__(self, release=None):
+        self.chunks = []
+        self.release = release
+
+    def __call__(self, chunk):
+        if self.release is not None:
+            self.release.wait(5)
+        self.chunks.append(chunk)
+        return chunk[0].split(".")[0]
+
+
+def test_segments_are_sent_at_pauses_while_recording():
+    recorder = Recorder()
+    live = LiveTranscription(transcribe=recorder)
+    feed(live, np.concatenate([tone(5), silence(1)]))
+    assert len(live._segments) == 1  # Sent before the patient stops
+    feed(live, np.concatenate([tone(2), silence(0.5)]))
+    assert live.finish() == "live_0 live_1"
+    assert len(recorder.chunks) == 2
+
+
+def test_long_speech_without_pauses_is_cut_at_the_maximum():
+    live = LiveTranscription(transcribe=Recorder())
+    feed(live, tone(20))
+    assert len(live._segments) == 1
+    assert live.finish() == "live_0 live_1"
+
+
+def test_silence_is_never_sent():
+    recorder = Recorder()
+    live = LiveTranscription(transcribe=recorder)
+    feed(live, silence(6))
+    assert live.finish() == ""
+    assert recorder.chunks == []
+
+
+def test_partial_transcript_keeps_speaking_order():
+    release = threading.Event()
+    live = LiveTranscription(transcribe=Recorder(release))
+    feed(live, np.concatenate([tone(5), silence(1)]))
+    assert live.partial_transcript() == ""
+    release.set()
+    assert live.finish() == "live_0"
+    assert live.partial_transcript() == "live_0"
+
+
+def test_finish_is_idempotent_and_closes_the_recording():
+    live = LiveTranscription(transcribe=Recorder())
+    feed(live, tone(1))
+    assert live.finish() == live.finish() == "live_0"
+    assert live.recorded_seconds == 1.0
+    with pytest.raises(RuntimeError):
+        live.add_audio(tone(0.5), RATE)
+
+
+def test_a_failed_segment_does_not_lose_the_rest():
+    def flaky(chunk):
+        if chunk[0].startswith("live_0"):
+            raise RuntimeError("whisper down")
+        return "still here"
+
+    live = LiveTranscription(transcribe=flaky)
+    feed(live, np.concatenate([tone(5), silence(1), tone(1)]))
+    assert live.finish() == "still here"
+
+
+def test_windows_are_converted_to_16k_mono():
+    stereo = np.stack([np.full(48000, 0.5), np.zeros(48000)], axis=1).astype(np.float32)
+    samples = to_mono_16k(stereo, 48000)
+    assert samples.dtype == np.int16 and samples.size == 16000
+    assert np.all(np.abs(samples - 8192) <= 1)
+
+
+def test_finish_does_not_block_the_stream_handlers():
+    release = threading.Event()
+    live = LiveTranscription(transcribe=Recorder(release))
+    feed(live, tone(1))
+    finisher = threading.Thread(target=live.finish)
+    finisher.start()
+    while not live._closed:
+        time.sleep(0.001)
+    assert live.partial_transcript() == ""  # Returns while finish() is still waiting
+    with pytest.raises(RuntimeError):
+        live.add_audio(tone(0.5), RATE)
+    release.set()
+    finisher.join(5)
+    assert live.finish() == "live_0"
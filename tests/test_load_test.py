@@ -0,0 +1,52 @@
+import os
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import consultation
+import load_test
+from fake_providers import FakeProviders, EndpointConfig
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "acne.webp")
+
+
+def post(url, body):
+    request = urllib.request.Request(url, json.dumps(body).encode(), {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return response.headers["Content-Type"], response.read()
+
+
+def test_percentile_picks_the_nearest_rank():
+    values = list(range(101))
+    assert load_test.percentile(values, 50) == 50
+    assert load_test.percentile(values, 99) == 99
+    assert load_test.percentile(values, 100) == 100
+    assert load_test.percentile([], 95) == 0.0
+
+
+def test_fake_server_answers_like_the_providers():
+    tts = EndpointConfig(latency_ms=0, jitter_ms=0, payload_size=123)
+    with FakeProviders(tts=tts, vision=EndpointConfig(latency_ms=0, jitter_ms=0)) as fake:
+        content_type, body = post(f"{fake.base_url}/v1/text-to-speech/fakevoice", {"text": "Hello"})
+        assert (content_type, len(body)) == ("audio/mpeg", 123)
+        _, body = post(f"{fake.base_url}/openai/v1/chat/completions", {"messages": []})
+        assert json.loads(body)["choices"][0]["message"]["content"].endswith(".")
+
+
+def test_fake_server_injects_failures():
+    with FakeProviders(tts=EndpointConfig(latency_ms=0, jitter_ms=0, error_rate=1.0)) as fake:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post(f"{fake.base_url}/v1/text-to-speech/fakevoice", {"text": "Hello"})
+        assert error.value.code == 500
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_load_level_reports_every_stage(fake_providers, mode):
+    result = load_test.run_level(consultation, mode, concurrency=4, total=8, audio_path=None, image_path=IMAGE)
+    summary = load_test.summarize(mode, 4, 8, result)
+    assert len(result["samples"]["end_to_end"]) == 8
+    assert summary["errors"] == {stage: 0 for stage in load_test.STAGES}
+    assert set(summary["latency_ms"]) == set(load_test.STAGES) | {"end_to_end"}
+    assert summary["rps"] > 0
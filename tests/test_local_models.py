@@ -0,0 +1,112 @@
+import sys
+import time
+import types
+import asyncio
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+import local_models
+from local_models import LocalWhisper, InferenceWorker, SAMPLE_RATE
+
+Segment = namedtuple("Segment", ["start", "text"])
+
+
+class FakeWhisperModel:
+    """Says which recording it heard: every fake clip is filled with its patient number."""
+
+    def __init__(self, *args, **kwargs):
+        self.calls = 0
+
+    def transcribe(self, audio, **kwargs):
+        self.calls += 1
+        time.sleep(0.01)
+        return iter([Segment(0.0, f" patient {int(audio[0])} ")]), None
+
+
+class FakeBatchedPipeline:
+    def __init__(self, model):
+        self.calls = 0
+
+    def transcribe(self, audio, **kwargs):
+        self.calls += 1
+        return iter([Segment(0.0, f"long {int(audio[0])}"), Segment(30.0, "continued")]), None
+
+
+@pytest.fixture
+def fake_faster_whisper(monkeypatch):
+    module = types.ModuleType("faster_whisper")
+    module.WhisperModel = FakeWhisperModel
+    module.BatchedInferencePipeline = FakeBatchedPipeline
+    audio = types.ModuleType("faster_whisper.audio")
+    audio.decode_audio = lambda buffer, sampling_rate: np.frombuffer(buffer.read(), dtype=np.float32)
+    module.audio = audio
+    monkeypatch.setitem(sys.modules, "faster_whisper", module)
+    monkeypatch.setitem(sys.modules, "faster_whisper.audio", audio)
+    return module
+
+
+def clip(patient, seconds):
+    return ("recording.wav", np.full(int(seconds * SAMPLE_RATE), patient, dtype=np.float32).tobytes())
+
+
+def test_concurrent_requests_get_their_own_transcripts(fake_faster_whisper):
+    whisper = LocalWhisper("fake")
+
+    async def main():
+        return await asyncio.gather(whisper.transcribe_async(clip(1, 3)), whisper.transcribe_async(clip(2, 5)))
+
+    assert asyncio.run(main()) == ["patient 1", "patient 2"]
+    assert whisper._model.calls == 2
+
+
+def test_a_bad_clip_fails_only_its_own_request(fake_faster_whisper):
+    whisper = LocalWhisper("fake")
+    futures = [whisper.worker.submit(clip(1, 3)), whisper.worker.submit(("bad.wav", b"\x00")), whisper.worker.submit(clip(2, 3))]
+    assert futures[0].result(5) == "patient 1"
+    with pytest.raises(Exception):
+        futures[1].result(5)
+    assert futures[2].result(5) == "patient 2"
+
+
+def test_long_recordings_use_the_batched_pipeline(fake_faster_whisper):
+    whisper = LocalWhisper("fake")
+    assert whisper.transcribe(clip(3, 40)) == "long 3 continued"
+    assert whisper._batched.calls == 1
+    assert whisper.transcribe(clip(4, 10)) == "patient 4"
+    assert whisper._batched.calls == 1
+
+
+def test_broken_batched_pipeline_falls_back_to_sequential_decoding(fake_faster_whisper, monkeypatch):
+    def broken(self, audio, **kwargs):
+        raise RuntimeError("unsupported")
+
+    monkeypatch.setattr(FakeBatchedPipeline, "transcribe", broken)
+    whisper = LocalWhisper("fake")
+    assert whisper.transcribe(clip(5, 40)) == "patient 5"
+    assert whisper._batched is None
+
+
+def test_inference_worker_runs_one_item_at_a_time():
+    running = []
+
+    def run(item):
+        running.append(item)
+        assert len(running) == 1
+        time.sleep(0.01)
+        running.remove(item)
+        return item * 2
+
+    worker = InferenceWorker("test", run)
+    futures = [worker.submit(index) for index in range(3)]
+    assert [future.result(5) for future in futures] == [0, 2, 4]
+    assert worker.requests == 3
+
+
+def test_local_backend_is_shared_per_model(fake_faster_whisper, monkeypatch):
+    monkeypatch.setattr(local_models, "_models", {})
+    first, second = local_models.local_whisper_backend("fake"), local_models.local_whisper_backend("fake")
+    assert first.name == second.name == "local:fake"
+    assert len(local_models._models) == 1
+    assert first.call(chunk=clip(6, 2)) == "patient 6"
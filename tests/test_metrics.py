@@ -0,0 +1,77 @@
+import logging
+
+import metrics
+from metrics import Counter, Histogram, CallbackMetric
+from stage_graph import Stage, run_stages
+
+
+def test_counter_renders_one_sample_per_label_set():
+    counter = Counter("test_requests_total", "Requests.", ("status",))
+    counter.inc(status="200")
+    counter.inc(2, status="200")
+    counter.inc(status='5"0\\0')
+    assert list(counter.samples()) == [
+        'test_requests_total{status="200"} 3.0',
+        'test_requests_total{status="5\\"0\\\\0"} 1.0',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Durations.", (), (0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value)
+    assert list(histogram.samples()) == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        "test_seconds_sum 5.55",
+        "test_seconds_count 3",
+    ]
+
+
+def test_failing_callback_does_not_break_the_scrape(monkeypatch):
+    def broken():
+        raise RuntimeError("backend gone")
+
+    monkeypatch.setattr(metrics, "_registry", [
+        CallbackMetric("test_broken", "Broken.", broken),
+        CallbackMetric("test_size", "Size.", lambda: [({"tier": "memory"}, 7)]),
+    ])
+    assert metrics.render_metrics() == (
+        "# HELP test_broken Broken.\n# TYPE test_broken gauge\n"
+        '# HELP test_size Size.\n# TYPE test_size gauge\ntest_size{tier="memory"} 7\n'
+    )
+
+
+def test_trace_id_follows_the_request_into_stage_threads():
+    trace_id = metrics.new_trace_id()
+    run = run_stages([
+        Stage("transcribe", metrics.current_trace_id),
+        Stage("encode", metrics.current_trace_id),
+    ])
+    assert run.results == {"transcribe": trace_id, "encode": trace_id}
+
+
+def test_log_records_carry_the_trace_id():
+    trace_id = metrics.new_trace_id()
+    record = metrics._record_factory("voicebot", logging.INFO, __file__, 1, "hello", (), None)
+    assert record.trace_id == trace_id
+
+
+def test_pipeline_runs_are_recorded(fake_providers):
+    import consultation
+
+    consultation.process_inputs(None, None, transcript="Is this acne?")
+    rendered = metrics.render_metrics()
+    assert 'voicebot_stage_duration_seconds_count{pipeline="sync",stage="analyze"}' in rendered
+    assert 'voicebot_request_duration_seconds_count{pipeline="sync"}' in rendered
+
+
+def test_metrics_endpoint_serves_the_registry():
+    from fastapi.testclient import TestClient
+    from app import create_app
+
+    response = TestClient(create_app()).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE voicebot_stage_duration_seconds histogram" in response.text
@@ -0,0 +1,33 @@
+import pytest
+
+import provider_clients
+from provider_clients import get_groq_client, get_elevenlabs_client, pool_stats
+
+
+def test_clients_are_shared_per_api_key(fake_providers):
+    assert get_groq_client() is get_groq_client()
+    assert get_groq_client("other-key") is not get_groq_client()
+    assert get_elevenlabs_client() is get_elevenlabs_client()
+
+
+def test_missing_api_key_raises(monkeypatch):
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    with pytest.raises(ValueError, match="GROQ_API_KEY"):
+        get_groq_client()
+
+
+def test_requests_reuse_pooled_connections(fake_providers):
+    from patient_query import transcribe_audio_bytes
+
+    for _ in range(3):
+        assert transcribe_audio_bytes("whisper-large-v3", ("voice.wav", b"RIFF0000WAVE"))
+    stats = pool_stats()["groq"]
+    assert stats["requests"] == 3
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 2
+
+
+def test_close_clients_forgets_them(fake_providers):
+    client = get_groq_client()
+    provider_clients.close_clients()
+    assert get_groq_client() is not client
@@ -0,0 +1,182 @@
+import time
+import asyncio
+
+import pytest
+
+import provider_router
+from provider_router import Backend, ProviderRouter, AllBackendsFailed
+
+
+@pytest.fixture(autouse=True)
+def fast_router(monkeypatch):
+    monkeypatch.setattr(provider_router, "ROUTER_HEDGE_MIN_MS", 20)
+    monkeypatch.setattr(provider_router, "ROUTER_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(provider_router, "ROUTER_BREAKER_RESET_SECONDS", 0.1)
+    monkeypatch.setattr(provider_router, "ROUTER_PROBE_SECONDS", 0)
+
+
+def sleeper(seconds, value):
+    def call(**kwargs):
+        time.sleep(seconds)
+        return value
+    return call
+
+
+def failing(**kwargs):
+    raise RuntimeError("down")
+
+
+def test_fails_over_to_the_next_backend():
+    router = ProviderRouter("tts", [Backend("a", failing, expected_ms=10), Backend("b", sleeper(0, "b"), expected_ms=20)])
+    assert router.call(text="hi") == "b"
+    assert router.snapshot()["a"]["consecutive_failures"] == 1
+
+
+def test_all_failures_raise_with_every_error():
+    router = ProviderRouter("tts", [Backend("a", failing), Backend("b", failing)])
+    with pytest.raises(AllBackendsFailed) as excinfo:
+        router.call(text="hi")
+    assert set(excinfo.value.errors) == {"a", "b"}
+
+
+def test_slow_backend_is_hedged_and_the_faster_answer_wins():
+    router = ProviderRouter("stt", [Backend("slow", sleeper(0.5, "slow"), expected_ms=10),
+                                    Backend("fast", sleeper(0, "fast"), expected_ms=50)])
+    started = time.perf_counter()
+    assert router.call(chunk=b"") == "fast"
+    assert time.perf_counter() - started < 0.3
+
+
+def test_async_hedge_cancels_the_loser_and_counts_its_latency():
+    cancelled = []
+
+    async def slow(**kwargs):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "slow"
+
+    async def fast(**kwargs):
+        return "fast"
+
+    router = ProviderRouter("stt", [Backend("slow", None, call_async=slow, expected_ms=10),
+                                    Backend("fast", None, call_async=fast, expected_ms=50)])
+
+    async def main():
+        result = await router.call_async(chunk=b"")
+        await asyncio.sleep(0.01)
+        return result
+
+    assert asyncio.run(main()) == "fast"
+    assert cancelled == [1]
+    assert router.snapshot()["slow"]["ewma_ms"] >= 20
+
+
+def test_breaker_opens_then_allows_one_trial_call():
+    calls = {"a": 0}
+
+    def flaky(**kwargs):
+        calls["a"] += 1
+        if calls["a"] <= 2:
+            raise RuntimeError("down")
+        return "a"
+
+    router = ProviderRouter("tts", [Backend("a", flaky, expected_ms=10), Backend("b", sleeper(0.05, "b"), expected_ms=1000)])
+    assert router.call(text="1") == "b"
+    assert router.call(text="2") == "b"
+    assert router.snapshot()["a"]["breaker"] == "open"
+    assert router.call(text="3") == "b"  # Skipped while open
+    assert calls["a"] == 2
+    time.sleep(0.15)
+    assert router.call(text="4") == "a"  # Half-open trial succeeds
+    assert router.snapshot()["a"]["breaker"] == "closed"
+
+
+def test_stream_time_to_first_token_does_not_shorten_hedge_deadlines():
+    def tokens(**kwargs):
+        yield "It "
+        time.sleep(0.2)
+        yield "looks fine."
+
+    backend = Backend("vision", sleeper(0, "x"), stream=tokens, expected_ms=100)
+    router = ProviderRouter("vision", [backend])
+    assert "".join(router.stream(query="q")) == "It looks fine."
+    snapshot = router.snapshot()["vision"]
+    assert snapshot["ttft_ms"] < 50
+    assert snapshot["ewma_ms"] >= 200  # The full stream, comparable with a non-streaming call
+    assert backend.deadline_seconds() >= 0.4
+
+
+def test_stream_fails_over_before_the_first_token():
+    def broken(**kwargs):
+        raise RuntimeError("down")
+        yield
+
+    def working(**kwargs):
+        yield "ok"
+
+    router = ProviderRouter("vision", [Backend("a", failing, stream=broken, expected_ms=10),
+                                       Backend("b", failing, stream=working, expected_ms=20)])
+    assert list(router.stream(query="q")) == ["ok"]
+
+
+def test_errors_after_the_first_token_open_the_breaker():
+    def breaks_mid_stream(**kwargs):
+        yield "It "
+        raise RuntimeError("connection reset")
+
+    router = ProviderRouter("vision", [Backend("a", failing, stream=breaks_mid_stream)])
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            list(router.stream(query="q"))
+    assert router.snapshot()["a"]["breaker"] == "open"
+
+
+def test_abandoned_stream_is_not_a_failure():
+    def endless(**kwargs):
+        while True:
+            yield "token "
+
+    router = ProviderRouter("vision", [Backend("a", failing, stream=endless)])
+    stream = router.stream(query="q")
+    next(stream)
+    stream.close()
+    assert router.snapshot()["a"]["consecutive_failures"] == 0
+
+
+def test_backend_that_lost_the_ranking_is_probed_and_recovers(monkeypatch):
+    monkeypatch.setattr(provider_router, "ROUTER_PROBE_SECONDS", 0.05)
+    probes = []
+
+    def remote(chunk):
+        return "remote"
+
+    router = ProviderRouter("stt", [Backend("remote", remote, expected_ms=5000, probe=lambda: probes.append(1)),
+                                    Backend("local", sleeper(0.01, "local"), expected_ms=100)])
+    assert router.call(chunk=b"") == "local"  # The remote prior is worse
+    time.sleep(0.1)
+    assert router.call(chunk=b"patient audio") == "local"  # Starts a synthetic probe of the remote backend
+    deadline = time.monotonic() + 2
+    while router.snapshot()["remote"]["samples"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert router.call(chunk=b"") == "remote"
+    assert probes == [1]  # The probe never carries the patient's request
+
+
+def test_backends_without_a_probe_are_never_probed(monkeypatch):
+    monkeypatch.setattr(provider_router, "ROUTER_PROBE_SECONDS", 0.01)
+    calls = []
+
+    def slow_model(**kwargs):
+        calls.append(kwargs)
+        return "slow"
+
+    router = ProviderRouter("vision", [Backend("slow", slow_model, expected_ms=5000),
+                                       Backend("fast", sleeper(0, "fast"), expected_ms=100)])
+    for _ in range(3):
+        time.sleep(0.02)
+        assert router.call(query="q") == "fast"
+    time.sleep(0.05)
+    assert calls == []
@@ -0,0 +1,19 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import consultation
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "acne.webp")
+
+
+def test_concurrent_requests_keep_their_own_results_in_memory(fake_providers, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    questions = [f"Question number {index}?" for index in range(6)]
+    with ThreadPoolExecutor(max_workers=len(questions)) as pool:
+        results = list(pool.map(lambda question: consultation.process_inputs(None, IMAGE, transcript=question), questions))
+
+    assert [transcript for transcript, _, _ in results] == questions
+    audio = [voice for _, _, voice in results]
+    assert all(isinstance(voice, bytes) and voice for voice in audio)
+    assert os.listdir(tmp_path) == []  # Nothing is written to shared temporary files
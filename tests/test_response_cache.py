@@ -0,0 +1,97 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from response_cache import ResponseCache, MemoryBackend, SQLiteBackend, normalize_transcript
+
+
+def test_normalize_transcript_ignores_case_spacing_and_punctuation():
+    assert normalize_transcript("  Is this   ACNE? ") == normalize_transcript("is this acne")
+
+
+def test_concurrent_threads_share_one_upstream_call():
+    cache = ResponseCache(backend=MemoryBackend(16), ttl=60, enabled=True)
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "It looks like acne."
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["It looks like acne."] * 5
+    assert calls == [1]
+    counters = cache.counters()
+    assert counters["coalesced"] == 4
+    assert counters["upstream_calls"] == 1
+    assert cache.get_or_compute("k", compute) == "It looks like acne."
+    assert cache.counters()["hits"] == 1
+
+
+def test_concurrent_tasks_share_one_upstream_call():
+    cache = ResponseCache(backend=MemoryBackend(16), ttl=60, enabled=True)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "A mild rash."
+
+    async def main():
+        return await asyncio.gather(*[cache.get_or_compute_async("k", compute) for _ in range(4)])
+
+    assert asyncio.run(main()) == ["A mild rash."] * 4
+    assert calls == [1]
+    assert cache.counters()["coalesced"] == 3
+
+
+def test_failures_and_empty_responses_are_not_cached():
+    cache = ResponseCache(backend=MemoryBackend(16), ttl=60, enabled=True)
+
+    def fail():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", fail)
+    assert cache.get_or_compute("k", lambda: "") == ""
+    assert cache.get_or_compute("k", lambda: "Fine now.") == "Fine now."
+    assert cache.lookup("k") == "Fine now."
+
+
+def test_counters_do_not_touch_the_backend():
+    class CountingBackend(MemoryBackend):
+        lengths = 0
+
+        def __len__(self):
+            CountingBackend.lengths += 1
+            return super().__len__()
+
+    cache = ResponseCache(backend=CountingBackend(16), ttl=60, enabled=True)
+    cache.get_or_compute("k", lambda: "value")
+    cache.counters()
+    assert CountingBackend.lengths == 0
+    assert cache.snapshot()["entries"] == 1
+    assert CountingBackend.lengths == 1
+
+
+def test_sqlite_backend_expires_and_bounds_entries(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "responses.sqlite3"), max_entries=2)
+    backend.set("old", "a", ttl=-1)
+    assert backend.get("old") is None
+    for key in ("a", "b", "c"):
+        backend.set(key, key.upper(), ttl=60)
+        time.sleep(0.01)
+    assert len(backend) == 2
+    assert backend.get("a") is None
+    assert SQLiteBackend(str(tmp_path / "responses.sqlite3"), max_entries=2).get("c") == "C"
@@ -0,0 +1,68 @@
+import time
+import asyncio
+
+import pytest
+
+from scheduler import ProviderScheduler
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("429")
+        self.response = type("Response", (), {"status_code": 429, "headers": {"retry-after": str(retry_after)}})()
+
+
+def test_concurrency_limit_per_provider():
+    scheduler = ProviderScheduler({"slow": {"concurrency": 2, "rpm": 0}, "fast": {"concurrency": 1, "rpm": 0}})
+    peak = {"slow": 0, "fast": 0}
+    active = {"slow": 0, "fast": 0}
+
+    async def call(provider):
+        async def work():
+            active[provider] += 1
+            peak[provider] = max(peak[provider], active[provider])
+            await asyncio.sleep(0.01)
+            active[provider] -= 1
+            return provider
+        return await scheduler.run(provider, work)
+
+    async def main():
+        return await asyncio.gather(*[call("slow") for _ in range(6)], *[call("fast") for _ in range(3)])
+
+    results = asyncio.run(main())
+    assert results.count("slow") == 6 and results.count("fast") == 3
+    assert peak == {"slow": 2, "fast": 1}
+    assert scheduler.snapshot()["slow"]["completed"] == 6
+
+
+def test_rate_limit_spaces_out_calls():
+    scheduler = ProviderScheduler({"p": {"concurrency": 4, "rpm": 600}})  # 10 per second, burst of 10
+
+    async def main():
+        start = time.monotonic()
+        for _ in range(12):
+            async with scheduler.slot("p"):
+                pass
+        return time.monotonic() - start
+
+    assert 0.15 <= asyncio.run(main()) < 1.0
+
+
+def test_429_pauses_the_provider_without_draining_its_bucket():
+    scheduler = ProviderScheduler({"p": {"concurrency": 1, "rpm": 60}})  # One token, refilled every second
+
+    async def main():
+        async def fail():
+            raise RateLimitError(0.2)
+
+        with pytest.raises(RateLimitError):
+            await scheduler.run("p", fail)
+        scheduler._state("p").tokens = 1.0  # As if the pause had been long enough to refill
+        start = time.monotonic()
+        async with scheduler.slot("p"):
+            waited = time.monotonic() - start
+        return waited
+
+    waited = asyncio.run(main())
+    assert 0.15 <= waited < 0.6  # The pause only, not the pause plus a token refill
+    assert scheduler.snapshot()["p"]["rate_limited"] == 1
@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from stage_graph import Stage, run_stages
+
+
+def test_independent_stages_run_concurrently():
+    def slow(value):
+        def fn():
+            time.sleep(0.2)
+            return value
+        return fn
+
+    run = run_stages([
+        Stage("transcribe", slow("text")),
+        Stage("encode", slow("image")),
+        Stage("analyze", lambda transcribe, encode: f"{transcribe}+{encode}", deps=("transcribe", "encode")),
+    ])
+    assert run.results["analyze"] == "text+image"
+    assert run.wall_ms < 350
+    assert run.saved_ms > 100
+    assert run.timings["analyze"]["start_ms"] >= run.timings["encode"]["end_ms"]
+
+
+def test_failed_stage_uses_its_fallback_and_downstream_still_runs():
+    def fail():
+        raise RuntimeError("whisper down")
+
+    run = run_stages([
+        Stage("transcribe", fail, fallback="transcription failed"),
+        Stage("speak", lambda transcribe: transcribe.upper(), deps=("transcribe",)),
+    ])
+    assert run.results["speak"] == "TRANSCRIPTION FAILED"
+    assert isinstance(run.errors["transcribe"], RuntimeError)
+
+
+def test_unknown_dependency_and_cycles_are_rejected():
+    with pytest.raises(ValueError, match="unknown"):
+        run_stages([Stage("a", lambda b: b, deps=("b",))])
+    with pytest.raises(ValueError, match="cycle"):
+        run_stages([Stage("a", lambda b: b, deps=("b",)), Stage("b", lambda a: a, deps=("a",))])
@@ -0,0 +1,50 @@
+import os
+
+import consultation
+from sentence_stream import split_sentences
+
+IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "acne.webp")
+
+
+def test_sentences_are_emitted_as_soon_as_they_end():
+    emitted = []
+
+    def tokens():
+        for token in ["With what I see, ", "you have mild acne. ", "Wash your face twice", " a day. Dr. Smith agrees."]:
+            emitted.append(token)
+            yield token
+
+    sentences = []
+    for sentence in split_sentences(tokens()):
+        sentences.append((sentence, len(emitted)))
+    assert sentences == [
+        ("With what I see, you have mild acne.", 2),
+        ("Wash your face twice a day.", 4),
+        ("Dr. Smith agrees.", 4),
+    ]
+
+
+def test_short_fragments_are_merged():
+    assert list(split_sentences(["Yes. It is acne. "], min_chars=10)) == ["Yes. It is acne."]
+
+
+def test_streaming_consultation_yields_text_then_audio_chunks(fake_providers):
+    updates = list(consultation.process_inputs_streaming(None, IMAGE, transcript="Is this acne?"))
+    transcript, first_response, first_audio = updates[0]
+    assert (transcript, first_response, first_audio) == ("Is this acne?", "", None)
+    chunks = [audio for _, _, audio in updates if audio]
+    assert chunks
+    final_response = updates[-1][1]
+    assert final_response and final_response != consultation.ANALYSIS_ERROR_MESSAGE
+    assert len(chunks) == len(list(split_sentences([final_response + " "])))
+
+
+def test_streaming_consultation_records_one_request_duration(fake_providers):
+    from metrics import request_duration
+
+    def count():
+        return next((state[-1] for key, state in request_duration._values.items() if key == ("streaming",)), 0)
+
+    before = count()
+    list(consultation.process_inputs_streaming(None, IMAGE, transcript="Is this acne?"))
+    assert count() == before + 1
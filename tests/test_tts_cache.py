@@ -0,0 +1,62 @@
+import os
+
+from tts_cache import TTSCache, cache_key
+
+
+def test_lookup_hits_memory_then_disk(tmp_path):
+    cache = TTSCache(directory=str(tmp_path / "tts"), memory_bytes=1024, disk_bytes=1024)
+    calls = []
+    audio = cache.get_or_synthesize("Hello  there", "gtts", "en", None, lambda: calls.append(1) or b"mp3")
+    assert audio == b"mp3"
+    assert cache.get_or_synthesize("Hello there", "gtts", "en", None, lambda: b"other") == b"mp3"
+
+    restarted = TTSCache(directory=str(tmp_path / "tts"), memory_bytes=1024, disk_bytes=1024)
+    assert restarted.lookup("Hello there", "gtts", "en", None) == b"mp3"
+    assert calls == [1]
+    assert cache.snapshot()["memory_hits"] == 1
+    assert restarted.snapshot()["disk_hits"] == 1
+
+
+def test_directory_is_created_on_first_write(tmp_path):
+    directory = tmp_path / "tts"
+    cache = TTSCache(directory=str(directory))
+    assert not directory.exists()
+    assert cache.lookup("Hi", "gtts", "en", None) is None
+    cache.store("Hi", "gtts", "en", None, b"mp3")
+    assert directory.is_dir()
+
+
+def test_disk_tier_evicts_oldest_only_over_limit(tmp_path, monkeypatch):
+    cache = TTSCache(directory=str(tmp_path), memory_bytes=0, disk_bytes=250)
+    scans = []
+    original = cache._disk_entries
+    monkeypatch.setattr(cache, "_disk_entries", lambda: scans.append(1) or original())
+
+    for index in range(2):
+        cache.store(f"text {index}", "gtts", "en", None, b"x" * 100)
+        os.utime(cache._disk_path(cache_key(f"text {index}", "gtts", "en", None)), (index, index))
+    assert len(scans) == 1  # Only the first write counts the directory
+    assert cache._disk_size == 200
+
+    cache.store("text 2", "gtts", "en", None, b"x" * 100)
+    assert len(scans) == 2
+    assert cache._disk_size == 200
+    remaining = sorted(name for name in os.listdir(tmp_path) if name.endswith(".mp3"))
+    assert cache_key("text 0", "gtts", "en", None) + ".mp3" not in remaining
+    assert len(remaining) == 2
+
+
+def test_overwriting_an_entry_does_not_grow_the_total(tmp_path):
+    cache = TTSCache(directory=str(tmp_path), memory_bytes=0, disk_bytes=1000)
+    cache.store("same", "gtts", "en", None, b"x" * 100)
+    cache.store("same", "gtts", "en", None, b"x" * 100)
+    assert cache._disk_size == 100
+
+
+def test_temporary_files_are_unique_per_process(tmp_path, monkeypatch):
+    cache = TTSCache(directory=str(tmp_path))
+    replaced = []
+    real_replace = os.replace
+    monkeypatch.setattr(os, "replace", lambda src, dst: replaced.append(src) or real_replace(src, dst))
+    cache.store("Hi", "gtts", "en", None, b"mp3")
+    assert f".{os.getpid()}." in os.path.basename(replaced[0])
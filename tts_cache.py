@@ -0,0 +1,240 @@
+# Import necessary libraries
+from dotenv import load_dotenv
+load_dotenv()
+
+import os  # For the on-disk cache tier
+import time  # For measuring synthesis latency
+import hashlib  # For content-addressed cache keys
+import tempfile  # For the default cache location
+import threading  # For guarding the in-memory tier
+import unicodedata  # For normalizing text before hashing
+import logging
+from collections import OrderedDict
+
+# Step 1: Cache settings
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "voicebot_tts_cache")
+TTS_CACHE_MEMORY_BYTES = int(os.environ.get("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))  # 32 MB
+TTS_CACHE_DISK_BYTES = int(os.environ.get("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))  # 512 MB
+TTS_CACHE_ENABLED = os.environ.get("TTS_CACHE_ENABLED", "1") != "0"
+
+
+def normalize_text(text):
+    """
+    Normalizes text so trivially different inputs (spacing, Unicode forms) share a cache entry.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text, provider, voice, model):
+    raw = "\x1f".join([normalize_text(text), provider, voice or "", model or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Step 2: Two-tier TTS cache
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio keyed on (normalized text, provider, voice, model).
+    An in-memory LRU tier serves hot phrases; an on-disk tier survives restarts.
+    Both tiers are bounded by size and evict least recently used entries first.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, memory_bytes=TTS_CACHE_MEMORY_BYTES, disk_bytes=TTS_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> audio bytes
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_size = None  # Running total of the on-disk tier; None until the first write scans it
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "saved_seconds": 0.0,  # Estimated synthesis time avoided
+            "saved_characters": 0,  # Characters not billed by the provider
+            "synthesis_seconds": 0.0,  # Time spent on cache misses
+        }
+
+    # In-memory tier
+    def _memory_get(self, key):
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+            return audio
+
+    def _memory_put(self, key, audio):
+        if len(audio) > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= len(self._memory.pop(key))
+            self._memory[key] = audio
+            self._memory_size += len(audio)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    # On-disk tier
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _disk_get(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # Mark as recently used for eviction
+            return audio
+        except FileNotFoundError:
+            return None
+
+    def _disk_put(self, key, audio):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # serve.py workers share the directory
+        with self._disk_lock:
+            if self._disk_size is None:
+                # First write: create the directory and count what earlier runs left in it
+                try:
+                    os.makedirs(self.directory, exist_ok=True)
+                except OSError as e:
+                    logging.warning(f"Could not create TTS cache directory: {e}")
+                    return
+                self._disk_size = sum(size for _, size, _ in self._disk_entries())
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)  # Atomic, so readers never see a partial file
+        except OSError as e:
+            logging.warning(f"Could not write TTS cache entry: {e}")
+            return
+        with self._disk_lock:
+            self._disk_size += len(audio) - replaced
+            over_limit = self._disk_size > self.disk_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _disk_entries(self):
+        entries = []
+        try:
+            scan = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return entries
+        for entry in scan:
+            if entry.name.endswith(".mp3"):
+                try:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def _evict_disk(self):
+        # Only runs once the running total is over the limit. The rescan also corrects the
+        # total for entries written or removed by other worker processes sharing the directory.
+        with self._disk_lock:
+            entries = self._disk_entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+            self._disk_size = total
+
+    # Public API
+    def lookup(self, text, provider, voice, model):
+        """
+        Returns cached audio for the given text and voice settings, or None on a miss.
+        """
+        key = cache_key(text, provider, voice, model)
+
+        audio = self._memory_get(key)
+        tier = "memory_hits"
+        if audio is None:
+            audio = self._disk_get(key)
+            tier = "disk_hits"
+            if audio is not None:
+                self._memory_put(key, audio)
+
+        if audio is not None:
+            with self._lock:
+                self.stats[tier] += 1
+                self.stats["saved_characters"] += len(text)
+                self.stats["saved_seconds"] += self._average_synthesis_seconds()
+        return audio
+
+    def store(self, text, provider, voice, model, audio, synthesis_seconds=0.0):
+        """
+        Adds freshly synthesized audio to both tiers and records the miss.
+        """
+        key = cache_key(text, provider, voice, model)
+        with self._lock:
+            self.stats["misses"] += 1
+            self.stats["synthesis_seconds"] += synthesis_seconds
+        self._memory_put(key, audio)
+        self._disk_put(key, audio)
+
+    def get_or_synthesize(self, text, provider, voice, model, synthesize):
+        """
+        Returns cached audio for the given text and voice settings, synthesizing it on a miss.
+        Args:
+            text (str): The text to convert to speech.
+            provider (str): TTS provider name, e.g. "elevenlabs" or "gtts".
+            voice (str): Voice name (or None if the provider has none).
+            model (str): Model id (or None if the provider has none).
+            synthesize (callable): Produces the audio bytes on a cache miss.
+        Returns:
+            bytes: The audio.
+        """
+        audio = self.lookup(text, provider, voice, model)
+        if audio is not None:
+            return audio
+
+        start = time.perf_counter()
+        audio = synthesize()
+        self.store(text, provider, voice, model, audio, time.perf_counter() - start)
+        return audio
+
+    def _average_synthesis_seconds(self):
+        misses = self.stats["misses"]
+        return self.stats["synthesis_seconds"] / misses if misses else 0.0
+
+    def prewarm(self, messages, provider, voice, model, synthesize_fn):
+        """
+        Synthesizes fixed messages ahead of time so they are served from the cache.
+        Args:
+            messages (list[str]): Texts to synthesize.
+            synthesize_fn (callable): Called as synthesize_fn(text) on a miss.
+        """
+        for message in messages:
+            try:
+                self.get_or_synthesize(message, provider, voice, model, lambda: synthesize_fn(message))
+            except Exception as e:
+                logging.warning(f"Could not prewarm TTS cache for '{message}': {e}")
+
+    def snapshot(self):
+        """
+        Returns hit/miss counters and the estimated latency and cost saved.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_size
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+        stats["synthesis_seconds"] = round(stats["synthesis_seconds"], 3)
+        return stats
+
+
+# Shared cache used by doctor_voice_tts
+tts_cache = TTSCache()